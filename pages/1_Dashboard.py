@@ -90,7 +90,6 @@ add_enhanced_sidebar()
 with st.sidebar:
     st.markdown("---")
     st.subheader("📊 Portfolio Filters")
-    time_period = st.selectbox("Time Period", ["1D", "5D", "1M", "3M", "6M", "1Y", "5Y"])
     view_type = st.selectbox("View Type", ["Holdings", "Performance", "Allocation"])
 
 # Enhanced metrics with animations
@@ -116,39 +115,47 @@ for i, (label, value, delta, color) in enumerate(metrics):
 st.markdown("---")
 
 # Portfolio Performance Chart
-st.subheader("📈 Portfolio Performance")
-
-try:
-    # Get portfolio performance data
-    portfolio_data = get_portfolio_data(st.session_state.username, time_period)
+# Fragments rerun on their own widgets' changes; the rest of the page is left as drawn
+@st.fragment
+def performance_chart(username):
+    st.subheader("📈 Portfolio Performance")
+    
+    # Widgets in a fragment cannot live in the sidebar, so the period filter sits with its chart
+    time_period = st.selectbox("Time Period", ["1D", "5D", "1M", "3M", "6M", "1Y", "5Y"], key="dashboard_time_period")
     
-    if not portfolio_data.empty:
-        fig = go.Figure()
+    try:
+        # Get portfolio performance data
+        portfolio_data = get_portfolio_data(username, time_period)
+    
+        if not portfolio_data.empty:
+            fig = go.Figure()
         
-        fig.add_trace(go.Scatter(
-            x=portfolio_data['Date'],
-            y=portfolio_data['Portfolio_Value'],
-            mode='lines',
-            name='Portfolio Value',
-            line=dict(color='#1f77b4', width=2)
-        ))
+            fig.add_trace(go.Scatter(
+                x=portfolio_data['Date'],
+                y=portfolio_data['Portfolio_Value'],
+                mode='lines',
+                name='Portfolio Value',
+                line=dict(color='#1f77b4', width=2)
+            ))
         
-        fig.update_layout(
-            title="Portfolio Value Over Time",
-            xaxis_title="Date",
-            yaxis_title="Portfolio Value ($)",
-            height=400
-        )
+            fig.update_layout(
+                title="Portfolio Value Over Time",
+                xaxis_title="Date",
+                yaxis_title="Portfolio Value ($)",
+                height=400
+            )
         
-        st.plotly_chart(fig, use_container_width=True)
-    else:
-        st.info("No portfolio data available. Add some holdings to see performance.")
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("No portfolio data available. Add some holdings to see performance.")
 
-except Exception as e:
-    st.error(f"Error loading portfolio data: {str(e)}")
+    except Exception as e:
+        st.error(f"Error loading portfolio data: {str(e)}")
     
-    # Fallback: Show sample data structure
-    st.info("Unable to load real portfolio data. Please check your API connections.")
+        # Fallback: Show sample data structure
+        st.info("Unable to load real portfolio data. Please check your API connections.")
+
+performance_chart(st.session_state.username)
 
 # Holdings Table
 st.subheader("📋 Current Holdings")
@@ -219,32 +226,37 @@ with col2:
 
 # Stock Research Tool
 st.markdown("---")
-st.subheader("🔍 Stock Research Tool")
 
-col1, col2 = st.columns([1, 3])
+@st.fragment
+def stock_research():
+    st.subheader("🔍 Stock Research Tool")
 
-with col1:
-    stock_symbol = st.text_input("Enter Stock Symbol", placeholder="e.g., AAPL")
+    col1, col2 = st.columns([1, 3])
+
+    with col1:
+        stock_symbol = st.text_input("Enter Stock Symbol", placeholder="e.g., AAPL")
     
-    if st.button("Get Stock Data"):
-        if stock_symbol:
-            try:
-                stock_data = get_stock_data(stock_symbol.upper())
-                st.session_state.current_stock = stock_data
-            except Exception as e:
-                st.error(f"Error fetching stock data: {str(e)}")
+        if st.button("Get Stock Data"):
+            if stock_symbol:
+                try:
+                    stock_data = get_stock_data(stock_symbol.upper())
+                    st.session_state.current_stock = stock_data
+                except Exception as e:
+                    st.error(f"Error fetching stock data: {str(e)}")
 
-with col2:
-    if 'current_stock' in st.session_state and st.session_state.current_stock:
-        stock_info = st.session_state.current_stock
+    with col2:
+        if 'current_stock' in st.session_state and st.session_state.current_stock:
+            stock_info = st.session_state.current_stock
         
-        col_a, col_b, col_c = st.columns(3)
+            col_a, col_b, col_c = st.columns(3)
         
-        with col_a:
-            st.metric("Current Price", f"${stock_info.get('current_price', 'N/A')}")
+            with col_a:
+                st.metric("Current Price", f"${stock_info.get('current_price', 'N/A')}")
         
-        with col_b:
-            st.metric("Day Change", f"{stock_info.get('day_change', 'N/A')}%")
+            with col_b:
+                st.metric("Day Change", f"{stock_info.get('day_change', 'N/A')}%")
         
-        with col_c:
-            st.metric("Volume", f"{stock_info.get('volume', 'N/A')}")
+            with col_c:
+                st.metric("Volume", f"{stock_info.get('volume', 'N/A')}")
+
+stock_research()
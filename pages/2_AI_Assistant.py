@@ -1,5 +1,6 @@
+import html
 import streamlit as st
-from utils.ai_assistant import get_ai_response, get_financial_context
+from utils.ai_assistant import stream_ai_response, get_financial_context
 from utils.auth import check_authentication
 import json
 from datetime import datetime
@@ -97,11 +98,52 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize chat history from database
-from utils.ai_assistant import get_chat_history
+from utils.ai_assistant import get_chat_history_page, create_chat_session, list_chat_sessions
 
-if 'chat_history' not in st.session_state:
-    # Load chat history from database
-    st.session_state.chat_history = get_chat_history(st.session_state.username)
+# Messages drawn per rerun; earlier ones are shown, or fetched, a window at a time on demand
+CHAT_WINDOW_MESSAGES = 30
+
+def message_html(message):
+    """HTML for one transcript message, built once and kept on the message"""
+    if 'html' not in message:
+        # Message text is user- and model-supplied, so it is escaped before going into raw HTML;
+        # line breaks become <br> so a blank line cannot end the HTML block early
+        content = html.escape(message['content']).replace("\n", "<br>")
+        if message["role"] == "user":
+            message['html'] = f"""
+            <div class="chat-message user-message">
+                <strong style="color: #667eea;">👤 You:</strong><br>
+                <div style="margin-top: 10px;">{content}</div>
+            </div>
+            """
+        else:
+            message['html'] = f"""
+            <div class="chat-message ai-message">
+                <strong style="color: #4ecdc4;">🤖 AI Assistant:</strong><br>
+                <div style="margin-top: 10px;">{content}</div>
+            </div>
+            """
+    return message['html']
+
+if 'chat_session_id' not in st.session_state:
+    st.session_state.chat_session_id = None
+
+# Transcripts already loaded this visit, per session, so switching back is instant
+if 'chat_threads' not in st.session_state:
+    st.session_state.chat_threads = {}
+
+if st.session_state.chat_session_id not in st.session_state.chat_threads:
+    # Load the latest page of the session's history; older pages are fetched on demand
+    messages, cursor = get_chat_history_page(
+        st.session_state.username,
+        session_id=st.session_state.chat_session_id,
+        limit=CHAT_WINDOW_MESSAGES
+    )
+    st.session_state.chat_threads[st.session_state.chat_session_id] = {
+        'messages': messages,
+        'cursor': cursor,
+        'window': CHAT_WINDOW_MESSAGES
+    }
 
 # Import UI components
 from utils.ui_components import add_enhanced_sidebar, add_page_css
@@ -110,8 +152,36 @@ from utils.ui_components import add_enhanced_sidebar, add_page_css
 add_page_css()
 add_enhanced_sidebar()
 
-# Sidebar with example prompts
+chat_sessions = list_chat_sessions(st.session_state.username)
+session_names = {session['session_id']: session['name'] for session in chat_sessions}
+
+# Sidebar with chat sessions and example prompts
 with st.sidebar:
+    st.markdown("---")
+    st.markdown("""
+    <h3 style="color: #667eea; margin-bottom: 15px;">💬 Conversations</h3>
+    """, unsafe_allow_html=True)
+    
+    session_ids = list(session_names)
+    selected_session = st.selectbox(
+        "Conversation",
+        session_ids,
+        index=session_ids.index(st.session_state.chat_session_id) if st.session_state.chat_session_id in session_ids else 0,
+        format_func=lambda session_id: session_names[session_id],
+        label_visibility="collapsed"
+    )
+    if selected_session != st.session_state.chat_session_id:
+        st.session_state.chat_session_id = selected_session
+        st.rerun()
+    
+    new_session_name = st.text_input("New conversation", placeholder="e.g., Retirement planning", key="new_chat_session_name")
+    if st.button("➕ Start conversation", use_container_width=True) and new_session_name.strip():
+        new_session_id = create_chat_session(st.session_state.username, new_session_name)
+        if new_session_id:
+            st.session_state.chat_threads[new_session_id] = {'messages': [], 'cursor': None, 'window': CHAT_WINDOW_MESSAGES}
+            st.session_state.chat_session_id = new_session_id
+            st.rerun()
+    
     st.markdown("---")
     st.markdown("""
     <h3 style="color: #667eea; margin-bottom: 15px;">💡 Example Questions</h3>
@@ -132,91 +202,155 @@ with st.sidebar:
         if st.button(prompt, use_container_width=True):
             st.session_state.current_prompt = prompt
 
-# Main chat interface
-st.subheader("💬 Chat with your Financial Assistant")
+# Search past conversations
+from utils.ai_assistant import search_chat_history, DEFAULT_SESSION_NAME
 
-# Display chat history
-chat_container = st.container()
+# Each panel is a fragment: its own widgets rerun only that panel, not the page
+@st.fragment
+def search_panel(session_names):
+    with st.expander("🔎 Search past conversations"):
+        search_query = st.text_input(
+            "Search your chat history",
+            placeholder='e.g., Roth IRA, "emergency fund", dividends -tax',
+            key="chat_search_query"
+        )
 
-with chat_container:
-    for i, message in enumerate(st.session_state.chat_history):
-        if message["role"] == "user":
-            st.markdown(f"""
-            <div class="chat-message user-message">
-                <strong style="color: #667eea;">👤 You:</strong><br>
-                <div style="margin-top: 10px;">{message['content']}</div>
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div class="chat-message ai-message">
-                <strong style="color: #4ecdc4;">🤖 AI Assistant:</strong><br>
-                <div style="margin-top: 10px;">{message['content']}</div>
-            </div>
-            """, unsafe_allow_html=True)
+        # Start from the first page whenever the search changes
+        if st.session_state.get('chat_search_last_query') != search_query:
+            st.session_state.chat_search_last_query = search_query
+            st.session_state.chat_search_page = 1
 
-# Chat input
-col1, col2 = st.columns([4, 1])
+        if search_query:
+            search_page = st.session_state.chat_search_page
+            found = search_chat_history(st.session_state.username, search_query, page=search_page)
 
-with col1:
-    user_input = st.text_input(
-        "Ask me anything about your finances...",
-        placeholder="e.g., How is my portfolio performing?",
-        key="chat_input",
-        value=st.session_state.get('current_prompt', '')
-    )
+            if not found['results']:
+                st.info("No messages match your search.")
 
-with col2:
-    send_button = st.button("Send", type="primary")
-
-# Handle user input
-if send_button and user_input:
-    # Add user message to chat history
-    st.session_state.chat_history.append({
-        "role": "user",
-        "content": user_input,
-        "timestamp": datetime.now().isoformat()
-    })
+            for hit in found['results']:
+                speaker = "👤 You" if hit['role'] == "user" else "🤖 AI Assistant"
+                when = hit['timestamp'][:16].replace("T", " ") if hit['timestamp'] else ""
+                conversation = session_names.get(hit['session_id'], DEFAULT_SESSION_NAME)
+                st.markdown(f"**{speaker}** · {conversation} · {when}")
+                st.markdown(hit['snippet'])
+                st.markdown("---")
+
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col1:
+                if search_page > 1 and st.button("← Previous", key="chat_search_prev"):
+                    st.session_state.chat_search_page -= 1
+                    st.rerun(scope="fragment")
+            with col2:
+                st.caption(f"Page {search_page}")
+            with col3:
+                if found['has_more'] and st.button("Next →", key="chat_search_next"):
+                    st.session_state.chat_search_page += 1
+                    st.rerun(scope="fragment")
+
+@st.fragment
+def chat_panel(session_id, session_name):
+    thread = st.session_state.chat_threads[session_id]
     
-    # Show loading spinner
-    with st.spinner("🤖 Thinking..."):
-        try:
-            # Get AI response
-            ai_response = get_ai_response(
-                user_input, 
-                st.session_state.username,
-                st.session_state.chat_history
-            )
-            
-            # Add AI response to chat history
-            st.session_state.chat_history.append({
-                "role": "assistant",
-                "content": ai_response,
-                "timestamp": datetime.now().isoformat()
-            })
-            
-        except Exception as e:
-            st.error(f"Error getting AI response: {str(e)}")
-            st.session_state.chat_history.append({
-                "role": "assistant",
-                "content": "I'm sorry, I encountered an error processing your request. Please try again or contact support if the issue persists.",
-                "timestamp": datetime.now().isoformat()
-            })
+    # Main chat interface
+    st.subheader(f"💬 Chat with your Financial Assistant · {session_name}")
     
-    # Clear the current prompt and rerun
-    if 'current_prompt' in st.session_state:
-        del st.session_state.current_prompt
-    st.rerun()
+    # Display chat history
+    chat_container = st.container()
+
+    with chat_container:
+        # Only the newest window of messages is drawn, so a rerun costs the same however long the chat
+        hidden = len(thread['messages']) - thread['window']
+        if hidden > 0 or thread['cursor']:
+            if st.button("⬆️ Load earlier messages"):
+                if hidden < CHAT_WINDOW_MESSAGES and thread['cursor']:
+                    older, thread['cursor'] = get_chat_history_page(
+                        st.session_state.username,
+                        session_id=session_id,
+                        before=thread['cursor'],
+                        limit=CHAT_WINDOW_MESSAGES
+                    )
+                    thread['messages'] = older + thread['messages']
+                thread['window'] += CHAT_WINDOW_MESSAGES
+                st.rerun(scope="fragment")
+
+        if thread['window'] > CHAT_WINDOW_MESSAGES:
+            if st.button("⬇️ Show recent messages only"):
+                thread['window'] = CHAT_WINDOW_MESSAGES
+                st.rerun(scope="fragment")
+
+        for message in thread['messages'][-thread['window']:]:
+            st.markdown(message_html(message), unsafe_allow_html=True)
+
+    # Chat input
+    col1, col2 = st.columns([4, 1])
+
+    with col1:
+        user_input = st.text_input(
+            "Ask me anything about your finances...",
+            placeholder="e.g., How is my portfolio performing?",
+            key="chat_input",
+            value=st.session_state.get('current_prompt', '')
+        )
 
-# Clear chat history button
-if st.session_state.chat_history:
-    st.markdown("---")
-    col1, col2, col3 = st.columns(3)
-    
     with col2:
-        if st.button("🗑️ Clear Chat History", use_container_width=True):
-            st.session_state.chat_history = []
-            st.rerun()
+        send_button = st.button("Send", type="primary")
+
+    # Handle user input
+    if send_button and user_input:
+        # Add user message to chat history
+        thread['messages'].append({
+            "role": "user",
+            "content": user_input,
+            "timestamp": datetime.now().isoformat()
+        })
+
+        # Stream the answer under the conversation as it is generated
+        with chat_container:
+            st.markdown(message_html(thread['messages'][-1]), unsafe_allow_html=True)
+            st.markdown('<strong style="color: #4ecdc4;">🤖 AI Assistant:</strong>', unsafe_allow_html=True)
+
+            try:
+                ai_response = st.write_stream(
+                    stream_ai_response(user_input, st.session_state.username, session_id)
+                )
+
+                # Add AI response to chat history
+                thread['messages'].append({
+                    "role": "assistant",
+                    "content": ai_response,
+                    "timestamp": datetime.now().isoformat()
+                })
+
+            except Exception as e:
+                st.error(f"Error getting AI response: {str(e)}")
+                thread['messages'].append({
+                    "role": "assistant",
+                    "content": "I'm sorry, I encountered an error processing your request. Please try again or contact support if the issue persists.",
+                    "timestamp": datetime.now().isoformat()
+                })
+
+        # Clear the current prompt and rerun
+        if 'current_prompt' in st.session_state:
+            del st.session_state.current_prompt
+        st.rerun(scope="fragment")
+
+    # Clear chat history button
+    if thread['messages']:
+        st.markdown("---")
+        col1, col2, col3 = st.columns(3)
+
+        with col2:
+            if st.button("🗑️ Clear Chat History", use_container_width=True):
+                thread['messages'] = []
+                thread['cursor'] = None
+                thread['window'] = CHAT_WINDOW_MESSAGES
+                st.rerun(scope="fragment")
+
+search_panel(session_names)
+chat_panel(
+    st.session_state.chat_session_id,
+    session_names.get(st.session_state.chat_session_id, DEFAULT_SESSION_NAME)
+)
 
 # AI Assistant Features
 st.markdown("---")
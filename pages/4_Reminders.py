@@ -1,6 +1,6 @@
 import streamlit as st
 from utils.auth import check_authentication
-from utils.reminders import get_user_reminders, add_reminder, delete_reminder
+from utils.repository import get_user_reminders, add_reminder, delete_reminder, complete_reminder
 from datetime import datetime, timedelta
 import pandas as pd
 
@@ -136,8 +136,9 @@ if user_reminders:
                 
                 with col2:
                     if st.button(f"✅ Complete", key=f"complete_{reminder.get('id', hash(reminder['title']))}"):
-                        # Mark as completed
+                        complete_reminder(st.session_state.username, reminder.get('id', reminder['title']))
                         st.success("Reminder marked as complete!")
+                        st.rerun()
                 
                 with col3:
                     if st.button(f"🗑️ Delete", key=f"delete_{reminder.get('id', hash(reminder['title']))}"):
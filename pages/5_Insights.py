@@ -1,7 +1,8 @@
 import streamlit as st
 from utils.auth import check_authentication
-from utils.ai_assistant import get_ai_insights
-from utils.database import get_user_preferences
+from utils.insights_store import get_insights_for_page
+from utils.ai_assistant import iter_portfolio_analysis
+from utils.repository import get_user_preferences
 import plotly.graph_objects as go
 import plotly.express as px
 import pandas as pd
@@ -25,13 +26,16 @@ except Exception as e:
     st.error(f"Error loading user preferences: {str(e)}")
     user_prefs = {}
 
-# Generate AI insights
-with st.spinner("🧠 Generating personalized insights..."):
-    try:
-        insights = get_ai_insights(st.session_state.username, user_prefs)
-    except Exception as e:
-        st.error(f"Error generating insights: {str(e)}")
-        insights = {}
+# Load precomputed AI insights; stale copies are refreshed in the background
+try:
+    insights, insights_meta = get_insights_for_page(st.session_state.username)
+except Exception as e:
+    st.error(f"Error loading insights: {str(e)}")
+    insights, insights_meta = {}, None
+
+if insights_meta and insights_meta.get('generated_date'):
+    status = "refreshing in the background" if insights_meta['is_stale'] else "up to date"
+    st.caption(f"🕒 Insights generated {insights_meta['generated_date'][:16].replace('T', ' ')} ({status})")
 
 # Key Insights Section
 st.subheader("🎯 Key Insights")
@@ -112,6 +116,43 @@ for rec in recommendations:
             if st.button(f"💬 Ask AI More", key=f"ask_{rec['title']}"):
                 st.info("Navigate to AI Assistant to discuss this recommendation in detail.")
 
+# Full AI analysis on demand: the three model calls run concurrently and each section
+# is filled in as soon as its call finishes
+st.markdown("---")
+st.subheader("🧠 Full AI Portfolio Analysis")
+
+ANALYSIS_SECTIONS = {
+    'insights': "📋 Portfolio Insights",
+    'recommendations': "💼 Investment Recommendations",
+    'risk_analysis': "⚠️ Risk Assessment"
+}
+
+def render_analysis(placeholder, name, result):
+    with placeholder.container():
+        st.markdown(f"#### {ANALYSIS_SECTIONS[name]}")
+        if result is None:
+            st.warning("This part of the analysis took too long. Please try again.")
+        elif name == 'recommendations':
+            for rec in result or []:
+                st.markdown(f"- **{rec.get('symbol', '')}** {rec.get('name', '')}: {rec.get('reason', '')} "
+                            f"(expected return {rec.get('expected_return', 'n/a')}, risk {rec.get('risk_level', 'n/a')})")
+            if not result:
+                st.info("No recommendations available right now.")
+        else:
+            st.json(result)
+
+if st.button("🔍 Run Full Analysis", key="run_portfolio_analysis"):
+    st.session_state.portfolio_analysis = {}
+    placeholders = {name: st.empty() for name in ANALYSIS_SECTIONS}
+    for name, placeholder in placeholders.items():
+        placeholder.info(f"⏳ {ANALYSIS_SECTIONS[name]}...")
+    for name, result in iter_portfolio_analysis(st.session_state.username, user_prefs):
+        st.session_state.portfolio_analysis[name] = result
+        render_analysis(placeholders[name], name, result)
+elif st.session_state.get('portfolio_analysis'):
+    for name, result in st.session_state.portfolio_analysis.items():
+        render_analysis(st.empty(), name, result)
+
 # Market Analysis Section
 st.markdown("---")
 st.subheader("📊 Market Analysis")
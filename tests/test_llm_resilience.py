@@ -0,0 +1,64 @@
+import time
+import pytest
+from utils.llm import LLMTimeoutError
+from utils.llm_resilience import CircuitBreaker, guarded_stream
+
+@pytest.fixture
+def half_open():
+    breaker = CircuitBreaker("test-model", failure_threshold=1, reset_seconds=0.0)
+    breaker.record_failure()
+    return breaker
+
+def words():
+    yield "one "
+    yield "two "
+    yield "three"
+
+def test_abandoned_probe_closes_the_circuit(half_open):
+    reader = guarded_stream(words, breaker=half_open)
+    assert next(reader) == "one "
+    reader.close()
+    assert half_open.state == 'closed'
+    assert half_open.allow()
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = CircuitBreaker("test-model", failure_threshold=1, reset_seconds=60)
+    breaker.record_failure()
+    breaker.reset_seconds = 0.0
+
+    def failing():
+        raise ConnectionError("reset")
+        yield
+
+    with pytest.raises(ConnectionError):
+        list(guarded_stream(failing, breaker=breaker))
+    breaker.reset_seconds = 60
+    assert breaker.is_open
+
+def test_stream_is_bounded_by_the_deadline():
+    def trickle():
+        while True:
+            time.sleep(0.05)
+            yield "more "
+
+    started = time.monotonic()
+    with pytest.raises(LLMTimeoutError):
+        for _ in guarded_stream(trickle, deadline=0.3):
+            pass
+    assert time.monotonic() - started < 1.0
+
+def test_stalled_stream_is_bounded_by_the_deadline():
+    def stalled():
+        yield "first "
+        time.sleep(2)
+        yield "never read"
+
+    reader = guarded_stream(stalled, deadline=0.2)
+    assert next(reader) == "first "
+    started = time.monotonic()
+    with pytest.raises(LLMTimeoutError):
+        next(reader)
+    assert time.monotonic() - started < 1.0
+
+def test_stream_without_deadline_is_passed_through():
+    assert "".join(guarded_stream(words)) == "one two three"
@@ -0,0 +1,105 @@
+import time
+import pytest
+from utils.semantic_cache import (
+    SemanticCache, CALIBRATION_PAIRS, SEMANTIC_CACHE_THRESHOLD, calibrate_threshold, pair_similarity,
+    question_guard
+)
+
+# Held out from calibration: the threshold is fitted on CALIBRATION_PAIRS and checked against these
+HELD_OUT_PAIRS = [
+    ('How diversified is my portfolio?', 'Is my portfolio diversified enough?', True),
+    ('How should I rebalance my portfolio?', 'How do I rebalance my investments?', True),
+    ('What are the risks of my portfolio?', 'What risks does my portfolio have?', True),
+    ('How much should I save for retirement each month?', 'How much do I need to save for retirement each month?', True),
+    ('What is a good emergency fund size?', 'How big should an emergency fund be?', True),
+    ('Suggest some good dividend stocks', 'Can you suggest good dividend stocks?', True),
+    ('How can I reduce taxes on my investments?', 'How do I lower taxes on my investments?', True),
+    ('Is my portfolio too risky for my age?', 'Is my portfolio too risky given my age?', True),
+    ('What is the outlook for tech stocks?', 'What is the market outlook for technology stocks?', True),
+    ('How are my holdings performing?', 'How is my portfolio doing?', True),
+    ('Should I buy gold?', 'Should I sell gold?', False),
+    ('Should I move into bonds?', 'Should I move out of bonds?', False),
+    ('Should I buy AAPL?', 'Should I buy AAPL or MSFT?', False),
+    ('Should I increase my SIP?', 'Should I reduce my SIP?', False),
+    ('Should I hold more cash?', 'Should I hold less cash?', False),
+    ('What are the best dividend stocks?', 'What are the best growth stocks?', False),
+    ('How do I reduce my debt?', 'How do I reduce my spending?', False),
+    ('What is an index fund?', 'What is a bond fund?', False),
+    ('How risky is my portfolio?', 'How diversified is my portfolio?', False),
+    ('Should I invest in real estate?', 'Should I invest in gold?', False),
+    ('What is a Roth IRA?', 'What is a 401k?', False),
+    ('Should I pay off my mortgage early?', 'Should I pay off my credit card early?', False),
+]
+
+def _hit(first, second):
+    score = pair_similarity(first, second)
+    return score is not None and score >= SEMANTIC_CACHE_THRESHOLD
+
+@pytest.fixture
+def cache(monkeypatch):
+    # No database: every context starts empty
+    monkeypatch.setattr(SemanticCache, '_load_recent', lambda self, fingerprint: [])
+    return SemanticCache("get_ai_response")
+
+def test_paraphrase_from_request_hits():
+    assert pair_similarity("Should I rebalance?", "Is my portfolio balanced?") >= SEMANTIC_CACHE_THRESHOLD
+
+@pytest.mark.parametrize("first, second", [
+    ("Should I invest in bonds?", "Should I not invest in bonds?"),
+    ("Should I invest in bonds?", "Shouldn't I invest in bonds?"),
+    ("Can I retire at 30?", "Can I retire at 50?"),
+    ("Should I invest $500 a month?", "Should I invest $5,000 a month?"),
+    ("Should I buy gold?", "Should I sell gold?"),
+    ("Should I move into bonds?", "Should I move out of bonds?"),
+    ("Should I increase my contributions?", "Should I reduce my contributions?"),
+    ("Should I hold more cash?", "Should I hold less cash?"),
+    ("Should I buy AAPL?", "Should I buy AAPL or MSFT?"),
+])
+def test_guarded_words_must_match(first, second):
+    assert question_guard(first) != question_guard(second)
+    assert pair_similarity(first, second) is None
+
+def test_thousands_separators_do_not_change_the_guard():
+    assert question_guard("Is $5,000 enough?") == question_guard("is $5000 enough")
+
+def test_synonymous_actions_share_a_guard():
+    assert question_guard("How can I reduce my risk?") == question_guard("How do I lower my risk?")
+
+def test_abbreviations_are_not_tickers():
+    assert question_guard("What is a Roth IRA?") == question_guard("what is a roth ira")
+
+def test_held_out_distinct_questions_never_hit():
+    for first, second, same in HELD_OUT_PAIRS:
+        if not same:
+            assert not _hit(first, second), (first, second, pair_similarity(first, second))
+
+def test_held_out_paraphrases_mostly_hit():
+    paraphrases = [(first, second) for first, second, same in HELD_OUT_PAIRS if same]
+    hits = sum(_hit(first, second) for first, second in paraphrases)
+    assert hits >= 0.8 * len(paraphrases)
+
+def test_held_out_pairs_are_not_calibration_pairs():
+    calibration = {frozenset((first, second)) for first, second, _ in CALIBRATION_PAIRS}
+    assert not calibration & {frozenset((first, second)) for first, second, _ in HELD_OUT_PAIRS}
+
+def test_configured_threshold_matches_calibration():
+    threshold, errors = calibrate_threshold()
+    assert errors == 0
+    assert abs(threshold - SEMANTIC_CACHE_THRESHOLD) < 0.02
+
+def test_lookup_respects_guard(cache):
+    cache.add("Should I invest in bonds?", "fp", "Yes, some bonds.")
+    assert cache.lookup("Should I invest in bonds", "fp")[0] == "Yes, some bonds."
+    assert cache.lookup("Should I not invest in bonds?", "fp")[0] is None
+
+def test_lookup_is_partitioned_by_fingerprint(cache):
+    cache.add("How is my portfolio performing?", "alice", "Up 4%.")
+    assert cache.lookup("How is my portfolio performing?", "bob")[0] is None
+
+def test_entries_expire(monkeypatch):
+    monkeypatch.setattr(SemanticCache, '_load_recent', lambda self, fingerprint: [])
+    cache = SemanticCache("get_ai_response", ttl_seconds=0.05)
+    cache.add("How is my portfolio performing?", "fp", "Up 4%.")
+    assert cache.lookup("How is my portfolio performing?", "fp")[0] == "Up 4%."
+    time.sleep(0.1)
+    assert cache.lookup("How is my portfolio performing?", "fp")[0] is None
@@ -1,24 +1,161 @@
 import streamlit as st
 import os
 import json
+import time
+import hashlib
+import threading
+import uuid
 from datetime import datetime
-from google import genai
-from google.genai import types
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
-from utils.database_setup import get_database_connection
+from utils.database_setup import get_database_connection, ensure_chat_partitions, month_start
 from utils.auth import get_user_id
+from utils.ai_cache import context_fingerprint, get_cached_response, store_cached_response
+from utils.semantic_cache import get_semantic_cache
+from utils.llm import get_llm_backend, LLMError, LLMUnavailableError
+from utils.llm_resilience import call_with_deadline, guarded_stream, get_breaker, get_latency_tracker
+from utils.llm_router import get_router
+from utils.llm_telemetry import record_llm_call
+from utils.single_flight import SingleFlight
+from utils.ai_tools import ToolSet
+from utils.knowledge_base import retrieve_reference
+from utils.prompt_builder import (
+    build_chat_prompt, format_turns, get_context_cache, has_conversation_history, SUMMARY_TOKEN_BUDGET
+)
 
-# Initialize Gemini client
-# Note that the newest Gemini model series is "gemini-2.5-flash" or "gemini-2.5-pro"
-# do not change this unless explicitly requested by the user
-GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "your-api-key-here")
-client = genai.Client(api_key=GEMINI_API_KEY)
+# Shared pool for running independent Gemini calls concurrently
+AI_WORKER_THREADS = int(os.environ.get("AI_WORKER_THREADS", "12"))
+_ai_executor = ThreadPoolExecutor(max_workers=AI_WORKER_THREADS, thread_name_prefix="ai-call")
+
+# Upper bound on how long a page waits for one model call, in seconds
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "20"))
+LLM_ANALYSIS_DEADLINE_SECONDS = float(os.environ.get("LLM_ANALYSIS_DEADLINE_SECONDS", "45"))
+
+# Upper bound on a whole streamed response; the per-call deadline above bounds each read
+LLM_STREAM_DEADLINE_SECONDS = float(os.environ.get("LLM_STREAM_DEADLINE_SECONDS", "60"))
+
+# Identical prompts in flight at the same time share one upstream request; followers of an
+# abandoned stream fall back to the degraded answer like any other unavailable call
+_single_flight = SingleFlight(abandoned_error=LLMUnavailableError)
+
+def _flight_key(function_name, model, prompt, json_output=False, tools=None):
+    # Tool results are per user, so only that user's requests may share an answer
+    scope = tools.scope if tools is not None else None
+    return (function_name, model, json_output, scope, hashlib.sha256(prompt.encode()).hexdigest())
+
+def _usable(result, json_output):
+    if not result.text:
+        return False
+    if not json_output:
+        return True
+    try:
+        json.loads(result.text)
+        return True
+    except ValueError:
+        return False
+
+def call_llm(function_name, prompt, json_output=False, timeout=None, hedge=False, query=None,
+             username=None, cache_status='bypass', tools=None):
+    """Generate a response within a deadline, coalescing identical concurrent requests.
+
+    The model is chosen by the router (query, when given, is what it classifies).
+    Raises LLMError subclasses when the deadline passes or the model's circuit
+    is open; with hedge, a slow call is raced against a second request. With
+    tools, the model may call them for data before answering; such calls are
+    never hedged, since a hedge would repeat the whole tool loop. Every call
+    is recorded in the LLM telemetry.
+    """
+    deadline = timeout or LLM_DEADLINE_SECONDS
+    router = get_router()
+    model, reason = router.route(function_name, prompt, query, deadline)
+    upstream = []
+
+    def generate():
+        upstream.append(True)
+        return call_with_deadline(
+            lambda remaining: get_llm_backend().generate(model, prompt, json_output=json_output, timeout=remaining,
+                                                         tools=tools),
+            deadline,
+            breaker=get_breaker(model),
+            latencies=get_latency_tracker(function_name, model),
+            hedge=hedge and tools is None
+        )
+
+    started = time.perf_counter()
+    result = None
+    error_class = None
+    try:
+        with router.track(model):
+            result = _single_flight.do(_flight_key(function_name, model, prompt, json_output, tools), generate, deadline)
+        return result
+    except Exception as e:
+        error_class = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        router.record(function_name, model, reason, elapsed, result is not None and _usable(result, json_output))
+        # Callers that shared another caller's request add no upstream tokens
+        shared = result is not None and not upstream
+        record_llm_call(
+            function_name, model=model, username=username, route_reason=reason,
+            cache_status='coalesced' if shared else cache_status,
+            prompt_tokens=None if shared or result is None else result.prompt_tokens,
+            response_tokens=None if shared or result is None else result.response_tokens,
+            # Nothing reaches the caller before the whole response, so there is no first token to time
+            ttft_seconds=None,
+            latency_seconds=elapsed, error_class=error_class
+        )
+
+def stream_llm(function_name, prompt, timeout=None, query=None, username=None, cache_status='bypass',
+               tools=None):
+    """Stream a response; concurrent identical requests follow the same upstream stream"""
+    deadline = timeout or LLM_DEADLINE_SECONDS
+    router = get_router()
+    model, reason = router.route(function_name, prompt, query, deadline)
+    upstream = []
+
+    def stream():
+        upstream.append(True)
+        return guarded_stream(
+            lambda: get_llm_backend().stream(model, prompt, timeout=deadline, tools=tools),
+            breaker=get_breaker(model),
+            deadline=max(deadline, LLM_STREAM_DEADLINE_SECONDS)
+        )
+
+    started = time.perf_counter()
+    first_token = None
+    prompt_tokens = response_tokens = None
+    error_class = None
+    try:
+        with router.track(model):
+            for chunk in _single_flight.stream(_flight_key(function_name, model, prompt, tools=tools), stream, deadline):
+                if chunk.text and first_token is None:
+                    first_token = time.perf_counter() - started
+                # Usage metadata arrives with the final chunks
+                prompt_tokens = chunk.prompt_tokens or prompt_tokens
+                response_tokens = chunk.response_tokens or response_tokens
+                yield chunk
+    except Exception as e:
+        error_class = type(e).__name__
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        router.record(function_name, model, reason, elapsed, first_token is not None and error_class is None)
+        shared = not upstream
+        record_llm_call(
+            function_name, model=model, username=username, route_reason=reason,
+            cache_status='coalesced' if shared else cache_status,
+            prompt_tokens=None if shared else prompt_tokens,
+            response_tokens=None if shared else response_tokens,
+            ttft_seconds=first_token, latency_seconds=elapsed, error_class=error_class
+        )
 
 def get_financial_context(username):
     """Get user's financial context for AI responses"""
     try:
-        from utils.user_preferences import get_user_preferences
+        from utils.repository import get_user_preferences
         
         # Get user preferences from database
         preferences = get_user_preferences(username)
@@ -47,6 +184,9 @@ def get_financial_context(username):
         st.error(f"Error getting financial context: {str(e)}")
         return {}
 
+# Month whose chat partitions this process has already made sure exist
+_chat_partitions_month = None
+
 def save_chat_message(username, role, content, session_id=None):
     """Save chat message to database"""
     user_id = get_user_id(username)
@@ -57,12 +197,19 @@ def save_chat_message(username, role, content, session_id=None):
     if not engine:
         return False
     
+    global _chat_partitions_month
     try:
         with engine.connect() as conn:
-            conn.execute(
+            # A long-running process must not outlive its last monthly partition
+            if _chat_partitions_month != month_start(datetime.now()):
+                ensure_chat_partitions(conn)
+                _chat_partitions_month = month_start(datetime.now())
+            
+            result = conn.execute(
                 text("""
                     INSERT INTO ai_chat_history (user_id, message_role, message_content, session_id)
                     VALUES (:user_id, :role, :content, :session_id)
+                    RETURNING id
                 """),
                 {
                     "user_id": user_id,
@@ -71,136 +218,415 @@ def save_chat_message(username, role, content, session_id=None):
                     "session_id": session_id
                 }
             )
+            message_id = result.scalar()
+            if session_id:
+                conn.execute(
+                    text("""
+                        UPDATE ai_chat_sessions SET last_active = CURRENT_TIMESTAMP
+                        WHERE user_id = :user_id AND session_id = :session_id
+                    """),
+                    {"user_id": user_id, "session_id": session_id}
+                )
             conn.commit()
+            
+            # Keep the conversation's cached prompt context current without reloading it
+            get_context_cache().append(user_id, session_id, {'id': message_id, 'role': role, 'content': content})
             return True
     
     except SQLAlchemyError as e:
         st.error(f"Error saving chat message: {str(e)}")
         return False
 
-def get_chat_history(username, limit=20):
-    """Get chat history from database"""
+DEFAULT_SESSION_NAME = "General"
+
+def create_chat_session(username, name):
+    """Start a named chat session; returns its session_id, or None on failure"""
     user_id = get_user_id(username)
     if not user_id:
-        return []
+        return None
     
     engine = get_database_connection()
     if not engine:
-        return []
+        return None
+    
+    session_id = uuid.uuid4().hex[:16]
+    try:
+        with engine.connect() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO ai_chat_sessions (user_id, session_id, name)
+                    VALUES (:user_id, :session_id, :name)
+                """),
+                {"user_id": user_id, "session_id": session_id, "name": (name or "").strip()[:100] or "New chat"}
+            )
+            conn.commit()
+            return session_id
+    
+    except SQLAlchemyError as e:
+        st.error(f"Error creating chat session: {str(e)}")
+        return None
+
+def list_chat_sessions(username):
+    """List a user's chat sessions, the default thread first, then most recently active.
+
+    Each session is {'session_id', 'name', 'last_active'}; the default thread
+    (messages saved without a session) has session_id None.
+    """
+    sessions = [{'session_id': None, 'name': DEFAULT_SESSION_NAME, 'last_active': None}]
+    user_id = get_user_id(username)
+    if not user_id:
+        return sessions
+    
+    engine = get_database_connection()
+    if not engine:
+        return sessions
     
     try:
         with engine.connect() as conn:
             result = conn.execute(
                 text("""
-                    SELECT message_role, message_content, timestamp
-                    FROM ai_chat_history 
+                    SELECT session_id, name, last_active
+                    FROM ai_chat_sessions
                     WHERE user_id = :user_id
-                    ORDER BY timestamp DESC
-                    LIMIT :limit
+                    ORDER BY last_active DESC
                 """),
-                {"user_id": user_id, "limit": limit}
+                {"user_id": user_id}
             )
-            messages = result.fetchall()
-            
-            # Reverse to get chronological order
-            chat_history = []
-            for msg in reversed(messages):
-                chat_history.append({
-                    'role': msg[0],
-                    'content': msg[1],
-                    'timestamp': msg[2].isoformat() if msg[2] else None
+            for row in result.fetchall():
+                sessions.append({
+                    'session_id': row[0],
+                    'name': row[1],
+                    'last_active': row[2].isoformat() if row[2] else None
                 })
-            
-            return chat_history
+        return sessions
+    
+    except SQLAlchemyError as e:
+        st.error(f"Error listing chat sessions: {str(e)}")
+        return sessions
+
+def get_chat_history_page(username, session_id=None, before=None, limit=20):
+    """Get one page of chat history, newest page first, in chronological order.
+
+    Pages are keyset-paginated on (timestamp, id): pass the returned cursor as
+    ``before`` to load the next older page. The cursor is None once the oldest
+    message has been returned. Messages without a session are selected when
+    session_id is None.
+    """
+    user_id = get_user_id(username)
+    if not user_id:
+        return [], None
+    
+    engine = get_database_connection()
+    if not engine:
+        return [], None
+    
+    session_clause = "session_id = :session_id" if session_id else "session_id IS NULL"
+    before_clause = "AND (timestamp, id) < (:before_timestamp, :before_id)" if before else ""
+    params = {"user_id": user_id, "session_id": session_id, "limit": limit + 1}
+    if before:
+        params["before_timestamp"], params["before_id"] = before
+    
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(
+                text(f"""
+                    SELECT id, message_role, message_content, timestamp
+                    FROM ai_chat_history
+                    WHERE user_id = :user_id
+                    AND {session_clause}
+                    {before_clause}
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT :limit
+                """),
+                params
+            )
+            rows = result.fetchall()
+        
+        # The extra row only tells us whether an older page exists
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        cursor = (rows[-1][3], rows[-1][0]) if has_more else None
+        
+        # Reverse to get chronological order
+        chat_history = []
+        for msg in reversed(rows):
+            chat_history.append({
+                'id': msg[0],
+                'role': msg[1],
+                'content': msg[2],
+                'timestamp': msg[3].isoformat() if msg[3] else None
+            })
+        
+        return chat_history, cursor
     
     except SQLAlchemyError as e:
         st.error(f"Error getting chat history: {str(e)}")
-        return []
+        return [], None
+
+def get_chat_history(username, limit=20, session_id=None):
+    """Get the most recent chat messages from database"""
+    chat_history, _ = get_chat_history_page(username, session_id=session_id, limit=limit)
+    return chat_history
+
+def search_chat_history(username, query, session_id=None, page=1, page_size=10):
+    """Full-text search over a user's chat messages, best matches first.
+
+    Accepts web-search syntax ("quoted phrases", or, -excluded). Matching terms
+    are wrapped in ** in each snippet. Searches every session unless session_id
+    is given. Returns {'results', 'page', 'has_more'}.
+    """
+    empty = {'results': [], 'page': page, 'has_more': False}
+    user_id = get_user_id(username)
+    if not user_id or not (query or "").strip():
+        return empty
+
+    engine = get_database_connection()
+    if not engine:
+        return empty
+
+    session_clause = "AND session_id = :session_id" if session_id else ""
 
-def get_ai_response(user_query, username, chat_history=None):
-    """Get AI response to user query"""
     try:
-        # Save user message to database
-        save_chat_message(username, "user", user_query)
-        
-        # Get user's financial context
-        context = get_financial_context(username)
-        
-        # Get recent chat history if not provided
-        if chat_history is None:
-            chat_history = get_chat_history(username, limit=10)
-        
-        # Prepare system message with context
-        system_message = f"""
-        You are a knowledgeable financial advisor assistant. You have access to the user's financial information:
-        
-        Portfolio Value: ${context.get('portfolio_value', 0):,}
-        Risk Tolerance: {context.get('risk_tolerance', 'Not specified')}
-        Investment Goals: {', '.join(context.get('investment_goals', []))}
-        Monthly Investment: ${context.get('monthly_investment', 0):,}
-        Age: {context.get('age', 'Not specified')}
-        Investment Timeline: {context.get('investment_timeline', 'Not specified')}
-        
-        Current Holdings:
-        """
-        
-        for holding in context.get('holdings', []):
-            system_message += f"- {holding['symbol']}: {holding['shares']} shares, ${holding['value']:,.2f}\n"
-        
-        system_message += """
-        
+        with engine.connect() as conn:
+            # Headlines are costly, so they are built only for the rows on this page
+            result = conn.execute(
+                text(f"""
+                    SELECT id, message_role, timestamp, session_id, rank,
+                           ts_headline('english', message_content, query,
+                                       'StartSel=**, StopSel=**, MaxFragments=2, MaxWords=30, MinWords=10')
+                    FROM (
+                        SELECT id, message_role, message_content, timestamp, session_id, query,
+                               ts_rank_cd(message_tsv, query) AS rank
+                        FROM ai_chat_history, websearch_to_tsquery('english', :query) AS query
+                        WHERE user_id = :user_id
+                        AND message_tsv @@ query
+                        {session_clause}
+                        ORDER BY rank DESC, timestamp DESC
+                        LIMIT :limit OFFSET :offset
+                    ) ranked
+                    ORDER BY rank DESC, timestamp DESC
+                """),
+                {
+                    "user_id": user_id,
+                    "query": query,
+                    "session_id": session_id,
+                    "limit": page_size + 1,
+                    "offset": (page - 1) * page_size
+                }
+            )
+            rows = result.fetchall()
+
+        results = []
+        for row in rows[:page_size]:
+            results.append({
+                'id': row[0],
+                'role': row[1],
+                'timestamp': row[2].isoformat() if row[2] else None,
+                'session_id': row[3],
+                'rank': float(row[4]),
+                'snippet': row[5]
+            })
+
+        return {'results': results, 'page': page, 'has_more': len(rows) > page_size}
+
+    except SQLAlchemyError as e:
+        st.error(f"Error searching chat history: {str(e)}")
+        return empty
+
+FALLBACK_RESPONSE = "I apologize, but I'm having trouble processing your request right now. Please try again later or contact support if the issue persists."
+
+def build_system_message(context):
+    """Build the advisor system message; account data is fetched through tools on demand"""
+    return f"""
+        You are a knowledgeable financial advisor assistant. The user's risk tolerance is
+        {context.get('risk_tolerance', 'Not specified')}. Use the available tools to look up their
+        portfolio, individual holdings, risk metrics, investor profile and upcoming reminders
+        when a question depends on them; do not guess figures you have not looked up.
+
         Please provide helpful, personalized financial advice based on this information. 
         Keep responses conversational but informative. Always remind users that this is for 
         informational purposes only and they should consult with a qualified financial advisor 
         for important decisions.
         """
+
+def find_cached_response(user_query, fingerprint):
+    """Look up an answer to the same, or a near-identical, question for this context.
+
+    Returns (answer, cache_status) with status 'exact', 'semantic' or 'miss'.
+    """
+    cached_response = get_cached_response("get_ai_response", user_query, fingerprint)
+    if cached_response:
+        return cached_response, 'exact'
+    # Same question asked in different words
+    cached_response, _ = get_semantic_cache("get_ai_response").lookup(user_query, fingerprint)
+    return cached_response, ('semantic' if cached_response else 'miss')
+
+def remember_response(user_query, fingerprint, ai_response, generation_seconds):
+    """Add a freshly generated answer to the exact and semantic caches"""
+    store_cached_response("get_ai_response", user_query, fingerprint, ai_response, generation_seconds)
+    get_semantic_cache("get_ai_response").add(user_query, fingerprint, ai_response)
+
+# While the model is unavailable, answers to loosely similar questions are better than none
+DEGRADED_SIMILARITY_THRESHOLD = 0.6
+
+def degraded_response(user_query, fingerprint):
+    """Best answer available without the model: a past answer to a similar question"""
+    answer, _ = get_semantic_cache("get_ai_response").lookup(
+        user_query, fingerprint, threshold=DEGRADED_SIMILARITY_THRESHOLD
+    )
+    if answer:
+        return ("⚠️ The AI service is responding slowly right now, so here is an earlier answer "
+                f"to a similar question:\n\n{answer}")
+    return FALLBACK_RESPONSE
+
+def summarize_conversation(previous_summary, messages):
+    """Fold older chat turns into the running conversation summary"""
+    prompt = f"""
+    Update the summary of a conversation between a user and their financial advisor assistant.
+    Keep the facts, figures, decisions and open questions the assistant needs to continue the
+    conversation. Write at most {SUMMARY_TOKEN_BUDGET * 3 // 4} words of plain prose.
+    
+    Current summary:
+    {previous_summary or "(none)"}
+    
+    New messages:
+    {format_turns(messages)}
+    """
+    
+    return call_llm("summarize_conversation", prompt).text.strip()
+
+def get_ai_response(user_query, username, session_id=None):
+    """Get AI response to user query"""
+    try:
+        # Save user message to database
+        save_chat_message(username, "user", user_query, session_id)
         
-        # Prepare messages
-        messages = [
-            {"role": "system", "content": system_message},
-            {"role": "user", "content": user_query}
-        ]
-        
-        # Add recent chat history for context
-        if chat_history:
-            # Add last few messages for context (limit to avoid token limits)
-            recent_history = chat_history[-6:]  # Last 6 messages
-            for msg in recent_history[:-1]:  # Exclude the current message
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
+        # Get user's financial context
+        context = get_financial_context(username)
         
-        # Get response from Gemini
-        # Convert messages to Gemini format
-        gemini_messages = []
-        for msg in messages:
-            if msg["role"] == "user":
-                gemini_messages.append(types.Content(role="user", parts=[types.Part(text=msg["content"])]))
-            elif msg["role"] == "system":
-                # System message becomes part of the user message or instruction
-                continue
-        
-        # Combine system message with user query
-        combined_prompt = f"{system_message}\n\nUser Question: {user_query}"
-        
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=combined_prompt
+        # Identical question against an identical profile: reuse the stored answer.
+        # Only answers that called no tools are cached, so the key is shared across users
+        tools = ToolSet(username, context)
+        fingerprint = context_fingerprint(context)
+        # Follow-ups ("tell me more", "why?") depend on the conversation, so only opening questions are cached
+        cacheable = not has_conversation_history(username, user_query, session_id)
+        lookup_started = time.perf_counter()
+        cached_response, cache_status = (
+            find_cached_response(user_query, fingerprint) if cacheable else (None, 'bypass')
         )
-        
-        ai_response = response.text or "I apologize, but I'm having trouble processing your request right now."
+        if cached_response:
+            record_llm_call("get_ai_response", username=username, cache_status=cache_status,
+                            latency_seconds=time.perf_counter() - lookup_started)
+            save_chat_message(username, "assistant", cached_response, session_id)
+            return cached_response
+        
+        # Recent turns within the token budget, older ones as a rolling summary, plus matching reference passages
+        prompt = build_chat_prompt(username, build_system_message(context), user_query,
+                                   session_id=session_id, summarize=summarize_conversation,
+                                   reference=retrieve_reference(user_query))
+        
+        started = time.perf_counter()
+        try:
+            response = call_llm("get_ai_response", prompt, hedge=True, query=user_query,
+                                username=username, cache_status=cache_status,
+                                tools=tools)
+        except (LLMError, FuturesTimeoutError):
+            # Upstream too slow or unhealthy: answer from what we already have
+            ai_response = degraded_response(user_query, fingerprint)
+            save_chat_message(username, "assistant", ai_response, session_id)
+            return ai_response
+        generation_seconds = time.perf_counter() - started
+        
+        if response.text:
+            ai_response = response.text
+            # Tool results (reminders, say) are this user's and may change before the TTL is up
+            if cacheable and not response.tool_calls:
+                remember_response(user_query, fingerprint, ai_response, generation_seconds)
+        else:
+            ai_response = "I apologize, but I'm having trouble processing your request right now."
         
         # Save AI response to database
-        save_chat_message(username, "assistant", ai_response)
+        save_chat_message(username, "assistant", ai_response, session_id)
         
         return ai_response
     
     except Exception as e:
         st.error(f"Error getting AI response: {str(e)}")
-        return "I apologize, but I'm having trouble processing your request right now. Please try again later or contact support if the issue persists."
+        return FALLBACK_RESPONSE
+
+def stream_ai_response(user_query, username, session_id=None):
+    """Stream the AI response to a user query as text chunks.
+
+    The assistant message is saved (and cached) only once the stream has
+    finished, so an abandoned stream never leaves a partial answer in history.
+    """
+    chunks = []
+    try:
+        save_chat_message(username, "user", user_query, session_id)
+        
+        context = get_financial_context(username)
+        tools = ToolSet(username, context)
+        fingerprint = context_fingerprint(context)
+        # Follow-ups ("tell me more", "why?") depend on the conversation, so only opening questions are cached
+        cacheable = not has_conversation_history(username, user_query, session_id)
+        lookup_started = time.perf_counter()
+        cached_response, cache_status = (
+            find_cached_response(user_query, fingerprint) if cacheable else (None, 'bypass')
+        )
+        if cached_response:
+            record_llm_call("get_ai_response", username=username, cache_status=cache_status,
+                            latency_seconds=time.perf_counter() - lookup_started)
+            save_chat_message(username, "assistant", cached_response, session_id)
+            yield cached_response
+            return
+        
+        prompt = build_chat_prompt(username, build_system_message(context), user_query,
+                                   session_id=session_id, summarize=summarize_conversation,
+                                   reference=retrieve_reference(user_query))
+        
+        started = time.perf_counter()
+        used_tools = False
+        for chunk in stream_llm("get_ai_response", prompt, query=user_query,
+                                username=username, cache_status=cache_status,
+                                tools=tools):
+            used_tools = used_tools or bool(chunk.tool_calls)
+            if chunk.text:
+                chunks.append(chunk.text)
+                yield chunk.text
+        generation_seconds = time.perf_counter() - started
+    
+    except (LLMError, FuturesTimeoutError):
+        # Upstream too slow or unhealthy; a half-streamed answer is left as it is
+        if not chunks:
+            ai_response = degraded_response(user_query, fingerprint)
+            save_chat_message(username, "assistant", ai_response, session_id)
+            yield ai_response
+        return
+    
+    except Exception as e:
+        st.error(f"Error getting AI response: {str(e)}")
+        if not chunks:
+            yield FALLBACK_RESPONSE
+        return
+    
+    ai_response = "".join(chunks)
+    if ai_response:
+        # Tool results (reminders, say) are this user's and may change before the TTL is up
+        if cacheable and not used_tools:
+            remember_response(user_query, fingerprint, ai_response, generation_seconds)
+    else:
+        ai_response = "I apologize, but I'm having trouble processing your request right now."
+        yield ai_response
+    save_chat_message(username, "assistant", ai_response, session_id)
 
-def get_ai_insights(username, user_preferences):
+INSIGHTS_FALLBACK = {
+    "portfolio_health": "Unable to generate insights at this time.",
+    "risk_assessment": "Please try again later.",
+    "recommendations": [],
+    "opportunities": []
+}
+
+def get_ai_insights(username, user_preferences, timeout=None):
     """Generate AI-powered financial insights"""
     try:
         context = get_financial_context(username)
@@ -232,12 +658,12 @@ def get_ai_insights(username, user_preferences):
         Format as JSON with categories: portfolio_health, risk_assessment, recommendations, opportunities
         """
         
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=f"You are a financial advisor providing portfolio insights. {insights_prompt}",
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json"
-            )
+        response = call_llm(
+            "get_ai_insights",
+            f"You are a financial advisor providing portfolio insights. {insights_prompt}",
+            json_output=True,
+            timeout=timeout or LLM_ANALYSIS_DEADLINE_SECONDS,
+            username=username
         )
         
         insights = json.loads(response.text)
@@ -245,14 +671,9 @@ def get_ai_insights(username, user_preferences):
     
     except Exception as e:
         st.error(f"Error generating AI insights: {str(e)}")
-        return {
-            "portfolio_health": "Unable to generate insights at this time.",
-            "risk_assessment": "Please try again later.",
-            "recommendations": [],
-            "opportunities": []
-        }
+        return dict(INSIGHTS_FALLBACK)
 
-def get_investment_recommendations(risk_tolerance, investment_goals, current_holdings):
+def get_investment_recommendations(risk_tolerance, investment_goals, current_holdings, timeout=None, username=None):
     """Get AI-powered investment recommendations"""
     try:
         prompt = f"""
@@ -266,12 +687,12 @@ def get_investment_recommendations(risk_tolerance, investment_goals, current_hol
         Format as JSON with: symbol, name, reason, expected_return, risk_level
         """
         
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=f"You are a financial advisor providing investment recommendations. {prompt}",
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json"
-            )
+        response = call_llm(
+            "get_investment_recommendations",
+            f"You are a financial advisor providing investment recommendations. {prompt}",
+            json_output=True,
+            timeout=timeout or LLM_ANALYSIS_DEADLINE_SECONDS,
+            username=username
         )
         
         recommendations = json.loads(response.text)
@@ -281,7 +702,7 @@ def get_investment_recommendations(risk_tolerance, investment_goals, current_hol
         st.error(f"Error getting investment recommendations: {str(e)}")
         return []
 
-def analyze_portfolio_risk(holdings, user_preferences):
+def analyze_portfolio_risk(holdings, user_preferences, timeout=None, username=None):
     """Analyze portfolio risk using AI"""
     try:
         holdings_summary = []
@@ -305,12 +726,12 @@ def analyze_portfolio_risk(holdings, user_preferences):
         Format as JSON.
         """
         
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=f"You are a risk analysis expert. {prompt}",
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json"
-            )
+        response = call_llm(
+            "analyze_portfolio_risk",
+            f"You are a risk analysis expert. {prompt}",
+            json_output=True,
+            timeout=timeout or LLM_ANALYSIS_DEADLINE_SECONDS,
+            username=username
         )
         
         risk_analysis = json.loads(response.text)
@@ -324,3 +745,65 @@ def analyze_portfolio_risk(holdings, user_preferences):
             "diversification_score": "Unable to calculate",
             "recommendations": []
         }
+
+_MISSING = object()
+
+def _run_with_context(ctx, func, *args, **kwargs):
+    # Let st.error etc. inside the AI functions reach the calling session
+    thread = threading.current_thread()
+    before = dict(vars(thread))
+    if ctx is not None:
+        add_script_run_ctx(thread, ctx)
+    attached = {name for name, value in vars(thread).items() if before.get(name, _MISSING) is not value}
+    try:
+        return func(*args, **kwargs)
+    finally:
+        # Pooled threads go on to run other sessions' tasks, so the thread gets back what it had
+        for name in attached:
+            if name in before:
+                setattr(thread, name, before[name])
+            else:
+                delattr(thread, name)
+
+def iter_portfolio_analysis(username, user_preferences, deadline=60, call_timeout=45):
+    """Run insights, recommendations and risk analysis concurrently.
+
+    Yields (name, result) pairs in completion order. Each call is limited to
+    call_timeout seconds and the whole batch to deadline seconds; calls still
+    running at the deadline are yielded as (name, None).
+    """
+    context = get_financial_context(username)
+    holdings = context.get('holdings', [])
+    call_timeout = min(call_timeout, deadline)
+    ctx = get_script_run_ctx()
+    
+    calls = {
+        'insights': (get_ai_insights, (username, user_preferences), {}),
+        'recommendations': (get_investment_recommendations, (
+            user_preferences.get('risk_tolerance', context.get('risk_tolerance', 'Moderate')),
+            user_preferences.get('investment_goals', context.get('investment_goals', [])),
+            holdings
+        ), {'username': username}),
+        'risk_analysis': (analyze_portfolio_risk, (holdings, user_preferences), {'username': username})
+    }
+    
+    futures = {
+        _ai_executor.submit(_run_with_context, ctx, func, *args, timeout=call_timeout, **kwargs): name
+        for name, (func, args, kwargs) in calls.items()
+    }
+    
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            yield futures[future], future.result()
+    except FuturesTimeoutError:
+        for future, name in futures.items():
+            if not future.done():
+                future.cancel()
+                yield name, None
+
+def get_portfolio_analysis(username, user_preferences, deadline=60, call_timeout=45):
+    """Get insights, recommendations and risk analysis in roughly the time of the slowest call"""
+    results = {'insights': None, 'recommendations': None, 'risk_analysis': None}
+    for name, result in iter_portfolio_analysis(username, user_preferences, deadline, call_timeout):
+        results[name] = result
+    return results
@@ -0,0 +1,239 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from utils.database_setup import get_database_connection
+
+# Cached answers expire after this many seconds
+AI_CACHE_TTL_SECONDS = int(os.environ.get('AI_CACHE_TTL_SECONDS', str(24 * 3600)))
+
+# Least recently used entries beyond this count are evicted
+AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES', '50000'))
+
+# Run eviction once every this many inserts instead of on every write
+EVICTION_INTERVAL = 100
+
+# Hit and miss counts are summed in memory and written to ai_cache_stats this often
+AI_CACHE_STATS_FLUSH_SECONDS = float(os.environ.get('AI_CACHE_STATS_FLUSH_SECONDS', '10'))
+
+logger = logging.getLogger(__name__)
+
+_inserts_since_eviction = 0
+_eviction_lock = threading.Lock()
+
+def normalize_query(query):
+    """Normalize a question so trivial variations share a cache entry"""
+    query = re.sub(r"\s+", " ", (query or "").strip().lower())
+    return query.rstrip(" ?!.")
+
+def context_fingerprint(context):
+    """Stable hash of the financial context a response was generated from"""
+    payload = json.dumps(context or {}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def cache_key(function_name, query, fingerprint):
+    """Key for one (function, normalized question, context) combination"""
+    raw = f"{function_name}\x00{normalize_query(query)}\x00{fingerprint}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+class CacheStats:
+    """Per-function hit and miss counters, added to ai_cache_stats in one upsert per flush"""
+
+    def __init__(self, flush_seconds=AI_CACHE_STATS_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def record(self, function_name, hit, seconds_saved=0.0):
+        """Count one lookup; the database write happens on a background thread"""
+        with self._lock:
+            counts = self._pending.setdefault(function_name, [0, 0, 0.0])
+            counts[0 if hit else 1] += 1
+            counts[2] += seconds_saved
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="ai-cache-stats", daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self):
+        """Add the counts gathered since the last flush; on failure they are dropped rather than retried"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        engine = get_database_connection()
+        if not engine:
+            return 0
+
+        try:
+            with engine.connect() as conn:
+                conn.execute(
+                    text("""
+                        INSERT INTO ai_cache_stats (function_name, hits, misses, seconds_saved)
+                        VALUES (:function_name, :hits, :misses, :seconds_saved)
+                        ON CONFLICT (function_name) DO UPDATE SET
+                            hits = ai_cache_stats.hits + EXCLUDED.hits,
+                            misses = ai_cache_stats.misses + EXCLUDED.misses,
+                            seconds_saved = ai_cache_stats.seconds_saved + EXCLUDED.seconds_saved
+                    """),
+                    [
+                        {"function_name": name, "hits": hits, "misses": misses, "seconds_saved": seconds_saved}
+                        for name, (hits, misses, seconds_saved) in sorted(pending.items())
+                    ]
+                )
+                conn.commit()
+                return len(pending)
+
+        except SQLAlchemyError as e:
+            logger.warning("Dropped AI cache stats for %s functions: %s", len(pending), e)
+            return 0
+
+_cache_stats = CacheStats()
+
+def get_cached_response(function_name, query, fingerprint):
+    """Return a cached response, or None on a miss"""
+    engine = get_database_connection()
+    if not engine:
+        return None
+
+    # The cache is best-effort: any database problem is treated as a miss
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(
+                text("""
+                    UPDATE ai_response_cache
+                    SET hit_count = hit_count + 1, last_accessed = CURRENT_TIMESTAMP
+                    WHERE cache_key = :cache_key AND expires_at > CURRENT_TIMESTAMP
+                    RETURNING response, generation_seconds
+                """),
+                {"cache_key": cache_key(function_name, query, fingerprint)}
+            )
+            row = result.fetchone()
+            conn.commit()
+        _cache_stats.record(function_name, row is not None, float(row[1] or 0) if row else 0.0)
+        return row[0] if row else None
+
+    except SQLAlchemyError:
+        return None
+
+def store_cached_response(function_name, query, fingerprint, response, generation_seconds,
+                          ttl_seconds=AI_CACHE_TTL_SECONDS):
+    """Cache a generated response"""
+    engine = get_database_connection()
+    if not engine:
+        return False
+
+    try:
+        with engine.connect() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO ai_response_cache (
+                        cache_key, function_name, normalized_query, context_fingerprint,
+                        response, generation_seconds, expires_at
+                    ) VALUES (
+                        :cache_key, :function_name, :normalized_query, :context_fingerprint,
+                        :response, :generation_seconds,
+                        CURRENT_TIMESTAMP + make_interval(secs => :ttl_seconds)
+                    )
+                    ON CONFLICT (cache_key) DO UPDATE SET
+                        response = EXCLUDED.response,
+                        generation_seconds = EXCLUDED.generation_seconds,
+                        last_accessed = CURRENT_TIMESTAMP,
+                        expires_at = EXCLUDED.expires_at
+                """),
+                {
+                    "cache_key": cache_key(function_name, query, fingerprint),
+                    "function_name": function_name,
+                    "normalized_query": normalize_query(query),
+                    "context_fingerprint": fingerprint,
+                    "response": response,
+                    "generation_seconds": generation_seconds,
+                    "ttl_seconds": ttl_seconds
+                }
+            )
+            conn.commit()
+
+        _maybe_evict()
+        return True
+
+    except SQLAlchemyError:
+        return False
+
+def _maybe_evict():
+    global _inserts_since_eviction
+    with _eviction_lock:
+        _inserts_since_eviction += 1
+        if _inserts_since_eviction < EVICTION_INTERVAL:
+            return
+        _inserts_since_eviction = 0
+    evict_cache_entries()
+
+def evict_cache_entries(max_entries=AI_CACHE_MAX_ENTRIES):
+    """Delete expired entries, then the least recently used beyond max_entries"""
+    engine = get_database_connection()
+    if not engine:
+        return 0
+
+    try:
+        with engine.connect() as conn:
+            expired = conn.execute(
+                text("DELETE FROM ai_response_cache WHERE expires_at <= CURRENT_TIMESTAMP")
+            ).rowcount
+            evicted = conn.execute(
+                text("""
+                    DELETE FROM ai_response_cache
+                    WHERE cache_key IN (
+                        SELECT cache_key FROM ai_response_cache
+                        ORDER BY last_accessed DESC
+                        OFFSET :max_entries
+                    )
+                """),
+                {"max_entries": max_entries}
+            ).rowcount
+            conn.commit()
+            return expired + evicted
+
+    except SQLAlchemyError:
+        return 0
+
+def get_cache_stats():
+    """Hit rate and LLM time saved per cached function"""
+    _cache_stats.flush()
+    engine = get_database_connection()
+    if not engine:
+        return {}
+
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(
+                text("SELECT function_name, hits, misses, seconds_saved FROM ai_cache_stats")
+            )
+            stats = {}
+            for row in result.fetchall():
+                lookups = row[1] + row[2]
+                stats[row[0]] = {
+                    'hits': row[1],
+                    'misses': row[2],
+                    'hit_rate': round(row[1] / lookups, 4) if lookups else 0.0,
+                    'llm_seconds_saved': round(float(row[3] or 0), 2)
+                }
+            return stats
+
+    except SQLAlchemyError:
+        return {}
+
+if __name__ == "__main__":
+    for name, stats in get_cache_stats().items():
+        print(f"{name}: {stats['hits']} hits / {stats['misses']} misses "
+              f"({stats['hit_rate']:.1%}), {stats['llm_seconds_saved']}s of LLM time saved")
@@ -0,0 +1,146 @@
+import threading
+from utils.repository import get_upcoming_reminders
+
+# Function declarations offered to the model (Gemini schema types)
+TOOL_DECLARATIONS = [
+    {
+        "name": "get_portfolio_summary",
+        "description": "Total portfolio value, number of holdings and the largest positions with their weights.",
+    },
+    {
+        "name": "get_holding_detail",
+        "description": "Shares, market value, price per share and portfolio weight of one holding.",
+        "parameters": {
+            "type": "OBJECT",
+            "properties": {
+                "symbol": {"type": "STRING", "description": "Ticker symbol, e.g. AAPL"}
+            },
+            "required": ["symbol"]
+        }
+    },
+    {
+        "name": "get_risk_metrics",
+        "description": "Concentration and diversification metrics for the portfolio compared with the user's risk tolerance.",
+    },
+    {
+        "name": "get_upcoming_reminders",
+        "description": "The user's active financial reminders (bill payments, reviews, contributions) due soon.",
+        "parameters": {
+            "type": "OBJECT",
+            "properties": {
+                "days_ahead": {"type": "INTEGER", "description": "How many days ahead to look (default 30)"}
+            }
+        }
+    },
+    {
+        "name": "get_investor_profile",
+        "description": "Age, risk tolerance, goals, investment timeline, monthly investment, income and debt.",
+    }
+]
+
+def _holdings(context):
+    holdings = context.get('holdings', [])
+    total = sum(h['value'] for h in holdings) or 1
+    return sorted(
+        ({**h, 'weight': h['value'] / total} for h in holdings),
+        key=lambda h: h['value'],
+        reverse=True
+    )
+
+def portfolio_summary(context):
+    holdings = _holdings(context)
+    return {
+        'portfolio_value': context.get('portfolio_value', 0),
+        'holdings_value': round(sum(h['value'] for h in holdings), 2),
+        'holding_count': len(holdings),
+        'largest_positions': [
+            {'symbol': h['symbol'], 'value': round(h['value'], 2), 'weight_pct': round(h['weight'] * 100, 1)}
+            for h in holdings[:5]
+        ]
+    }
+
+def holding_detail(context, symbol):
+    symbol = (symbol or "").upper().strip()
+    for holding in _holdings(context):
+        if holding['symbol'].upper() == symbol:
+            return {
+                'symbol': holding['symbol'],
+                'shares': holding['shares'],
+                'value': round(holding['value'], 2),
+                'price_per_share': round(holding['value'] / holding['shares'], 2) if holding['shares'] else None,
+                'weight_pct': round(holding['weight'] * 100, 1)
+            }
+    return {
+        'error': f"{symbol} is not in the portfolio",
+        'held_symbols': [h['symbol'] for h in context.get('holdings', [])]
+    }
+
+def risk_metrics(context):
+    holdings = _holdings(context)
+    weights = [h['weight'] for h in holdings]
+    hhi = sum(w * w for w in weights)
+    return {
+        'risk_tolerance': context.get('risk_tolerance', 'Moderate'),
+        'holding_count': len(holdings),
+        'largest_position': holdings[0]['symbol'] if holdings else None,
+        'largest_weight_pct': round(weights[0] * 100, 1) if weights else 0.0,
+        'top3_weight_pct': round(sum(weights[:3]) * 100, 1),
+        'herfindahl_index': round(hhi, 3),
+        'effective_holdings': round(1 / hhi, 1) if hhi else 0.0
+    }
+
+def upcoming_reminders(username, days_ahead=30):
+    reminders = get_upcoming_reminders(username, int(days_ahead or 30))
+    return {
+        'reminders': [
+            {
+                'title': r.get('title'),
+                'date': str(r.get('date'))[:10],
+                'type': r.get('type'),
+                'priority': r.get('priority')
+            }
+            for r in reminders[:10]
+        ],
+        'total_due': len(reminders)
+    }
+
+def investor_profile(context):
+    fields = ('age', 'risk_tolerance', 'investment_goals', 'investment_timeline', 'monthly_investment',
+              'annual_income', 'debt_amount', 'financial_goals')
+    return {field: context.get(field) for field in fields}
+
+class ToolSet:
+    """The assistant's tools bound to one user's (already loaded) financial context"""
+
+    declarations = TOOL_DECLARATIONS
+
+    def __init__(self, username, context):
+        self.username = username
+        self.context = context
+        self.calls = []
+        self._lock = threading.Lock()
+
+    @property
+    def scope(self):
+        """Identity of the data behind the tools; answers are only shareable within it"""
+        return self.username
+
+    def call(self, name, args=None):
+        """Run a tool and return its JSON-serializable result (errors are returned, not raised)"""
+        args = dict(args or {})
+        with self._lock:
+            self.calls.append(name)
+        try:
+            if name == 'get_portfolio_summary':
+                return portfolio_summary(self.context)
+            if name == 'get_holding_detail':
+                return holding_detail(self.context, args.get('symbol'))
+            if name == 'get_risk_metrics':
+                return risk_metrics(self.context)
+            if name == 'get_upcoming_reminders':
+                return upcoming_reminders(self.username, args.get('days_ahead', 30))
+            if name == 'get_investor_profile':
+                return investor_profile(self.context)
+            return {'error': f"unknown tool {name}"}
+        except Exception as e:
+            return {'error': f"{name} failed: {e}"}
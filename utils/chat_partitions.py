@@ -0,0 +1,205 @@
+import os
+import re
+import csv
+import gzip
+import logging
+import argparse
+import tempfile
+from datetime import date
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from utils.database_setup import (
+    get_database_connection, create_database_tables, ensure_chat_partitions, is_chat_history_partitioned,
+    month_start, add_months, CHAT_HISTORY_DDL, CHAT_PARTITION_MONTHS_AHEAD
+)
+
+# Months of chat history kept online; older partitions are archived and dropped
+CHAT_RETENTION_MONTHS = int(os.environ.get('CHAT_RETENTION_MONTHS', '12'))
+
+# Where detached partitions are written as gzipped CSV
+CHAT_ARCHIVE_DIR = os.environ.get('CHAT_ARCHIVE_DIR', 'chat_archive')
+
+# The search vector is derived from message_content, so it is not archived
+ARCHIVE_COLUMNS = "id, user_id, message_role, message_content, timestamp, session_id"
+
+PARTITION_NAME_RE = re.compile(r"^ai_chat_history_y(\d{4})m(\d{2})$")
+
+logger = logging.getLogger(__name__)
+
+def _partition_month(name):
+    match = PARTITION_NAME_RE.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+def list_chat_partitions(conn):
+    """Attached monthly partitions as (name, month), oldest first"""
+    result = conn.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'ai_chat_history'::regclass
+    """))
+    partitions = [(row[0], _partition_month(row[0])) for row in result.fetchall()]
+    return sorted((p for p in partitions if p[1]), key=lambda p: p[1])
+
+def list_detached_partitions(conn):
+    """Partition tables detached by an earlier run whose archive did not finish"""
+    attached = {name for name, _ in list_chat_partitions(conn)}
+    result = conn.execute(text("""
+        SELECT tablename FROM pg_tables
+        WHERE schemaname = current_schema() AND tablename LIKE 'ai\\_chat\\_history\\_y%'
+    """))
+    return sorted(
+        (row[0], _partition_month(row[0])) for row in result.fetchall()
+        if _partition_month(row[0]) and row[0] not in attached
+    )
+
+def convert_chat_history():
+    """Convert an unpartitioned ai_chat_history into monthly partitions.
+
+    Runs in a single transaction holding an exclusive lock, so chat writes
+    wait until it commits. Message ids are kept and the id sequence carries on.
+    """
+    engine = get_database_connection()
+    if not engine:
+        return False
+
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('ai_chat_history')"))
+            row = result.fetchone()
+            if not row or row[0] != 'r':
+                return False
+
+            conn.execute(text("LOCK TABLE ai_chat_history IN ACCESS EXCLUSIVE MODE"))
+            conn.execute(text("DROP INDEX IF EXISTS idx_chat_user_timestamp"))
+            conn.execute(text("DROP INDEX IF EXISTS idx_chat_user_session_keyset"))
+            conn.execute(text("DROP INDEX IF EXISTS idx_chat_message_tsv"))
+            conn.execute(text("ALTER TABLE ai_chat_history RENAME TO ai_chat_history_unpartitioned"))
+            conn.execute(text("ALTER INDEX ai_chat_history_pkey RENAME TO ai_chat_history_unpartitioned_pkey"))
+            conn.execute(text("ALTER SEQUENCE ai_chat_history_id_seq OWNED BY NONE"))
+            conn.execute(text(CHAT_HISTORY_DDL))
+
+            result = conn.execute(text("SELECT MIN(timestamp), MAX(timestamp) FROM ai_chat_history_unpartitioned"))
+            oldest, newest = result.fetchone()
+            months_ahead = CHAT_PARTITION_MONTHS_AHEAD
+            if newest:
+                today = date.today()
+                months_ahead = max(months_ahead, (newest.year - today.year) * 12 + newest.month - today.month)
+            ensure_chat_partitions(conn, months_ahead, start=oldest.date() if oldest else None)
+
+            copied = conn.execute(text("""
+                INSERT INTO ai_chat_history (id, user_id, message_role, message_content, timestamp, session_id)
+                SELECT id, user_id, message_role, message_content,
+                       COALESCE(timestamp, CURRENT_TIMESTAMP), session_id
+                FROM ai_chat_history_unpartitioned
+            """)).rowcount
+            conn.execute(text("DROP TABLE ai_chat_history_unpartitioned"))
+            conn.execute(text("ALTER SEQUENCE ai_chat_history_id_seq OWNED BY ai_chat_history.id"))
+            conn.commit()
+
+        logger.info("Moved %s chat messages into monthly partitions", copied)
+        # Recreates the chat indexes on the partitioned table
+        return create_database_tables()
+
+    except SQLAlchemyError as e:
+        logger.error("Error partitioning ai_chat_history: %s", e)
+        return False
+
+def archive_partition(engine, name, archive_dir=CHAT_ARCHIVE_DIR):
+    """Write a detached partition to <archive_dir>/<name>.csv.gz and drop it"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {name}")
+            expected = cursor.fetchone()[0]
+
+            fd, tmp_path = tempfile.mkstemp(dir=archive_dir, prefix=f".{name}.", suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'wb') as raw_file, gzip.GzipFile(fileobj=raw_file, mode='wb') as archive:
+                    cursor.copy_expert(f"COPY (SELECT {ARCHIVE_COLUMNS} FROM {name} ORDER BY id) TO STDOUT WITH (FORMAT csv, HEADER)", archive)
+                with gzip.open(tmp_path, 'rt', newline='') as archive:
+                    written = sum(1 for _ in csv.reader(archive)) - 1
+                if written != expected:
+                    raise RuntimeError(f"archived {written} of {expected} rows from {name}")
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+            # Only drop once the archive is safely on disk
+            cursor.execute(f"DROP TABLE {name}")
+        raw_conn.commit()
+        return expected
+    finally:
+        raw_conn.close()
+
+def apply_retention(retention_months=CHAT_RETENTION_MONTHS, archive_dir=CHAT_ARCHIVE_DIR):
+    """Detach, archive and drop partitions older than retention_months"""
+    engine = get_database_connection()
+    if not engine:
+        return []
+
+    cutoff = add_months(month_start(date.today()), -retention_months)
+    try:
+        with engine.connect() as conn:
+            if not is_chat_history_partitioned(conn):
+                return []
+            expired = [name for name, month in list_chat_partitions(conn) if month < cutoff]
+            for name in expired:
+                # Detaching first takes the month out of every query straight away
+                conn.execute(text(f"ALTER TABLE ai_chat_history DETACH PARTITION {name}"))
+                conn.commit()
+            pending = [name for name, month in list_detached_partitions(conn) if month < cutoff]
+
+    except SQLAlchemyError as e:
+        logger.error("Error detaching chat partitions: %s", e)
+        return []
+
+    archived = []
+    for name in pending:
+        try:
+            rows = archive_partition(engine, name, archive_dir)
+            logger.info("Archived %s (%s messages)", name, rows)
+            archived.append((name, rows))
+        except Exception as e:
+            # The table stays detached and is retried on the next run
+            logger.error("Error archiving %s: %s", name, e)
+    return archived
+
+def run_maintenance(retention_months=CHAT_RETENTION_MONTHS, archive_dir=CHAT_ARCHIVE_DIR,
+                    months_ahead=CHAT_PARTITION_MONTHS_AHEAD):
+    """Create upcoming partitions and archive expired ones"""
+    engine = get_database_connection()
+    if not engine:
+        return 0, []
+
+    try:
+        with engine.connect() as conn:
+            created = ensure_chat_partitions(conn, months_ahead)
+            conn.commit()
+    except SQLAlchemyError as e:
+        logger.error("Error creating chat partitions: %s", e)
+        created = 0
+
+    return created, apply_retention(retention_months, archive_dir)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the monthly ai_chat_history partitions")
+    parser.add_argument('--convert', action='store_true',
+                        help="convert an existing unpartitioned ai_chat_history first")
+    parser.add_argument('--retention-months', type=int, default=CHAT_RETENTION_MONTHS)
+    parser.add_argument('--archive-dir', default=CHAT_ARCHIVE_DIR)
+    parser.add_argument('--months-ahead', type=int, default=CHAT_PARTITION_MONTHS_AHEAD)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.convert and convert_chat_history():
+        print("ai_chat_history is now partitioned by month")
+
+    created, archived = run_maintenance(args.retention_months, args.archive_dir, args.months_ahead)
+    print(f"{created} partitions ensured, {len(archived)} archived "
+          f"({sum(rows for _, rows in archived)} messages)")
@@ -1,33 +1,247 @@
+import copy
 import json
 import os
+import tempfile
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 import streamlit as st
 
+try:
+    import fcntl
+except ImportError:  # Windows - fall back to in-process locking only
+    fcntl = None
+
 # File-based database for MVP - in production, use PostgreSQL
 USER_PREFERENCES_FILE = "user_preferences.json"
 USER_REMINDERS_FILE = "user_reminders.json"
 PORTFOLIO_DATA_FILE = "portfolio_data.json"
 
-def load_json_file(filename):
-    """Load JSON data from file"""
-    if os.path.exists(filename):
+# Log records kept before folding them back into the JSON snapshot
+COMPACTION_MIN_RECORDS = 1000
+
+# Parsed JSON documents keyed by filename, validated against file mtime/size
+_json_cache = {}
+_json_cache_lock = threading.Lock()
+
+def _file_signature(filename):
+    """Identify a file version by inode, mtime and size"""
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+@contextmanager
+def file_lock(filename, exclusive=True):
+    """Hold a cross-process lock on `<filename>.lock`"""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{filename}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
         try:
-            with open(filename, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {}
-    return {}
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+def load_json_file(filename):
+    """Load JSON data from file, reusing the parsed copy while the file is unchanged"""
+    signature = _file_signature(filename)
+    if signature is None:
+        return {}
+    
+    with _json_cache_lock:
+        cached = _json_cache.get(filename)
+    if cached and cached[0] == signature:
+        return copy.deepcopy(cached[1])
+    
+    try:
+        with open(filename, 'r') as f:
+            data = json.load(f)
+    except (json.JSONDecodeError, FileNotFoundError):
+        return {}
+    
+    with _json_cache_lock:
+        _json_cache[filename] = (signature, data)
+    return copy.deepcopy(data)
 
 def save_json_file(filename, data):
-    """Save JSON data to file"""
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=2)
+    """Save JSON data to file atomically via a temporary file and rename"""
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(filename)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, filename)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    
+    with _json_cache_lock:
+        _json_cache[filename] = (_file_signature(filename), copy.deepcopy(data))
+
+class KeyValueStore:
+    """Per-user records from a JSON snapshot plus an append-only change log.
+
+    Each write appends one line for the changed key to ``<filename>.log`` and
+    updates the in-memory index, so a write costs O(record) instead of a full
+    rewrite of the file. The log is folded back into the snapshot once it holds
+    more records than there are keys. Reads take a shared and writes an
+    exclusive ``<filename>.lock``, so several processes can share the files.
+    """
+
+    def __init__(self, filename, compaction_min_records=COMPACTION_MIN_RECORDS):
+        self.filename = filename
+        self.log_filename = f"{filename}.log"
+        self.compaction_min_records = compaction_min_records
+        self._index = None
+        self._snapshot_signature = None
+        self._log_inode = None
+        self._log_offset = 0
+        self._log_records = 0
+        self._lock = threading.RLock()
+
+    def _ensure_loaded(self):
+        """Bring the index up to date; caller must hold the file lock"""
+        signature = _file_signature(self.filename)
+        if self._index is None or signature != self._snapshot_signature:
+            # First load, or another process compacted into a new snapshot
+            self._index = load_json_file(self.filename)
+            self._snapshot_signature = signature
+            self._log_inode = None
+            self._log_offset = 0
+            self._log_records = 0
+        self._replay_log()
+
+    def _replay_log(self):
+        """Apply log records written since the last replay"""
+        try:
+            with open(self.log_filename, 'rb') as f:
+                inode = os.fstat(f.fileno()).st_ino
+                if inode != self._log_inode:
+                    self._log_inode = inode
+                    self._log_offset = 0
+                    self._log_records = 0
+                f.seek(self._log_offset)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn write from a crash, ignore the tail
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        record = {}
+                    if 'd' in record:
+                        self._index.pop(record['k'], None)
+                    elif 'k' in record:
+                        self._index[record['k']] = record['v']
+                    self._log_offset += len(line)
+                    self._log_records += 1
+        except FileNotFoundError:
+            self._log_inode = None
+            self._log_offset = 0
+            self._log_records = 0
+
+    def _append(self, record):
+        line = (json.dumps(record, separators=(',', ':')) + "\n").encode()
+        with open(self.log_filename, 'ab') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+            self._log_inode = os.fstat(f.fileno()).st_ino
+        self._log_offset += len(line)
+        self._log_records += 1
+
+    def get(self, key, default=None):
+        """Get a copy of the record stored under key"""
+        with self._lock, file_lock(self.filename, exclusive=False):
+            self._ensure_loaded()
+            if key not in self._index:
+                return default
+            return copy.deepcopy(self._index[key])
+
+    def get_field(self, key, field, default=None):
+        """Get a copy of one top-level field of the record stored under key"""
+        with self._lock, file_lock(self.filename, exclusive=False):
+            self._ensure_loaded()
+            record = self._index.get(key)
+            if not isinstance(record, dict) or field not in record:
+                return default
+            return copy.deepcopy(record[field])
+
+    def put(self, key, value):
+        """Replace the record stored under key"""
+        with self._lock, file_lock(self.filename):
+            self._ensure_loaded()
+            self._append({'k': key, 'v': value})
+            self._index[key] = copy.deepcopy(value)
+            self._maybe_compact()
+
+    def update(self, key, func, default=None):
+        """Atomically read, modify and write the record stored under key.
+
+        ``func`` receives a copy of the current record (or ``default``) and
+        returns the new record, or None to leave it unchanged.
+        """
+        with self._lock, file_lock(self.filename):
+            self._ensure_loaded()
+            current = copy.deepcopy(self._index.get(key, default))
+            value = func(current)
+            if value is not None:
+                self._append({'k': key, 'v': value})
+                self._index[key] = copy.deepcopy(value)
+                self._maybe_compact()
+            return value
+
+    def delete(self, key):
+        """Remove the record stored under key"""
+        with self._lock, file_lock(self.filename):
+            self._ensure_loaded()
+            if key in self._index:
+                self._append({'k': key, 'd': 1})
+                del self._index[key]
+                self._maybe_compact()
+
+    def _maybe_compact(self):
+        if self._log_records > max(self.compaction_min_records, len(self._index)):
+            self._compact()
+
+    def compact(self):
+        """Write the current index as the new snapshot and drop the log"""
+        with self._lock, file_lock(self.filename):
+            self._ensure_loaded()
+            self._compact()
+
+    def _compact(self):
+        save_json_file(self.filename, self._index)
+        try:
+            os.remove(self.log_filename)
+        except FileNotFoundError:
+            pass
+        self._snapshot_signature = _file_signature(self.filename)
+        self._log_inode = None
+        self._log_offset = 0
+        self._log_records = 0
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(filename):
+    """Get the shared store for a JSON data file"""
+    with _stores_lock:
+        if filename not in _stores:
+            _stores[filename] = KeyValueStore(filename)
+        return _stores[filename]
 
 def get_user_preferences(username):
     """Get user preferences from database"""
     try:
-        preferences_data = load_json_file(USER_PREFERENCES_FILE)
-        return preferences_data.get(username, {})
+        return get_store(USER_PREFERENCES_FILE).get(username, {})
     except Exception as e:
         st.error(f"Error loading user preferences: {str(e)}")
         return {}
@@ -35,10 +249,8 @@ def get_user_preferences(username):
 def save_user_preferences(username, preferences):
     """Save user preferences to database"""
     try:
-        preferences_data = load_json_file(USER_PREFERENCES_FILE)
-        preferences_data[username] = preferences
-        preferences_data[username]['updated_date'] = datetime.now().isoformat()
-        save_json_file(USER_PREFERENCES_FILE, preferences_data)
+        preferences['updated_date'] = datetime.now().isoformat()
+        get_store(USER_PREFERENCES_FILE).put(username, preferences)
         return True
     except Exception as e:
         st.error(f"Error saving user preferences: {str(e)}")
@@ -47,8 +259,7 @@ def save_user_preferences(username, preferences):
 def get_user_reminders(username):
     """Get user reminders from database"""
     try:
-        reminders_data = load_json_file(USER_REMINDERS_FILE)
-        return reminders_data.get(username, [])
+        return get_store(USER_REMINDERS_FILE).get(username, [])
     except Exception as e:
         st.error(f"Error loading user reminders: {str(e)}")
         return []
@@ -56,17 +267,14 @@ def get_user_reminders(username):
 def save_reminder(username, reminder_data):
     """Save a new reminder to database"""
     try:
-        reminders_data = load_json_file(USER_REMINDERS_FILE)
+        def append_reminder(reminders):
+            # Add unique ID to reminder
+            reminder_data['id'] = len(reminders) + 1
+            reminder_data['created_date'] = datetime.now().isoformat()
+            reminders.append(reminder_data)
+            return reminders
         
-        if username not in reminders_data:
-            reminders_data[username] = []
-        
-        # Add unique ID to reminder
-        reminder_data['id'] = len(reminders_data[username]) + 1
-        reminder_data['created_date'] = datetime.now().isoformat()
-        
-        reminders_data[username].append(reminder_data)
-        save_json_file(USER_REMINDERS_FILE, reminders_data)
+        get_store(USER_REMINDERS_FILE).update(username, append_reminder, default=[])
         return True
     except Exception as e:
         st.error(f"Error saving reminder: {str(e)}")
@@ -75,17 +283,16 @@ def save_reminder(username, reminder_data):
 def delete_reminder(username, reminder_id):
     """Delete a reminder from database"""
     try:
-        reminders_data = load_json_file(USER_REMINDERS_FILE)
-        
-        if username in reminders_data:
+        def remove_reminder(reminders):
+            if reminders is None:
+                return None
             # Filter out the reminder with the specified ID
-            reminders_data[username] = [
-                r for r in reminders_data[username] 
+            return [
+                r for r in reminders 
                 if r.get('id') != reminder_id and r.get('title') != reminder_id
             ]
-            save_json_file(USER_REMINDERS_FILE, reminders_data)
-            return True
-        return False
+        
+        return get_store(USER_REMINDERS_FILE).update(username, remove_reminder) is not None
     except Exception as e:
         st.error(f"Error deleting reminder: {str(e)}")
         return False
@@ -93,16 +300,15 @@ def delete_reminder(username, reminder_id):
 def update_reminder(username, reminder_id, updated_data):
     """Update an existing reminder"""
     try:
-        reminders_data = load_json_file(USER_REMINDERS_FILE)
-        
-        if username in reminders_data:
-            for i, reminder in enumerate(reminders_data[username]):
+        def apply_update(reminders):
+            for reminder in reminders or []:
                 if reminder.get('id') == reminder_id:
-                    reminders_data[username][i].update(updated_data)
-                    reminders_data[username][i]['updated_date'] = datetime.now().isoformat()
-                    save_json_file(USER_REMINDERS_FILE, reminders_data)
-                    return True
-        return False
+                    reminder.update(updated_data)
+                    reminder['updated_date'] = datetime.now().isoformat()
+                    return reminders
+            return None
+        
+        return get_store(USER_REMINDERS_FILE).update(username, apply_update) is not None
     except Exception as e:
         st.error(f"Error updating reminder: {str(e)}")
         return False
@@ -110,19 +316,33 @@ def update_reminder(username, reminder_id, updated_data):
 def get_portfolio_data(username):
     """Get user's portfolio data"""
     try:
-        portfolio_data = load_json_file(PORTFOLIO_DATA_FILE)
-        return portfolio_data.get(username, {})
+        return get_store(PORTFOLIO_DATA_FILE).get(username, {})
     except Exception as e:
         st.error(f"Error loading portfolio data: {str(e)}")
         return {}
 
+def compute_portfolio_aggregates(portfolio):
+    """Recompute the running analytics totals from a full portfolio record"""
+    holdings = portfolio.get('holdings', [])
+    return {
+        'holding_count': len(holdings),
+        'transaction_count': len(portfolio.get('transactions', [])),
+        'portfolio_value': sum(h.get('value', 0) for h in holdings),
+        'last_updated': portfolio.get('updated_date', 'Never')
+    }
+
+def _portfolio_aggregates(portfolio):
+    # Records written before aggregates existed are backfilled on their next write
+    if 'aggregates' not in portfolio:
+        portfolio['aggregates'] = compute_portfolio_aggregates(portfolio)
+    return portfolio['aggregates']
+
 def save_portfolio_data(username, portfolio):
     """Save user's portfolio data"""
     try:
-        portfolio_data = load_json_file(PORTFOLIO_DATA_FILE)
-        portfolio_data[username] = portfolio
-        portfolio_data[username]['updated_date'] = datetime.now().isoformat()
-        save_json_file(PORTFOLIO_DATA_FILE, portfolio_data)
+        portfolio['updated_date'] = datetime.now().isoformat()
+        portfolio['aggregates'] = compute_portfolio_aggregates(portfolio)
+        get_store(PORTFOLIO_DATA_FILE).put(username, portfolio)
         return True
     except Exception as e:
         st.error(f"Error saving portfolio data: {str(e)}")
@@ -131,38 +351,45 @@ def save_portfolio_data(username, portfolio):
 def add_portfolio_holding(username, holding):
     """Add a new holding to user's portfolio"""
     try:
-        portfolio_data = load_json_file(PORTFOLIO_DATA_FILE)
-        
-        if username not in portfolio_data:
-            portfolio_data[username] = {'holdings': []}
-        
-        if 'holdings' not in portfolio_data[username]:
-            portfolio_data[username]['holdings'] = []
+        def append_holding(portfolio):
+            if 'holdings' not in portfolio:
+                portfolio['holdings'] = []
+            aggregates = _portfolio_aggregates(portfolio)
+            
+            # Add unique ID to holding
+            holding['id'] = len(portfolio['holdings']) + 1
+            holding['added_date'] = datetime.now().isoformat()
+            
+            portfolio['holdings'].append(holding)
+            aggregates['holding_count'] += 1
+            aggregates['portfolio_value'] += holding.get('value', 0)
+            aggregates['last_updated'] = holding['added_date']
+            return portfolio
         
-        # Add unique ID to holding
-        holding['id'] = len(portfolio_data[username]['holdings']) + 1
-        holding['added_date'] = datetime.now().isoformat()
-        
-        portfolio_data[username]['holdings'].append(holding)
-        save_json_file(PORTFOLIO_DATA_FILE, portfolio_data)
+        get_store(PORTFOLIO_DATA_FILE).update(username, append_holding, default={'holdings': []})
         return True
     except Exception as e:
         st.error(f"Error adding portfolio holding: {str(e)}")
         return False
 
 def remove_portfolio_holding(username, holding_id):
-    """Remove a holding from user's portfolio"""
+    """Remove a holding from user's portfolio; False if there was no such holding"""
     try:
-        portfolio_data = load_json_file(PORTFOLIO_DATA_FILE)
+        def drop_holding(portfolio):
+            if portfolio is None or 'holdings' not in portfolio:
+                return None
+            removed = [h for h in portfolio['holdings'] if h.get('id') == holding_id]
+            if not removed:
+                # Nothing to write, so the record and its last_updated stay as they are
+                return None
+            aggregates = _portfolio_aggregates(portfolio)
+            portfolio['holdings'] = [h for h in portfolio['holdings'] if h.get('id') != holding_id]
+            aggregates['holding_count'] -= len(removed)
+            aggregates['portfolio_value'] -= sum(h.get('value', 0) for h in removed)
+            aggregates['last_updated'] = datetime.now().isoformat()
+            return portfolio
         
-        if username in portfolio_data and 'holdings' in portfolio_data[username]:
-            portfolio_data[username]['holdings'] = [
-                h for h in portfolio_data[username]['holdings'] 
-                if h.get('id') != holding_id
-            ]
-            save_json_file(PORTFOLIO_DATA_FILE, portfolio_data)
-            return True
-        return False
+        return get_store(PORTFOLIO_DATA_FILE).update(username, drop_holding) is not None
     except Exception as e:
         st.error(f"Error removing portfolio holding: {str(e)}")
         return False
@@ -171,9 +398,7 @@ def get_user_transactions(username):
     """Get user's transaction history"""
     try:
         # In a real app, this would be a separate transactions table
-        portfolio_data = load_json_file(PORTFOLIO_DATA_FILE)
-        user_data = portfolio_data.get(username, {})
-        return user_data.get('transactions', [])
+        return get_store(PORTFOLIO_DATA_FILE).get_field(username, 'transactions', [])
     except Exception as e:
         st.error(f"Error loading transaction history: {str(e)}")
         return []
@@ -181,19 +406,20 @@ def get_user_transactions(username):
 def save_transaction(username, transaction):
     """Save a new transaction"""
     try:
-        portfolio_data = load_json_file(PORTFOLIO_DATA_FILE)
-        
-        if username not in portfolio_data:
-            portfolio_data[username] = {'transactions': []}
-        
-        if 'transactions' not in portfolio_data[username]:
-            portfolio_data[username]['transactions'] = []
-        
-        transaction['id'] = len(portfolio_data[username]['transactions']) + 1
-        transaction['date'] = datetime.now().isoformat()
+        def append_transaction(portfolio):
+            if 'transactions' not in portfolio:
+                portfolio['transactions'] = []
+            aggregates = _portfolio_aggregates(portfolio)
+            
+            transaction['id'] = len(portfolio['transactions']) + 1
+            transaction['date'] = datetime.now().isoformat()
+            
+            portfolio['transactions'].append(transaction)
+            aggregates['transaction_count'] += 1
+            aggregates['last_updated'] = transaction['date']
+            return portfolio
         
-        portfolio_data[username]['transactions'].append(transaction)
-        save_json_file(PORTFOLIO_DATA_FILE, portfolio_data)
+        get_store(PORTFOLIO_DATA_FILE).update(username, append_transaction, default={'transactions': []})
         return True
     except Exception as e:
         st.error(f"Error saving transaction: {str(e)}")
@@ -202,15 +428,18 @@ def save_transaction(username, transaction):
 def get_user_analytics(username):
     """Get user analytics and insights"""
     try:
-        # Calculate basic analytics from portfolio and transaction data
-        portfolio_data = get_portfolio_data(username)
-        transactions = get_user_transactions(username)
+        # Totals are maintained by the portfolio writers, so this read does not
+        # depend on the number of holdings or transactions
+        store = get_store(PORTFOLIO_DATA_FILE)
+        aggregates = store.get_field(username, 'aggregates')
+        if aggregates is None:
+            aggregates = compute_portfolio_aggregates(store.get(username, {}))
         
         analytics = {
-            'total_holdings': len(portfolio_data.get('holdings', [])),
-            'total_transactions': len(transactions),
-            'portfolio_value': sum(h.get('value', 0) for h in portfolio_data.get('holdings', [])),
-            'last_updated': portfolio_data.get('updated_date', 'Never')
+            'total_holdings': aggregates['holding_count'],
+            'total_transactions': aggregates['transaction_count'],
+            'portfolio_value': aggregates['portfolio_value'],
+            'last_updated': aggregates['last_updated']
         }
         
         return analytics
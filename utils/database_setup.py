@@ -3,16 +3,39 @@ import psycopg2
 from sqlalchemy import create_engine, text
 from sqlalchemy.exc import SQLAlchemyError
 import streamlit as st
-from datetime import datetime
+from datetime import datetime, date
 
 # Database connection configuration
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Monthly ai_chat_history partitions are created this many months ahead
+CHAT_PARTITION_MONTHS_AHEAD = 3
+
+# Partitioned by month on timestamp; the key has to be part of the primary key
+CHAT_HISTORY_DDL = """
+    CREATE TABLE IF NOT EXISTS ai_chat_history (
+        id INTEGER NOT NULL DEFAULT nextval('ai_chat_history_id_seq'),
+        user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+        message_role VARCHAR(20) NOT NULL, -- 'user' or 'assistant'
+        message_content TEXT NOT NULL,
+        timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        session_id VARCHAR(100),
+        message_tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', message_content)) STORED,
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp)
+"""
+
+# Engines own a connection pool, so one is shared for the whole process
+_engine = None
+
 def get_database_connection():
     """Get database connection using SQLAlchemy"""
+    global _engine
+    if _engine is not None:
+        return _engine
     try:
-        engine = create_engine(DATABASE_URL)
-        return engine
+        _engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+        return _engine
     except Exception as e:
         st.error(f"Database connection error: {str(e)}")
         return None
@@ -134,18 +157,126 @@ def create_database_tables():
                 )
             """))
             
-            # AI chat history table
+            # AI chat history table, one partition per month
+            # (older unpartitioned installs are converted by utils/chat_partitions.py)
+            conn.execute(text("CREATE SEQUENCE IF NOT EXISTS ai_chat_history_id_seq"))
+            conn.execute(text(CHAT_HISTORY_DDL))
             conn.execute(text("""
-                CREATE TABLE IF NOT EXISTS ai_chat_history (
+                ALTER TABLE ai_chat_history ADD COLUMN IF NOT EXISTS message_tsv TSVECTOR
+                GENERATED ALWAYS AS (to_tsvector('english', message_content)) STORED
+            """))
+            ensure_chat_partitions(conn)
+            
+            # Reminder notification delivery log
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS reminder_deliveries (
                     id SERIAL PRIMARY KEY,
+                    reminder_id INTEGER REFERENCES reminders(id) ON DELETE CASCADE,
                     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                    message_role VARCHAR(20) NOT NULL, -- 'user' or 'assistant'
-                    message_content TEXT NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    session_id VARCHAR(100)
+                    reminder_date DATE NOT NULL,
+                    status VARCHAR(20) NOT NULL, -- 'Sent', 'Failed'
+                    attempts INTEGER DEFAULT 0,
+                    last_error TEXT,
+                    sent_date TIMESTAMP,
+                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(reminder_id, reminder_date)
+                )
+            """))
+            
+            # Progress of the JSON-to-Postgres bulk migration (utils/migrate_json.py)
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS json_migration_checkpoints (
+                    source VARCHAR(50) PRIMARY KEY,
+                    records_done INTEGER DEFAULT 0,
+                    last_key TEXT,
+                    rows_loaded BIGINT DEFAULT 0,
+                    completed BOOLEAN DEFAULT FALSE,
+                    updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+            conn.execute(text("""
+                ALTER TABLE json_migration_checkpoints ADD COLUMN IF NOT EXISTS last_key TEXT
+            """))
+            
+            # Exact-match AI response cache
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS ai_response_cache (
+                    cache_key CHAR(64) PRIMARY KEY,
+                    function_name VARCHAR(50) NOT NULL,
+                    normalized_query TEXT NOT NULL,
+                    context_fingerprint VARCHAR(64) NOT NULL,
+                    response TEXT NOT NULL,
+                    generation_seconds REAL DEFAULT 0,
+                    hit_count INTEGER DEFAULT 0,
+                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_accessed TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    expires_at TIMESTAMP NOT NULL
                 )
             """))
             
+            # AI response cache hit/miss counters
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS ai_cache_stats (
+                    function_name VARCHAR(50) PRIMARY KEY,
+                    hits BIGINT DEFAULT 0,
+                    misses BIGINT DEFAULT 0,
+                    seconds_saved DOUBLE PRECISION DEFAULT 0
+                )
+            """))
+            
+            # Precomputed AI insights per user
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS ai_insights_store (
+                    user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+                    insights JSONB NOT NULL,
+                    input_fingerprint VARCHAR(64) NOT NULL,
+                    generated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+
+            # Named chat threads; messages without a session belong to the default thread
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS ai_chat_sessions (
+                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                    session_id VARCHAR(100) NOT NULL,
+                    name VARCHAR(100) NOT NULL,
+                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, session_id)
+                )
+            """))
+
+            # Rolling summaries of chat turns that no longer fit the prompt
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS ai_chat_summaries (
+                    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                    session_key VARCHAR(100) NOT NULL DEFAULT '',
+                    summary TEXT NOT NULL,
+                    summarized_through_id INTEGER NOT NULL,
+                    updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (user_id, session_key)
+                )
+            """))
+
+            # One row per LLM call (or cached answer) for latency and cost tracking
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS ai_call_metrics (
+                    id BIGSERIAL PRIMARY KEY,
+                    user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+                    function_name VARCHAR(50) NOT NULL,
+                    model VARCHAR(50),
+                    route_reason VARCHAR(30),
+                    cache_status VARCHAR(20) NOT NULL, -- 'exact', 'semantic', 'miss', 'coalesced', 'bypass'
+                    prompt_tokens INTEGER,
+                    response_tokens INTEGER,
+                    ttft_ms REAL,
+                    latency_ms REAL NOT NULL,
+                    error_class VARCHAR(50),
+                    created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """))
+
             # Market data cache table
             conn.execute(text("""
                 CREATE TABLE IF NOT EXISTS market_data_cache (
@@ -175,9 +306,18 @@ def create_database_tables():
             conn.execute(text("CREATE INDEX IF NOT EXISTS idx_portfolio_user_symbol ON portfolio_holdings(user_id, symbol)"))
             conn.execute(text("CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions(user_id, transaction_date)"))
             conn.execute(text("CREATE INDEX IF NOT EXISTS idx_reminders_user_date ON reminders(user_id, reminder_date)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_reminders_due ON reminders(reminder_date, user_id, id) WHERE status = 'Active'"))
             conn.execute(text("CREATE INDEX IF NOT EXISTS idx_performance_user_date ON portfolio_performance(user_id, performance_date)"))
             conn.execute(text("CREATE INDEX IF NOT EXISTS idx_chat_user_timestamp ON ai_chat_history(user_id, timestamp)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_active ON ai_chat_sessions(user_id, last_active DESC)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_chat_user_session_keyset ON ai_chat_history(user_id, session_id, timestamp DESC, id DESC)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_chat_message_tsv ON ai_chat_history USING GIN (message_tsv)"))
             conn.execute(text("CREATE INDEX IF NOT EXISTS idx_market_data_symbol ON market_data_cache(symbol, last_updated)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_ai_cache_last_accessed ON ai_response_cache(last_accessed)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_ai_cache_expires ON ai_response_cache(expires_at)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_ai_metrics_function_date ON ai_call_metrics(function_name, created_date)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_ai_metrics_user_date ON ai_call_metrics(user_id, created_date)"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS idx_ai_cache_context ON ai_response_cache(function_name, context_fingerprint, last_accessed)"))
             
             conn.commit()
             return True
@@ -186,6 +326,46 @@ def create_database_tables():
         st.error(f"Error creating database tables: {str(e)}")
         return False
 
+def month_start(day):
+    """First day of the month containing day"""
+    return date(day.year, day.month, 1)
+
+def add_months(month, months):
+    """First day of the month `months` after (or before, if negative) month"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def chat_partition_name(month):
+    return f"ai_chat_history_y{month.year}m{month.month:02d}"
+
+def is_chat_history_partitioned(conn):
+    result = conn.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('ai_chat_history')"))
+    row = result.fetchone()
+    return bool(row) and row[0] == 'p'
+
+def ensure_chat_partitions(conn, months_ahead=CHAT_PARTITION_MONTHS_AHEAD, start=None):
+    """Create the monthly ai_chat_history partitions from start through months_ahead.
+
+    Does nothing while ai_chat_history is still an unpartitioned table. The
+    caller commits.
+    """
+    if not is_chat_history_partitioned(conn):
+        return 0
+
+    current = month_start(date.today())
+    month = month_start(start) if start else current
+    last = add_months(current, months_ahead)
+    created = 0
+    while month <= last:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {chat_partition_name(month)}
+            PARTITION OF ai_chat_history
+            FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')
+        """))
+        created += 1
+        month = add_months(month, 1)
+    return created
+
 def test_database_connection():
     """Test database connection and create tables if needed"""
     engine = get_database_connection()
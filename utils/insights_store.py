@@ -0,0 +1,202 @@
+import os
+import json
+import logging
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from utils.database_setup import get_database_connection
+from utils.auth import get_user_id
+from utils.ai_cache import context_fingerprint
+from utils.ai_assistant import get_ai_insights, get_financial_context, INSIGHTS_FALLBACK
+from utils.repository import get_user_preferences
+
+# Stored insights older than this are regenerated even if nothing changed
+INSIGHTS_MAX_AGE_SECONDS = int(os.environ.get('INSIGHTS_MAX_AGE_SECONDS', str(24 * 3600)))
+
+logger = logging.getLogger(__name__)
+
+# Background regeneration for pages that find stale insights
+_refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="insights-refresh")
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+def get_insights_fingerprint(username):
+    """Fingerprint of everything the insights are generated from"""
+    return context_fingerprint(get_financial_context(username))
+
+def get_stored_insights(username, fingerprint=None):
+    """Get the stored insights with their freshness, or None if never generated"""
+    user_id = get_user_id(username)
+    if not user_id:
+        return None
+
+    engine = get_database_connection()
+    if not engine:
+        return None
+
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(
+                text("""
+                    SELECT insights, input_fingerprint, generated_date,
+                           EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - generated_date))
+                    FROM ai_insights_store
+                    WHERE user_id = :user_id
+                """),
+                {"user_id": user_id}
+            )
+            row = result.fetchone()
+
+    except SQLAlchemyError as e:
+        logger.warning("Error loading stored insights: %s", e)
+        return None
+
+    if not row:
+        return None
+
+    if fingerprint is None:
+        fingerprint = get_insights_fingerprint(username)
+    age_seconds = float(row[3] or 0)
+    insights = row[0] if isinstance(row[0], dict) else json.loads(row[0])
+    return {
+        'insights': insights,
+        'fingerprint': row[1],
+        'generated_date': row[2].isoformat() if row[2] else None,
+        'age_seconds': age_seconds,
+        'is_stale': row[1] != fingerprint or age_seconds > INSIGHTS_MAX_AGE_SECONDS
+    }
+
+def save_insights(username, insights, fingerprint):
+    """Store generated insights together with the fingerprint of their inputs"""
+    user_id = get_user_id(username)
+    if not user_id:
+        return False
+
+    engine = get_database_connection()
+    if not engine:
+        return False
+
+    try:
+        with engine.connect() as conn:
+            conn.execute(
+                text("""
+                    INSERT INTO ai_insights_store (user_id, insights, input_fingerprint, generated_date)
+                    VALUES (:user_id, CAST(:insights AS JSONB), :fingerprint, CURRENT_TIMESTAMP)
+                    ON CONFLICT (user_id) DO UPDATE SET
+                        insights = EXCLUDED.insights,
+                        input_fingerprint = EXCLUDED.input_fingerprint,
+                        generated_date = EXCLUDED.generated_date
+                """),
+                {"user_id": user_id, "insights": json.dumps(insights), "fingerprint": fingerprint}
+            )
+            conn.commit()
+            return True
+
+    except SQLAlchemyError as e:
+        logger.warning("Error saving insights: %s", e)
+        return False
+
+def refresh_insights(username, force=False):
+    """Regenerate a user's insights if their inputs changed or they are too old"""
+    fingerprint = get_insights_fingerprint(username)
+    stored = get_stored_insights(username, fingerprint)
+    if stored and not stored['is_stale'] and not force:
+        return stored['insights']
+
+    insights = get_ai_insights(username, get_user_preferences(username))
+    # Keep serving the previous copy rather than overwrite it with the error placeholder
+    if insights and insights != INSIGHTS_FALLBACK:
+        save_insights(username, insights, fingerprint)
+        return insights
+    return stored['insights'] if stored else insights
+
+def _refresh_in_background(username):
+    try:
+        refresh_insights(username)
+    except Exception as e:
+        logger.warning("Background insights refresh for %s failed: %s", username, e)
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(username)
+
+def schedule_refresh(username):
+    """Queue a background regeneration unless one is already running for the user"""
+    with _refreshing_lock:
+        if username in _refreshing:
+            return False
+        _refreshing.add(username)
+    _refresh_executor.submit(_refresh_in_background, username)
+    return True
+
+def get_insights_for_page(username):
+    """Get insights for display without waiting on the model when a copy exists.
+
+    Returns (insights, stored) where stored carries the freshness metadata; stale
+    copies are served immediately and regenerated in the background.
+    """
+    stored = get_stored_insights(username)
+    if stored is None:
+        # First visit: nothing to show yet, so generate once in the foreground
+        return refresh_insights(username), get_stored_insights(username)
+    if stored['is_stale']:
+        schedule_refresh(username)
+    return stored['insights'], stored
+
+def refresh_stale_insights():
+    """Regenerate stale insights for every active user"""
+    engine = get_database_connection()
+    if not engine:
+        return 0
+
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(text("SELECT username FROM users WHERE is_active = TRUE ORDER BY id"))
+            usernames = [row[0] for row in result.fetchall()]
+    except SQLAlchemyError as e:
+        logger.error("Error listing users for insights refresh: %s", e)
+        return 0
+
+    refreshed = 0
+    for username in usernames:
+        fingerprint = get_insights_fingerprint(username)
+        stored = get_stored_insights(username, fingerprint)
+        if stored is None or stored['is_stale']:
+            refresh_insights(username, force=True)
+            refreshed += 1
+    return refreshed
+
+def run_insights_refresher(interval=900, stop_event=None):
+    """Refresh stale insights every `interval` seconds until stopped"""
+    stop_event = stop_event or threading.Event()
+    while not stop_event.is_set():
+        refreshed = refresh_stale_insights()
+        if refreshed:
+            logger.info("Refreshed insights for %s users", refreshed)
+        stop_event.wait(interval)
+
+def start_background_refresher(interval=900):
+    """Start the insights refresher in a daemon thread and return its stop event"""
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_insights_refresher,
+        args=(interval, stop_event),
+        name="insights-refresher",
+        daemon=True
+    )
+    thread.start()
+    return stop_event
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate stale AI insights")
+    parser.add_argument('--once', action='store_true', help="run a single pass and exit")
+    parser.add_argument('--interval', type=int, default=900, help="seconds between passes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.once:
+        print(f"Refreshed insights for {refresh_stale_insights()} users")
+    else:
+        run_insights_refresher(args.interval)
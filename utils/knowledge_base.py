@@ -0,0 +1,260 @@
+import os
+import re
+import glob
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import argparse
+import threading
+import numpy as np
+from utils.semantic_cache import embed_question, EMBEDDING_DIMENSIONS
+
+# Reference documents the assistant may quote (financial guidance only, not the app's own docs)
+KNOWLEDGE_SOURCES = os.environ.get('KNOWLEDGE_SOURCES', 'knowledge/*.md,knowledge/*.txt')
+KNOWLEDGE_INDEX_DIR = os.environ.get('KNOWLEDGE_INDEX_DIR', '.knowledge_index')
+
+# Chunk size and overlap, in words
+CHUNK_WORDS = 120
+CHUNK_OVERLAP_WORDS = 30
+
+# Passages injected per question and the least similarity worth injecting; unrelated
+# questions score up to about 0.13 against the knowledge/ documents, on-topic ones 0.2 and up
+KNOWLEDGE_TOP_K = int(os.environ.get('KNOWLEDGE_TOP_K', '3'))
+KNOWLEDGE_MIN_SCORE = float(os.environ.get('KNOWLEDGE_MIN_SCORE', '0.2'))
+
+logger = logging.getLogger(__name__)
+
+_HEADING_RE = re.compile(r"^#{1,6}\s+(.*)$")
+
+def source_paths(sources=KNOWLEDGE_SOURCES):
+    """Files matched by the comma-separated source patterns, in a stable order"""
+    paths = set()
+    for pattern in sources.split(','):
+        pattern = pattern.strip()
+        if pattern:
+            paths.update(p for p in glob.glob(pattern) if os.path.isfile(p))
+    return sorted(paths)
+
+def sources_signature(paths):
+    """Changes whenever a source file is added, removed or modified"""
+    digest = hashlib.sha256()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+def _sections(content):
+    """Split a document into (heading, paragraph text) on markdown headings and blank lines"""
+    heading = ""
+    paragraph = []
+    for line in content.splitlines():
+        match = _HEADING_RE.match(line.strip())
+        if match or not line.strip():
+            if paragraph:
+                yield heading, " ".join(paragraph)
+                paragraph = []
+            if match:
+                heading = match.group(1).strip()
+            continue
+        paragraph.append(line.strip())
+    if paragraph:
+        yield heading, " ".join(paragraph)
+
+def chunk_document(content, chunk_words=CHUNK_WORDS, overlap_words=CHUNK_OVERLAP_WORDS):
+    """Group paragraphs into passages of about chunk_words, overlapping when one is split"""
+    chunks = []
+    words = []
+    heading = ""
+    for section_heading, paragraph in _sections(content):
+        if section_heading != heading and words:
+            chunks.append((heading, " ".join(words)))
+            words = []
+        heading = section_heading
+        words.extend(paragraph.split())
+        while len(words) > chunk_words:
+            chunks.append((heading, " ".join(words[:chunk_words])))
+            words = words[chunk_words - overlap_words:]
+    if words:
+        chunks.append((heading, " ".join(words)))
+    return chunks
+
+def current_version_dir(index_dir=KNOWLEDGE_INDEX_DIR):
+    """Directory of the index version readers should use, or None before the first build"""
+    try:
+        with open(os.path.join(index_dir, 'CURRENT'), encoding='utf-8') as f:
+            version = f.read().strip()
+    except OSError:
+        return None
+    return os.path.join(index_dir, version) if version else None
+
+def build_index(index_dir=KNOWLEDGE_INDEX_DIR, sources=KNOWLEDGE_SOURCES):
+    """Chunk and embed the sources and publish a new index version; returns the number of passages.
+
+    Each build writes a fresh version directory under a unique temporary
+    name, then publishes it by atomically replacing the CURRENT pointer, so
+    readers always see a passages.json and vectors.npy from the same build
+    and concurrent builds never write to the same files.
+    """
+    paths = source_paths(sources)
+    passages = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for heading, passage in chunk_document(f.read()):
+                passages.append({'source': path, 'heading': heading, 'text': passage})
+
+    vectors = np.zeros((len(passages), EMBEDDING_DIMENSIONS), dtype=np.float32)
+    for i, passage in enumerate(passages):
+        # The heading gives short passages the topic they belong to
+        vectors[i] = embed_question(f"{passage['heading']} {passage['text']}")
+
+    os.makedirs(index_dir, exist_ok=True)
+    version = f"v{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    staging = os.path.join(index_dir, f".tmp-{version}")
+    os.makedirs(staging)
+    np.save(os.path.join(staging, 'vectors.npy'), vectors)
+    with open(os.path.join(staging, 'passages.json'), 'w', encoding='utf-8') as f:
+        json.dump({'signature': sources_signature(paths), 'passages': passages}, f)
+    os.rename(staging, os.path.join(index_dir, version))
+
+    pointer = os.path.join(index_dir, f".CURRENT-{uuid.uuid4().hex}")
+    with open(pointer, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(pointer, os.path.join(index_dir, 'CURRENT'))
+
+    _prune_versions(index_dir, keep=version)
+    return len(passages)
+
+def _prune_versions(index_dir, keep, retain=2):
+    """Delete old versions, keeping the newest few for readers that resolved CURRENT just before the swap"""
+    versions = sorted(name for name in os.listdir(index_dir) if name.startswith('v'))
+    for name in versions[:-retain]:
+        if name != keep:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+class KnowledgeBase:
+    """Brute-force cosine search over a memory-mapped matrix of passage vectors"""
+
+    def __init__(self, index_dir=KNOWLEDGE_INDEX_DIR, sources=KNOWLEDGE_SOURCES):
+        self.index_dir = index_dir
+        self.sources = sources
+        self.vectors = np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        self.passages = []
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _is_current(self):
+        version_dir = current_version_dir(self.index_dir)
+        if version_dir is None:
+            return False
+        try:
+            with open(os.path.join(version_dir, 'passages.json'), encoding='utf-8') as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return stored.get('signature') == sources_signature(source_paths(self.sources))
+
+    def load(self, rebuild=False):
+        """Open the index, building it first if it is missing or older than its sources"""
+        with self._lock:
+            if rebuild or not self._is_current():
+                build_index(self.index_dir, self.sources)
+            # Both files come from the one version CURRENT named when we looked
+            version_dir = current_version_dir(self.index_dir)
+            with open(os.path.join(version_dir, 'passages.json'), encoding='utf-8') as f:
+                self.passages = json.load(f)['passages']
+            # Pages are read on demand and shared between processes through the page cache
+            self.vectors = np.load(os.path.join(version_dir, 'vectors.npy'), mmap_mode='r')
+            self._loaded = True
+
+    def search(self, query, k=KNOWLEDGE_TOP_K, min_score=KNOWLEDGE_MIN_SCORE):
+        """Top-k passages for a query as dicts with source, heading, text and score"""
+        if not self._loaded:
+            try:
+                self.load()
+            except OSError as e:
+                logger.warning("Knowledge index unavailable: %s", e)
+                self._loaded = True
+        if not self.passages:
+            return []
+
+        scores = self.vectors @ embed_question(query)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {**self.passages[i], 'score': float(scores[i])}
+            for i in top if scores[i] >= min_score
+        ]
+
+_knowledge_base = None
+_knowledge_base_lock = threading.Lock()
+
+def get_knowledge_base():
+    """Get the process-wide knowledge base"""
+    global _knowledge_base
+    with _knowledge_base_lock:
+        if _knowledge_base is None:
+            _knowledge_base = KnowledgeBase()
+        return _knowledge_base
+
+def format_passages(passages):
+    """Render retrieved passages for a prompt"""
+    return "\n\n".join(
+        f"[{os.path.basename(p['source'])}{' - ' + p['heading'] if p['heading'] else ''}]\n{p['text']}"
+        for p in passages
+    )
+
+def retrieve_reference(query, k=KNOWLEDGE_TOP_K):
+    """Relevant reference passages for a question, formatted for the prompt ('' when none match)"""
+    return format_passages(get_knowledge_base().search(query, k))
+
+def benchmark(queries, repeats=20):
+    """Time an index build and repeated queries; returns a dict of timings in milliseconds"""
+    knowledge_base = KnowledgeBase()
+    started = time.perf_counter()
+    knowledge_base.load(rebuild=True)
+    build_ms = (time.perf_counter() - started) * 1000
+
+    timings = []
+    for _ in range(repeats):
+        for query in queries:
+            started = time.perf_counter()
+            knowledge_base.search(query)
+            timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'passages': len(knowledge_base.passages),
+        'build_ms': build_ms,
+        'queries': len(timings),
+        'query_p50_ms': timings[len(timings) // 2],
+        'query_p95_ms': timings[min(len(timings) - 1, int(0.95 * len(timings)))]
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build, query or benchmark the assistant's knowledge index")
+    parser.add_argument('--rebuild', action='store_true', help="rebuild the index from its sources")
+    parser.add_argument('--query', help="print the passages retrieved for a question")
+    parser.add_argument('--benchmark', action='store_true', help="time an index build and queries")
+    parser.add_argument('-k', type=int, default=KNOWLEDGE_TOP_K)
+    args = parser.parse_args()
+
+    if args.benchmark:
+        result = benchmark([
+            "How should I diversify my portfolio?",
+            "What is an emergency fund?",
+            "Should I pay off my credit card first?",
+            "What are tax-advantaged retirement accounts?"
+        ])
+        print(f"{result['passages']} passages built in {result['build_ms']:.1f}ms; "
+              f"{result['queries']} queries p50 {result['query_p50_ms']:.3f}ms "
+              f"p95 {result['query_p95_ms']:.3f}ms")
+    else:
+        knowledge_base = get_knowledge_base()
+        knowledge_base.load(rebuild=args.rebuild)
+        print(f"{len(knowledge_base.passages)} passages indexed in {knowledge_base.index_dir}")
+        if args.query:
+            for passage in knowledge_base.search(args.query, args.k, min_score=-1.0):
+                print(f"\n{passage['score']:.3f} {passage['source']} - {passage['heading']}\n{passage['text']}")
@@ -0,0 +1,344 @@
+import os
+import abc
+import json
+import math
+import time
+import random
+import threading
+from contextlib import contextmanager
+import httpx
+from google import genai
+from google.genai import errors, types
+
+# Which LLM answers the assistant: 'gemini', or 'mock' for offline load testing
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')
+
+GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY", "your-api-key-here")
+
+# Rounds of tool calls a single answer may take before the model must reply
+MAX_TOOL_ROUNDS = int(os.environ.get('LLM_MAX_TOOL_ROUNDS', '4'))
+
+class LLMError(Exception):
+    """An LLM call failed"""
+
+class LLMTimeoutError(LLMError):
+    """An LLM call did not finish within its timeout"""
+
+class LLMUnavailableError(LLMError):
+    """The LLM service refused or failed the request"""
+
+@contextmanager
+def translate_errors(backend):
+    """Re-raise SDK and transport failures as LLMError subclasses.
+
+    The degraded-answer path and the circuit breakers only understand
+    LLMError; anything the client library raises is mapped onto it here.
+    """
+    try:
+        yield
+    except LLMError:
+        raise
+    except httpx.TimeoutException as e:
+        raise LLMTimeoutError(f"{backend} request timed out: {e}") from e
+    except errors.APIError as e:
+        # 429 and 5xx are the usual cases; other client errors fail the same way
+        raise LLMUnavailableError(f"{backend} API error {e.code}: {e.message or e.status}") from e
+    except httpx.TransportError as e:
+        raise LLMUnavailableError(f"{backend} connection failed: {e}") from e
+
+class LLMResult:
+    """Text of a response, or of one streamed chunk, with token usage when known.
+
+    ``tool_calls`` names the tools the model called for the response; a stream
+    reports them on its final chunk.
+    """
+
+    def __init__(self, text, model, prompt_tokens=None, response_tokens=None, tool_calls=None):
+        self.text = text
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.response_tokens = response_tokens
+        self.tool_calls = tool_calls or []
+
+class LLMBackend(abc.ABC):
+    """Interface every LLM backend implements"""
+
+    name = None
+
+    @abc.abstractmethod
+    def generate(self, model, prompt, json_output=False, timeout=None, tools=None):
+        """Return an LLMResult for the whole response.
+
+        With ``tools`` (an ai_tools.ToolSet) the model may call them to fetch
+        data before answering; their results are sent back to it.
+        """
+
+    @abc.abstractmethod
+    def stream(self, model, prompt, timeout=None, tools=None):
+        """Yield LLMResult chunks as the response is generated"""
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through the google-genai client"""
+
+    name = 'gemini'
+
+    def __init__(self, api_key=GEMINI_API_KEY):
+        self.client = genai.Client(api_key=api_key)
+
+    def _config(self, json_output, timeout, tools=None):
+        if not json_output and timeout is None and tools is None:
+            return None
+        return types.GenerateContentConfig(
+            response_mime_type="application/json" if json_output else None,
+            # HttpOptions takes milliseconds
+            http_options=types.HttpOptions(timeout=int(timeout * 1000)) if timeout is not None else None,
+            tools=[types.Tool(function_declarations=[
+                types.FunctionDeclaration(**declaration) for declaration in tools.declarations
+            ])] if tools is not None else None,
+            # Tools are run here, not by the client's automatic function calling
+            automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True) if tools is not None else None
+        )
+
+    def _text(self, response):
+        # response.text warns when a candidate also holds function calls
+        candidates = getattr(response, 'candidates', None) or []
+        content = candidates[0].content if candidates else None
+        return "".join(part.text for part in (getattr(content, 'parts', None) or []) if part.text)
+
+    def _result(self, response, model):
+        usage = getattr(response, 'usage_metadata', None)
+        return LLMResult(
+            self._text(response),
+            model,
+            getattr(usage, 'prompt_token_count', None),
+            getattr(usage, 'candidates_token_count', None)
+        )
+
+    def _remaining(self, started, timeout):
+        if timeout is None:
+            return None
+        remaining = timeout - (time.monotonic() - started)
+        if remaining <= 0:
+            raise LLMTimeoutError(f"LLM call exceeded {timeout}s while running tools")
+        return remaining
+
+    def _tool_responses(self, calls, tools):
+        return types.Content(role='user', parts=[
+            types.Part.from_function_response(name=call.name, response=tools.call(call.name, dict(call.args or {})))
+            for call in calls
+        ])
+
+    def generate(self, model, prompt, json_output=False, timeout=None, tools=None):
+        with translate_errors(self.name):
+            return self._generate(model, prompt, json_output, timeout, tools)
+
+    def _generate(self, model, prompt, json_output, timeout, tools):
+        if tools is None:
+            response = self.client.models.generate_content(
+                model=model,
+                contents=prompt,
+                config=self._config(json_output, timeout)
+            )
+            return self._result(response, model)
+
+        started = time.monotonic()
+        contents = [types.Content(role='user', parts=[types.Part(text=prompt)])]
+        prompt_tokens = response_tokens = 0
+        for round_number in range(MAX_TOOL_ROUNDS + 1):
+            # The last round offers no tools, so the model has to answer
+            response = self.client.models.generate_content(
+                model=model,
+                contents=contents,
+                config=self._config(json_output, self._remaining(started, timeout),
+                                    tools if round_number < MAX_TOOL_ROUNDS else None)
+            )
+            result = self._result(response, model)
+            prompt_tokens += result.prompt_tokens or 0
+            response_tokens += result.response_tokens or 0
+            if not response.function_calls:
+                break
+            contents.append(response.candidates[0].content)
+            contents.append(self._tool_responses(response.function_calls, tools))
+        return LLMResult(result.text, model, prompt_tokens, response_tokens, list(tools.calls))
+
+    def stream(self, model, prompt, timeout=None, tools=None):
+        with translate_errors(self.name):
+            yield from self._stream(model, prompt, timeout, tools)
+
+    def _stream(self, model, prompt, timeout, tools):
+        if tools is None:
+            for chunk in self.client.models.generate_content_stream(
+                model=model,
+                contents=prompt,
+                config=self._config(False, timeout)
+            ):
+                yield self._result(chunk, model)
+            return
+
+        started = time.monotonic()
+        contents = [types.Content(role='user', parts=[types.Part(text=prompt)])]
+        prompt_tokens = response_tokens = 0
+        for round_number in range(MAX_TOOL_ROUNDS + 1):
+            calls = []
+            parts = []
+            usage = None
+            for chunk in self.client.models.generate_content_stream(
+                model=model,
+                contents=contents,
+                config=self._config(False, self._remaining(started, timeout),
+                                    tools if round_number < MAX_TOOL_ROUNDS else None)
+            ):
+                result = self._result(chunk, model)
+                usage = result if result.prompt_tokens is not None else usage
+                # The model turn sent back with tool results must hold everything it said,
+                # including text the user has already seen
+                candidates = chunk.candidates or []
+                if candidates and candidates[0].content and candidates[0].content.parts:
+                    parts.extend(candidates[0].content.parts)
+                if chunk.function_calls:
+                    calls.extend(chunk.function_calls)
+                if result.text:
+                    yield LLMResult(result.text, model)
+            if usage is not None:
+                prompt_tokens += usage.prompt_tokens or 0
+                response_tokens += usage.response_tokens or 0
+            if not calls:
+                break
+            contents.append(types.Content(role='model', parts=parts))
+            contents.append(self._tool_responses(calls, tools))
+        # Usage for all rounds arrives with a final empty chunk
+        yield LLMResult("", model, prompt_tokens, response_tokens, list(tools.calls))
+
+MOCK_ANSWER = (
+    "Based on your current portfolio, your allocation looks reasonably diversified, but a few positions "
+    "carry more weight than your risk tolerance suggests. Consider trimming concentrated holdings, "
+    "directing new monthly contributions toward underweight asset classes, and keeping an emergency fund "
+    "outside the market. Review your allocation at least once a year. This is for informational purposes "
+    "only; please consult a qualified financial advisor before making important decisions."
+)
+
+MOCK_JSON = {
+    "portfolio_health": "Mock assessment: the portfolio is moderately diversified.",
+    "risk_assessment": "Mock assessment: risk is in line with the stated tolerance.",
+    "overall_risk_level": 5,
+    "recommendations": [
+        {"symbol": "VTI", "name": "Vanguard Total Stock Market ETF", "reason": "Broad diversification",
+         "expected_return": "7-9%", "risk_level": "Moderate"}
+    ],
+    "opportunities": ["Mock opportunity: use tax-advantaged accounts for new contributions."]
+}
+
+class MockBackend(LLMBackend):
+    """Local stand-in for Gemini with configurable latency, token rate and failures.
+
+    Time to first token follows a lognormal distribution given by its median
+    and p95; the rest of the answer is produced at ``tokens_per_second``. A
+    ``failure_rate`` share of calls raise LLMUnavailableError and calls that
+    would exceed their timeout raise LLMTimeoutError once it has elapsed.
+    A zero latency or token rate means no delay. Given tools, a call first spends one extra model turn on a tool call.
+    """
+
+    name = 'mock'
+
+    def __init__(self, ttft_median_ms=None, ttft_p95_ms=None, tokens_per_second=None,
+                 response_tokens=None, failure_rate=None, seed=None):
+        def setting(value, name, default):
+            # An explicit 0 is a setting, not a request for the default
+            return value if value is not None else os.environ.get(name, default)
+
+        self.ttft_median = float(setting(ttft_median_ms, 'MOCK_LLM_TTFT_MS', '400')) / 1000
+        self.ttft_p95 = float(setting(ttft_p95_ms, 'MOCK_LLM_TTFT_P95_MS', '1500')) / 1000
+        self.tokens_per_second = float(setting(tokens_per_second, 'MOCK_LLM_TOKENS_PER_SECOND', '80'))
+        self.response_tokens = int(setting(response_tokens, 'MOCK_LLM_RESPONSE_TOKENS', '120'))
+        self.failure_rate = float(setting(failure_rate, 'MOCK_LLM_FAILURE_RATE', '0'))
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _sample(self):
+        """Draw (time to first token, fails) for one call"""
+        sigma = math.log(max(self.ttft_p95, self.ttft_median) / self.ttft_median) / 1.645 if self.ttft_median > 0 else 0.0
+        with self._lock:
+            self.calls += 1
+            ttft = self.ttft_median * math.exp(self._random.gauss(0, sigma))
+            fails = self._random.random() < self.failure_rate
+        return ttft, fails
+
+    def _answer(self, json_output):
+        if json_output:
+            return json.dumps(MOCK_JSON)
+        words = MOCK_ANSWER.split(" ")
+        # Repeat or trim the canned answer to the configured length (about one word per token)
+        return " ".join(words[i % len(words)] for i in range(self.response_tokens))
+
+    def _generation_seconds(self, tokens):
+        return tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _wait(self, seconds, started, timeout):
+        if timeout is not None and time.monotonic() - started + seconds > timeout:
+            time.sleep(max(0.0, timeout - (time.monotonic() - started)))
+            raise LLMTimeoutError(f"mock LLM call exceeded {timeout}s")
+        time.sleep(seconds)
+
+    def _use_tools(self, prompt, tools, started, timeout):
+        """Simulate one round of function calling: a model turn, then the tool's result"""
+        if tools is None:
+            return prompt
+        ttft, _ = self._sample()
+        self._wait(ttft, started, timeout)
+        return prompt + json.dumps(tools.call('get_portfolio_summary', {}))
+
+    def generate(self, model, prompt, json_output=False, timeout=None, tools=None):
+        started = time.monotonic()
+        prompt = self._use_tools(prompt, tools, started, timeout)
+        ttft, fails = self._sample()
+        text = self._answer(json_output)
+        tokens = len(text.split(" "))
+        self._wait(ttft + self._generation_seconds(tokens), started, timeout)
+        if fails:
+            raise LLMUnavailableError("mock LLM injected failure")
+        return LLMResult(text, model, math.ceil(len(prompt) / 4), tokens, list(tools.calls) if tools else None)
+
+    def stream(self, model, prompt, timeout=None, tools=None):
+        started = time.monotonic()
+        prompt = self._use_tools(prompt, tools, started, timeout)
+        ttft, fails = self._sample()
+        self._wait(ttft, started, timeout)
+        if fails:
+            raise LLMUnavailableError("mock LLM injected failure")
+
+        words = self._answer(False).split(" ")
+        chunk_words = 8
+        for i in range(0, len(words), chunk_words):
+            chunk = words[i:i + chunk_words]
+            self._wait(self._generation_seconds(len(chunk)), started, timeout)
+            last = i + chunk_words >= len(words)
+            yield LLMResult(
+                " ".join(chunk) + ("" if last else " "),
+                model,
+                math.ceil(len(prompt) / 4) if last else None,
+                len(words) if last else None,
+                list(tools.calls) if last and tools else None
+            )
+
+BACKENDS = {
+    'gemini': GeminiBackend,
+    'mock': MockBackend
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_llm_backend():
+    """Get the process-wide LLM backend selected by LLM_BACKEND"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = BACKENDS[LLM_BACKEND]()
+        return _backend
+
+def set_llm_backend(backend):
+    """Replace the process-wide backend (benchmarks, local runs)"""
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,128 @@
+import time
+import uuid
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.llm import MockBackend, set_llm_backend, get_llm_backend
+from utils.llm_router import get_router, FAST_MODEL
+
+EXAMPLE_QUESTIONS = [
+    "How is my portfolio performing?",
+    "Should I rebalance my portfolio?",
+    "What are the risks in my current holdings?",
+    "How can I reduce my portfolio risk?",
+    "What are tax-efficient investment strategies?"
+]
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def _question(i):
+    # A random tail keeps the exact and semantic caches from answering
+    return f"{EXAMPLE_QUESTIONS[i % len(EXAMPLE_QUESTIONS)]} ({uuid.uuid4().hex})"
+
+def make_request(target, username):
+    """Build the callable for one request against the chosen target.
+
+    It returns seconds to first token, or None for the chat target, which only
+    sees the finished answer and so has total latency alone.
+    """
+    if target == 'backend':
+        def request(i):
+            # Stream so the first chunk marks the first token; generate() only returns once it is all done
+            started = time.perf_counter()
+            first = None
+            for _ in get_llm_backend().stream(FAST_MODEL, _question(i)):
+                if first is None:
+                    first = time.perf_counter() - started
+            return first
+    elif target == 'chat':
+        from utils.ai_assistant import get_ai_response
+        def request(i):
+            get_ai_response(_question(i), username)
+            return None
+    else:
+        from utils.ai_assistant import stream_ai_response
+        def request(i):
+            started = time.perf_counter()
+            first = None
+            for _ in stream_ai_response(_question(i), username):
+                if first is None:
+                    first = time.perf_counter() - started
+            return first
+    return request
+
+def run_benchmark(request, concurrency, total_requests):
+    """Run total_requests calls with `concurrency` in flight and summarize latency"""
+    latencies = []
+    first_tokens = []
+    errors = []
+    lock = threading.Lock()
+
+    def timed(i):
+        started = time.perf_counter()
+        try:
+            first = request(i)
+            with lock:
+                latencies.append(time.perf_counter() - started)
+                if first is not None:
+                    first_tokens.append(first)
+        except Exception as e:
+            with lock:
+                errors.append(type(e).__name__)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, range(total_requests)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': total_requests,
+        'errors': len(errors),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'ttft_p50': percentile(first_tokens, 0.50) if first_tokens else None
+    }
+
+def format_result(result):
+    line = (f"c={result['concurrency']:<4} {result['requests']:>6} req {result['errors']:>5} err "
+            f"{result['throughput']:>8.1f} req/s  p50 {result['p50'] * 1000:>7.0f}ms  "
+            f"p95 {result['p95'] * 1000:>7.0f}ms  p99 {result['p99'] * 1000:>7.0f}ms")
+    if result['ttft_p50'] is not None:
+        line += f"  ttft p50 {result['ttft_p50'] * 1000:>6.0f}ms"
+    return line
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the AI assistant against the mock LLM backend")
+    parser.add_argument('--target', choices=['backend', 'chat', 'stream'], default='backend',
+                        help="backend: LLM layer only; chat/stream: the full assistant path (needs the database)")
+    parser.add_argument('--username', help="existing user to chat as (chat and stream targets)")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--ttft-ms', type=float, default=400)
+    parser.add_argument('--ttft-p95-ms', type=float, default=1500)
+    parser.add_argument('--tokens-per-second', type=float, default=80)
+    parser.add_argument('--response-tokens', type=int, default=120)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    if args.target != 'backend' and not args.username:
+        parser.error("--username is required for the chat and stream targets")
+
+    set_llm_backend(MockBackend(args.ttft_ms, args.ttft_p95_ms, args.tokens_per_second,
+                                args.response_tokens, args.failure_rate, args.seed))
+    request = make_request(args.target, args.username)
+    for concurrency in args.concurrency:
+        print(format_result(run_benchmark(request, concurrency, args.requests)))
+
+    for route in get_router().summary():
+        print(f"{route['function']:<24} {route['model']:<18} {route['reason']:<18} {route['calls']:>6} calls "
+              f"{route['success_rate']:>7.1%} ok {route['mean_seconds'] * 1000:>7.0f}ms mean")
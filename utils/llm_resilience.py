@@ -0,0 +1,209 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from utils.llm import LLMError, LLMTimeoutError
+
+# Consecutive failures that open a model's circuit, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('LLM_BREAKER_FAILURES', '5'))
+BREAKER_RESET_SECONDS = float(os.environ.get('LLM_BREAKER_RESET_SECONDS', '30'))
+
+# Hedging waits for this latency percentile, and only once enough calls have been seen
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 20
+
+_call_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('LLM_CALL_THREADS', '32')),
+    thread_name_prefix="llm-call"
+)
+
+class CircuitOpenError(LLMError):
+    """The model is failing and calls are short-circuited until it recovers"""
+
+class CircuitBreaker:
+    """Stop calling a model after repeated failures, then let one probe call test it.
+
+    closed: calls flow. open: calls fail fast for reset_seconds. half_open: a
+    single probe is allowed; its success closes the circuit, failure reopens it.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+                self._probing = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self.state == 'open' and time.monotonic() - self.opened_at < self.reset_seconds
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction, min_samples=HEDGE_MIN_SAMPLES):
+        """The given latency percentile, or None until min_samples calls are recorded"""
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+_breakers = {}
+_trackers = {}
+_registry_lock = threading.Lock()
+
+def get_breaker(model):
+    """Get the process-wide circuit breaker for a model"""
+    with _registry_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(model)
+        return _breakers[model]
+
+def get_latency_tracker(function_name, model):
+    """Get the latency window for one function on one model"""
+    key = (function_name, model)
+    with _registry_lock:
+        if key not in _trackers:
+            _trackers[key] = LatencyTracker()
+        return _trackers[key]
+
+def call_with_deadline(call, deadline, breaker=None, latencies=None, hedge=False):
+    """Run call(timeout) and return its result within deadline seconds.
+
+    The call runs on a worker thread, so the caller is released at the
+    deadline even if the upstream request hangs; the remaining time is passed
+    to the call as its own timeout so the request is abandoned as well. With
+    hedge, a second identical request is started once the first has taken
+    longer than the recent p95, and whichever finishes first wins.
+    """
+    if breaker and not breaker.allow():
+        raise CircuitOpenError(f"{breaker.name} is unavailable, retrying in {breaker.reset_seconds:.0f}s")
+
+    started = time.monotonic()
+    end = started + deadline
+    hedge_delay = latencies.percentile(HEDGE_PERCENTILE) if hedge and latencies else None
+    pending = {_call_executor.submit(call, deadline)}
+    hedged = False
+    error = None
+
+    while pending:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            break
+        wait_for = remaining
+        if hedge_delay is not None and not hedged:
+            wait_for = min(remaining, max(0.0, started + hedge_delay - time.monotonic()))
+
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if breaker:
+                    breaker.record_success()
+                if latencies:
+                    latencies.record(time.monotonic() - started)
+                return future.result()
+            error = future.exception()
+
+        # Still waiting past the usual p95: race a second request against the first
+        if hedge_delay is not None and not hedged and not done and time.monotonic() < end:
+            hedged = True
+            pending.add(_call_executor.submit(call, end - time.monotonic()))
+
+    if breaker:
+        breaker.record_failure()
+    if not pending and error is not None:
+        raise error
+    raise LLMTimeoutError(f"no response within {deadline:.1f}s")
+
+def guarded_stream(stream, breaker=None, deadline=None):
+    """Iterate stream() under the circuit breaker, giving up deadline seconds after it starts.
+
+    The stream's own timeout only bounds each read, so a response that keeps
+    trickling in could run on indefinitely. The stream is read on a worker
+    thread so the caller waits at most until the deadline; the worker stops
+    reading at its next chunk.
+    """
+    if breaker and not breaker.allow():
+        raise CircuitOpenError(f"{breaker.name} is unavailable, retrying in {breaker.reset_seconds:.0f}s")
+
+    end = time.monotonic() + deadline if deadline is not None else None
+    chunks = queue.Queue()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for chunk in stream():
+                if stop.is_set():
+                    return
+                chunks.put(('chunk', chunk))
+            chunks.put(('done', None))
+        except Exception as e:
+            chunks.put(('error', e))
+
+    _call_executor.submit(produce)
+    try:
+        while True:
+            try:
+                kind, value = chunks.get(timeout=None if end is None else max(0.0, end - time.monotonic()))
+            except queue.Empty:
+                raise LLMTimeoutError(f"stream not finished within {deadline:.1f}s") from None
+            if kind == 'error':
+                raise value
+            if kind == 'done':
+                break
+            yield value
+    except GeneratorExit:
+        # The reader stopped after at least one chunk, so the model was answering; without
+        # an outcome a half-open probe would never be handed back and the circuit would stick
+        if breaker:
+            breaker.record_success()
+        raise
+    except Exception:
+        if breaker:
+            breaker.record_failure()
+        raise
+    finally:
+        stop.set()
+    if breaker:
+        breaker.record_success()
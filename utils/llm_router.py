@@ -0,0 +1,124 @@
+import os
+import re
+import threading
+from contextlib import contextmanager
+from utils.llm_resilience import get_breaker, get_latency_tracker
+
+# Note that the newest Gemini model series is "gemini-2.5-flash" or "gemini-2.5-pro"
+# do not change this unless explicitly requested by the user
+FAST_MODEL = "gemini-2.5-flash"
+STRONG_MODEL = "gemini-2.5-pro"
+
+# Chat questions scoring at least this are sent to the stronger model
+ROUTER_COMPLEXITY_THRESHOLD = float(os.environ.get('ROUTER_COMPLEXITY_THRESHOLD', '0.6'))
+
+# Prompts above this many (estimated) tokens go to the stronger model
+ROUTER_LONG_PROMPT_TOKENS = int(os.environ.get('ROUTER_LONG_PROMPT_TOKENS', '6000'))
+
+# Above this many concurrent calls on the strong model, new calls go to the fast one
+ROUTER_MAX_STRONG_IN_FLIGHT = int(os.environ.get('ROUTER_MAX_STRONG_IN_FLIGHT', '8'))
+
+# Functions whose structured output needs the stronger model by default
+ANALYSIS_FUNCTIONS = {'get_ai_insights', 'get_investment_recommendations', 'analyze_portfolio_risk'}
+
+# Background housekeeping that never needs the stronger model
+FAST_FUNCTIONS = {'summarize_conversation'}
+
+# Words that signal multi-step reasoning in a financial question, with their weights
+COMPLEXITY_TERMS = {
+    'compare': 0.25, 'versus': 0.25, 'vs': 0.2, 'analyze': 0.25, 'analysis': 0.2, 'optimize': 0.25,
+    'strategy': 0.15, 'scenario': 0.25, 'simulate': 0.25, 'project': 0.15, 'projection': 0.2,
+    'tax': 0.15, 'retirement': 0.15, 'estate': 0.2, 'withdrawal': 0.2, 'rebalance': 0.15,
+    'allocation': 0.15, 'why': 0.1, 'tradeoff': 0.2, 'tradeoffs': 0.2, 'if': 0.1, 'plan': 0.1
+}
+
+_WORD_RE = re.compile(r"[a-z]+")
+_NUMBER_RE = re.compile(r"\d[\d,.]*%?")
+
+def classify_complexity(question):
+    """Score a question from 0 (lookup/small talk) to 1 (multi-step analysis)"""
+    question = (question or "").lower()
+    words = _WORD_RE.findall(question)
+    score = min(0.3, len(words) / 100)
+    score += sum(COMPLEXITY_TERMS.get(word, 0.0) for word in set(words))
+    score += min(0.2, 0.05 * len(_NUMBER_RE.findall(question)))
+    score += 0.1 * max(0, question.count("?") - 1)
+    return min(1.0, score)
+
+class Router:
+    """Pick a model per call and keep per-route outcome statistics"""
+
+    def __init__(self):
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def in_flight(self, model):
+        with self._lock:
+            return self._in_flight.get(model, 0)
+
+    @contextmanager
+    def track(self, model):
+        """Count a call against a model's concurrent load while it runs"""
+        with self._lock:
+            self._in_flight[model] = self._in_flight.get(model, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[model] -= 1
+
+    def route(self, function_name, prompt, query=None, deadline=None):
+        """Return (model, reason) for one call"""
+        if function_name in FAST_FUNCTIONS:
+            return FAST_MODEL, 'housekeeping'
+
+        if function_name in ANALYSIS_FUNCTIONS:
+            wanted, reason = STRONG_MODEL, 'analysis'
+        elif len(prompt) / 4 > ROUTER_LONG_PROMPT_TOKENS:
+            wanted, reason = STRONG_MODEL, 'long_prompt'
+        elif classify_complexity(query if query is not None else prompt) >= ROUTER_COMPLEXITY_THRESHOLD:
+            wanted, reason = STRONG_MODEL, 'complex'
+        else:
+            return FAST_MODEL, 'simple'
+
+        # Degrade to the fast model rather than queue behind, or fail on, the strong one
+        if get_breaker(wanted).is_open:
+            return FAST_MODEL, 'strong_unavailable'
+        if self.in_flight(wanted) >= ROUTER_MAX_STRONG_IN_FLIGHT:
+            return FAST_MODEL, 'load'
+        if deadline:
+            p95 = get_latency_tracker(function_name, wanted).percentile(0.95)
+            if p95 is not None and p95 > deadline * 0.8:
+                return FAST_MODEL, 'deadline'
+        return wanted, reason
+
+    def record(self, function_name, model, reason, seconds, ok):
+        """Record the outcome of a routed call; ok means a usable answer came back"""
+        key = (function_name, model, reason)
+        with self._lock:
+            entry = self.stats.setdefault(key, {'calls': 0, 'ok': 0, 'seconds': 0.0})
+            entry['calls'] += 1
+            entry['ok'] += 1 if ok else 0
+            entry['seconds'] += seconds
+
+    def summary(self):
+        """Per-route call count, success rate and mean latency"""
+        with self._lock:
+            return [
+                {
+                    'function': function_name,
+                    'model': model,
+                    'reason': reason,
+                    'calls': entry['calls'],
+                    'success_rate': round(entry['ok'] / entry['calls'], 4),
+                    'mean_seconds': round(entry['seconds'] / entry['calls'], 3)
+                }
+                for (function_name, model, reason), entry in sorted(self.stats.items())
+            ]
+
+_router = Router()
+
+def get_router():
+    """Get the process-wide model router"""
+    return _router
@@ -0,0 +1,216 @@
+import os
+import bisect
+import logging
+import argparse
+import threading
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from utils.database_setup import get_database_connection
+
+# Buffered metrics are written once this many have queued, or every flush interval
+TELEMETRY_BATCH_SIZE = int(os.environ.get('TELEMETRY_BATCH_SIZE', '50'))
+TELEMETRY_FLUSH_SECONDS = float(os.environ.get('TELEMETRY_FLUSH_SECONDS', '5'))
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000, 45000, 90000]
+
+logger = logging.getLogger(__name__)
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram; cheap to update on every call"""
+
+    def __init__(self, bounds=HISTOGRAM_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile (None past the last bound)"""
+        if not self.total:
+            return None
+        target = fraction * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else None
+        return None
+
+class Telemetry:
+    """Collects one record per LLM call: histograms in memory, rows in ai_call_metrics"""
+
+    def __init__(self, batch_size=TELEMETRY_BATCH_SIZE, flush_seconds=TELEMETRY_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.histograms = {}
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer = None
+
+    def record(self, function_name, model=None, username=None, route_reason=None, cache_status='bypass',
+               prompt_tokens=None, response_tokens=None, ttft_seconds=None, latency_seconds=0.0,
+               error_class=None):
+        """Record one call; the database write happens on a background thread"""
+        latency_ms = latency_seconds * 1000
+        row = {
+            "username": username,
+            "function_name": function_name,
+            "model": model,
+            "route_reason": route_reason,
+            "cache_status": cache_status,
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+            "ttft_ms": round(ttft_seconds * 1000, 1) if ttft_seconds is not None else None,
+            "latency_ms": round(latency_ms, 1),
+            "error_class": error_class
+        }
+        with self._lock:
+            key = (function_name, model or cache_status)
+            self.histograms.setdefault(key, LatencyHistogram()).observe(latency_ms)
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="llm-telemetry", daemon=True)
+                self._writer.start()
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write queued records; on failure they are dropped rather than retried"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+
+        engine = get_database_connection()
+        if not engine:
+            return 0
+
+        try:
+            with engine.connect() as conn:
+                conn.execute(
+                    text("""
+                        INSERT INTO ai_call_metrics (
+                            user_id, function_name, model, route_reason, cache_status,
+                            prompt_tokens, response_tokens, ttft_ms, latency_ms, error_class
+                        ) VALUES (
+                            (SELECT id FROM users WHERE username = :username),
+                            :function_name, :model, :route_reason, :cache_status,
+                            :prompt_tokens, :response_tokens, :ttft_ms, :latency_ms, :error_class
+                        )
+                    """),
+                    rows
+                )
+                conn.commit()
+                return len(rows)
+
+        except SQLAlchemyError as e:
+            logger.warning("Dropped %s LLM call metrics: %s", len(rows), e)
+            return 0
+
+    def histogram_summary(self):
+        """In-process latency percentiles per (function, model or cache status)"""
+        with self._lock:
+            return [
+                {
+                    'function': key[0],
+                    'model': key[1],
+                    'calls': histogram.total,
+                    'mean_ms': round(histogram.sum_ms / histogram.total, 1),
+                    'p50_ms': histogram.quantile(0.5),
+                    'p95_ms': histogram.quantile(0.95),
+                    'p99_ms': histogram.quantile(0.99)
+                }
+                for key, histogram in sorted(self.histograms.items(), key=lambda item: str(item[0]))
+            ]
+
+_telemetry = Telemetry()
+
+def get_telemetry():
+    """Get the process-wide telemetry collector"""
+    return _telemetry
+
+def record_llm_call(function_name, **fields):
+    """Record one LLM call (or cache answer) for latency and cost tracking"""
+    _telemetry.record(function_name, **fields)
+
+SUMMARY_GROUPS = {
+    'function': "m.function_name",
+    # Cached answers have no model; they are grouped under their cache status
+    'model': "COALESCE(m.model, m.cache_status)",
+    'user': "COALESCE(u.username, '(system)')"
+}
+
+def get_call_summary(group_by='function', hours=24):
+    """Latency, token and error totals for the last `hours`, grouped by function, model or user"""
+    engine = get_database_connection()
+    if not engine:
+        return []
+
+    group = SUMMARY_GROUPS[group_by]
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(
+                text(f"""
+                    SELECT {group} AS grp,
+                           COUNT(*) AS calls,
+                           COUNT(*) FILTER (WHERE m.cache_status IN ('exact', 'semantic')) AS cache_hits,
+                           COUNT(*) FILTER (WHERE m.error_class IS NOT NULL) AS errors,
+                           COALESCE(SUM(m.prompt_tokens), 0) AS prompt_tokens,
+                           COALESCE(SUM(m.response_tokens), 0) AS response_tokens,
+                           PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY m.ttft_ms) AS ttft_p50,
+                           PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY m.latency_ms) AS latency_p50,
+                           PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY m.latency_ms) AS latency_p95
+                    FROM ai_call_metrics m
+                    LEFT JOIN users u ON u.id = m.user_id
+                    WHERE m.created_date > CURRENT_TIMESTAMP - make_interval(hours => :hours)
+                    GROUP BY grp
+                    ORDER BY calls DESC
+                """),
+                {"hours": hours}
+            )
+            return [
+                {
+                    'group': row[0],
+                    'calls': row[1],
+                    'cache_hit_rate': round(row[2] / row[1], 4) if row[1] else 0.0,
+                    'error_rate': round(row[3] / row[1], 4) if row[1] else 0.0,
+                    'prompt_tokens': int(row[4]),
+                    'response_tokens': int(row[5]),
+                    'ttft_p50_ms': round(float(row[6]), 1) if row[6] is not None else None,
+                    'latency_p50_ms': round(float(row[7]), 1) if row[7] is not None else None,
+                    'latency_p95_ms': round(float(row[8]), 1) if row[8] is not None else None
+                }
+                for row in result.fetchall()
+            ]
+
+    except SQLAlchemyError as e:
+        logger.error("Error summarizing LLM call metrics: %s", e)
+        return []
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize recorded LLM call metrics")
+    parser.add_argument('--by', choices=list(SUMMARY_GROUPS), default='function')
+    parser.add_argument('--hours', type=int, default=24)
+    args = parser.parse_args()
+
+    print(f"{args.by:<40} {'calls':>7} {'cache':>7} {'errors':>7} {'in tok':>10} {'out tok':>10} "
+          f"{'ttft p50':>9} {'p50':>8} {'p95':>8}")
+    for row in get_call_summary(args.by, args.hours):
+        print(f"{str(row['group'])[:40]:<40} {row['calls']:>7} {row['cache_hit_rate']:>7.1%} "
+              f"{row['error_rate']:>7.1%} {row['prompt_tokens']:>10} {row['response_tokens']:>10} "
+              f"{row['ttft_p50_ms'] or 0:>8.0f}ms {row['latency_p50_ms'] or 0:>6.0f}ms "
+              f"{row['latency_p95_ms'] or 0:>6.0f}ms")
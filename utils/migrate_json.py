@@ -0,0 +1,506 @@
+import io
+import os
+import csv
+import json
+import time
+import logging
+import argparse
+from datetime import date, datetime
+from utils.database import (
+    USER_PREFERENCES_FILE, USER_REMINDERS_FILE, PORTFOLIO_DATA_FILE, file_lock
+)
+from utils.database_setup import get_database_connection, create_database_tables
+
+# Legacy file-based user store written by the original MVP
+USER_DATA_FILE = "user_data.json"
+
+MIGRATION_BATCH_SIZE = 5000
+READ_CHUNK_SIZE = 1 << 20
+NULL_MARKER = "\\N"
+
+_DELETED = object()
+
+logger = logging.getLogger(__name__)
+
+def iter_json_object(filename, chunk_size=READ_CHUNK_SIZE):
+    """Stream (key, value) pairs from a top-level JSON object without loading the whole file"""
+    decoder = json.JSONDecoder()
+    try:
+        f = open(filename, 'r')
+    except FileNotFoundError:
+        return
+
+    with f:
+        buf = ""
+        pos = 0
+        eof = False
+        state = 'start'
+        key = None
+
+        while True:
+            # Skip whitespace and separators
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+
+            if pos >= len(buf) and not eof:
+                chunk = f.read(chunk_size)
+                buf = buf[pos:] + chunk
+                pos = 0
+                eof = not chunk
+                continue
+
+            if pos >= len(buf):
+                return
+
+            if state == 'start':
+                if buf[pos] != '{':
+                    raise ValueError(f"{filename} does not contain a JSON object")
+                pos += 1
+                state = 'key'
+                continue
+
+            if state == 'key' and buf[pos] == '}':
+                return
+
+            if state == 'colon':
+                if buf[pos] != ':':
+                    raise ValueError(f"Malformed JSON in {filename} near offset {pos}")
+                pos += 1
+                state = 'value'
+                continue
+
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # A value ending exactly at the buffer end may be a truncated number
+                if end == len(buf) and not eof:
+                    raise json.JSONDecodeError("Need more data", buf, end)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(chunk_size)
+                buf = buf[pos:] + chunk
+                pos = 0
+                eof = not chunk
+                continue
+
+            pos = end
+            if state == 'key':
+                key = value
+                state = 'colon'
+            else:
+                yield key, value
+                state = 'key'
+
+def read_change_log(filename):
+    """Collapse a store's change log to the final value (or deletion) per key"""
+    changes = {}
+    try:
+        with open(f"{filename}.log", 'rb') as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if 'd' in record:
+                    changes[record['k']] = _DELETED
+                elif 'k' in record:
+                    changes[record['k']] = record['v']
+    except FileNotFoundError:
+        pass
+    return changes
+
+def iter_store_records(filename):
+    """Stream the current (key, value) records of a JSON store, snapshot plus change log"""
+    changes = read_change_log(filename)
+    for key, value in iter_json_object(filename):
+        if key not in changes:
+            yield key, value
+    for key, value in changes.items():
+        if value is not _DELETED:
+            yield key, value
+
+def _text(value):
+    if value is None or value == "":
+        return None
+    return str(value)
+
+def _number(value):
+    try:
+        return None if value in (None, "") else str(float(value))
+    except (TypeError, ValueError):
+        return None
+
+def _integer(value):
+    try:
+        return None if value in (None, "") else str(int(value))
+    except (TypeError, ValueError):
+        return None
+
+def _boolean(value):
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        return 'true' if value.strip().lower() in ('true', 'yes', '1') else 'false'
+    return 'true' if value else 'false'
+
+def _date(value):
+    try:
+        return date.fromisoformat(str(value)[:10]).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+def _timestamp(value):
+    try:
+        return datetime.fromisoformat(str(value)).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+def _text_array(values):
+    if not values:
+        return "{}"
+    if isinstance(values, str):
+        values = [values]
+    escaped = [str(v).replace('\\', '\\\\').replace('"', '\\"') for v in values]
+    return "{" + ",".join(f'"{v}"' for v in escaped) + "}"
+
+def user_rows(username, user):
+    if user.get('email') and user.get('password_hash'):
+        yield (username, user['email'], user['password_hash'],
+               _timestamp(user.get('created_date')), _timestamp(user.get('last_login')))
+
+def preference_rows(username, prefs):
+    # The JSON store keeps notification flags at the top level, the SQL API nests them
+    notifications = prefs.get('notifications', {})
+
+    def flag(name):
+        return _boolean(notifications.get(name, prefs.get(name)))
+
+    yield (
+        username, _text(prefs.get('risk_tolerance')), _text(prefs.get('investment_timeline')),
+        _text_array(prefs.get('investment_goals')), _number(prefs.get('monthly_investment')),
+        _text_array(prefs.get('preferred_assets')), _text_array(prefs.get('sector_preferences')),
+        _text_array(prefs.get('geographic_preferences')), _boolean(prefs.get('esg_important')),
+        flag('email_notifications'), flag('portfolio_alerts'), flag('market_news'),
+        flag('reminder_notifications'), flag('ai_insights'), flag('weekly_reports'),
+        _text(prefs.get('financial_goals')), _integer(prefs.get('age')),
+        _number(prefs.get('annual_income')), _integer(prefs.get('dependents')),
+        _number(prefs.get('debt_amount')), _timestamp(prefs.get('updated_date'))
+    )
+
+def reminder_rows(username, reminders):
+    for reminder in reminders or []:
+        reminder_date = _date(reminder.get('date'))
+        if not reminder.get('title') or not reminder_date:
+            continue
+        yield (
+            username, str(reminder['title']), _text(reminder.get('type')),
+            _text(reminder.get('description')), reminder_date, _text(reminder.get('priority')),
+            _boolean(reminder.get('is_recurring', reminder.get('recurring'))),
+            _text(reminder.get('frequency')), _text(reminder.get('status')),
+            _timestamp(reminder.get('created_date'))
+        )
+
+def holding_rows(username, portfolio):
+    for holding in (portfolio or {}).get('holdings', []):
+        shares = _number(holding.get('shares'))
+        if not holding.get('symbol') or shares is None:
+            continue
+        yield (
+            username, str(holding['symbol']), _text(holding.get('company_name', holding.get('company'))),
+            shares, _number(holding.get('purchase_price')), _date(holding.get('purchase_date')),
+            _number(holding.get('current_price')), _number(holding.get('market_value', holding.get('value'))),
+            _text(holding.get('sector')), _text(holding.get('asset_type')),
+            _timestamp(holding.get('added_date'))
+        )
+
+def transaction_rows(username, portfolio):
+    for transaction in (portfolio or {}).get('transactions', []):
+        shares = _number(transaction.get('shares'))
+        price = _number(transaction.get('price'))
+        if not transaction.get('symbol') or shares is None or price is None:
+            continue
+        total = _number(transaction.get('total_amount')) or str(float(shares) * float(price))
+        yield (
+            username, str(transaction['symbol']),
+            str(transaction.get('transaction_type', transaction.get('type', 'BUY'))).upper(),
+            shares, price, total, _number(transaction.get('fees')),
+            _timestamp(transaction.get('date', transaction.get('transaction_date'))),
+            _text(transaction.get('notes'))
+        )
+
+# name, source file, row builder, staging columns, INSERT ... SELECT from the staging table.
+# NOT EXISTS only sees rows from earlier batches, so DISTINCT ON drops repeats within a batch.
+MIGRATIONS = [
+    (
+        'users', USER_DATA_FILE, user_rows,
+        ['username', 'email', 'password_hash', 'created_date', 'last_login'],
+        """
+            INSERT INTO users (username, email, password_hash, created_date, last_login)
+            SELECT s.username, s.email, s.password_hash,
+                   COALESCE(s.created_date::timestamp, CURRENT_TIMESTAMP), s.last_login::timestamp
+            FROM staging_users s
+            ON CONFLICT DO NOTHING
+        """
+    ),
+    (
+        'user_preferences', USER_PREFERENCES_FILE, preference_rows,
+        ['username', 'risk_tolerance', 'investment_timeline', 'investment_goals', 'monthly_investment',
+         'preferred_assets', 'sector_preferences', 'geographic_preferences', 'esg_important',
+         'email_notifications', 'portfolio_alerts', 'market_news', 'reminder_notifications',
+         'ai_insights', 'weekly_reports', 'financial_goals', 'age', 'annual_income', 'dependents',
+         'debt_amount', 'updated_date'],
+        """
+            INSERT INTO user_preferences (
+                user_id, risk_tolerance, investment_timeline, investment_goals, monthly_investment,
+                preferred_assets, sector_preferences, geographic_preferences, esg_important,
+                email_notifications, portfolio_alerts, market_news, reminder_notifications,
+                ai_insights, weekly_reports, financial_goals, age, annual_income, dependents,
+                debt_amount, updated_date
+            )
+            SELECT DISTINCT ON (s.username)
+                   u.id, s.risk_tolerance, s.investment_timeline, s.investment_goals::text[],
+                   s.monthly_investment::numeric, s.preferred_assets::text[], s.sector_preferences::text[],
+                   s.geographic_preferences::text[], COALESCE(s.esg_important::boolean, FALSE),
+                   COALESCE(s.email_notifications::boolean, TRUE), COALESCE(s.portfolio_alerts::boolean, TRUE),
+                   COALESCE(s.market_news::boolean, TRUE), COALESCE(s.reminder_notifications::boolean, TRUE),
+                   COALESCE(s.ai_insights::boolean, TRUE), COALESCE(s.weekly_reports::boolean, FALSE),
+                   s.financial_goals, s.age::integer, s.annual_income::numeric,
+                   COALESCE(s.dependents::integer, 0), COALESCE(s.debt_amount::numeric, 0),
+                   COALESCE(s.updated_date::timestamp, CURRENT_TIMESTAMP)
+            FROM staging_user_preferences s
+            JOIN users u ON u.username = s.username
+            WHERE NOT EXISTS (SELECT 1 FROM user_preferences p WHERE p.user_id = u.id)
+            ORDER BY s.username
+        """
+    ),
+    (
+        'reminders', USER_REMINDERS_FILE, reminder_rows,
+        ['username', 'title', 'reminder_type', 'description', 'reminder_date', 'priority',
+         'is_recurring', 'frequency', 'status', 'created_date'],
+        """
+            INSERT INTO reminders (
+                user_id, title, reminder_type, description, reminder_date, priority,
+                is_recurring, frequency, status, created_date
+            )
+            SELECT DISTINCT ON (s.username, s.title, s.reminder_date, s.created_date)
+                   u.id, s.title, s.reminder_type, s.description, s.reminder_date::date,
+                   COALESCE(s.priority, 'Medium'), COALESCE(s.is_recurring::boolean, FALSE),
+                   s.frequency, COALESCE(s.status, 'Active'),
+                   COALESCE(s.created_date::timestamp, CURRENT_TIMESTAMP)
+            FROM staging_reminders s
+            JOIN users u ON u.username = s.username
+            WHERE NOT EXISTS (
+                SELECT 1 FROM reminders r
+                WHERE r.user_id = u.id AND r.title = s.title
+                AND r.reminder_date = s.reminder_date::date
+                AND (s.created_date IS NULL OR r.created_date = s.created_date::timestamp)
+            )
+            ORDER BY s.username, s.title, s.reminder_date, s.created_date
+        """
+    ),
+    (
+        'portfolio_holdings', PORTFOLIO_DATA_FILE, holding_rows,
+        ['username', 'symbol', 'company_name', 'shares', 'purchase_price', 'purchase_date',
+         'current_price', 'market_value', 'sector', 'asset_type', 'created_date'],
+        """
+            INSERT INTO portfolio_holdings (
+                user_id, symbol, company_name, shares, purchase_price, purchase_date,
+                current_price, market_value, sector, asset_type, created_date
+            )
+            SELECT DISTINCT ON (s.username, s.symbol, s.created_date)
+                   u.id, s.symbol, s.company_name, s.shares::numeric, s.purchase_price::numeric,
+                   s.purchase_date::date, s.current_price::numeric, s.market_value::numeric,
+                   s.sector, s.asset_type, COALESCE(s.created_date::timestamp, CURRENT_TIMESTAMP)
+            FROM staging_portfolio_holdings s
+            JOIN users u ON u.username = s.username
+            WHERE NOT EXISTS (
+                SELECT 1 FROM portfolio_holdings h
+                WHERE h.user_id = u.id AND h.symbol = s.symbol
+                AND (s.created_date IS NULL OR h.created_date = s.created_date::timestamp)
+            )
+            ORDER BY s.username, s.symbol, s.created_date
+        """
+    ),
+    (
+        'transactions', PORTFOLIO_DATA_FILE, transaction_rows,
+        ['username', 'symbol', 'transaction_type', 'shares', 'price', 'total_amount', 'fees',
+         'transaction_date', 'notes'],
+        """
+            INSERT INTO transactions (
+                user_id, symbol, transaction_type, shares, price, total_amount, fees,
+                transaction_date, notes
+            )
+            SELECT DISTINCT ON (s.username, s.symbol, s.transaction_type, s.transaction_date)
+                   u.id, s.symbol, s.transaction_type, s.shares::numeric, s.price::numeric,
+                   s.total_amount::numeric, COALESCE(s.fees::numeric, 0),
+                   COALESCE(s.transaction_date::timestamp, CURRENT_TIMESTAMP), s.notes
+            FROM staging_transactions s
+            JOIN users u ON u.username = s.username
+            WHERE NOT EXISTS (
+                SELECT 1 FROM transactions t
+                WHERE t.user_id = u.id AND t.symbol = s.symbol
+                AND t.transaction_type = s.transaction_type
+                AND (s.transaction_date IS NULL OR t.transaction_date = s.transaction_date::timestamp)
+            )
+            ORDER BY s.username, s.symbol, s.transaction_type, s.transaction_date
+        """
+    ),
+]
+
+def _copy_rows(cursor, table, columns, rows):
+    """COPY a batch of rows into a staging table"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerows([NULL_MARKER if v is None else v for v in row] for row in rows)
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{NULL_MARKER}')",
+        buffer
+    )
+
+def _get_checkpoint(cursor, name):
+    """(last key migrated, completed) for a source, or (None, False) if it has not started"""
+    cursor.execute("SELECT last_key, completed FROM json_migration_checkpoints WHERE source = %s", (name,))
+    row = cursor.fetchone()
+    return (row[0], row[1]) if row else (None, False)
+
+def _save_checkpoint(cursor, name, records_done, last_key, rows_loaded, completed=False):
+    cursor.execute(
+        """
+            INSERT INTO json_migration_checkpoints (
+                source, records_done, last_key, rows_loaded, completed, updated_date
+            )
+            VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (source) DO UPDATE SET
+                records_done = EXCLUDED.records_done,
+                last_key = EXCLUDED.last_key,
+                rows_loaded = json_migration_checkpoints.rows_loaded + EXCLUDED.rows_loaded,
+                completed = EXCLUDED.completed,
+                updated_date = CURRENT_TIMESTAMP
+        """,
+        (name, records_done, last_key, rows_loaded, completed)
+    )
+
+def _snapshot_path(filename, name):
+    return f"{filename}.{name}.migration"
+
+def freeze_source(filename, name):
+    """Copy a store's current records to a JSON-lines snapshot the migration reads from.
+
+    Appends and compactions reorder the live store between runs; the frozen copy
+    keeps the record order fixed until the source finishes, so a resumed run can
+    find the last migrated key.
+    """
+    path = _snapshot_path(filename, name)
+    with file_lock(filename, exclusive=False):
+        with open(f"{path}.tmp", 'w') as f:
+            for key, value in iter_store_records(filename):
+                f.write(json.dumps([key, value]) + "\n")
+    os.replace(f"{path}.tmp", path)
+    return path
+
+def iter_snapshot(path):
+    with open(path) as f:
+        for line in f:
+            key, value = json.loads(line)
+            yield key, value
+
+def migrate_source(raw_conn, name, filename, build_rows, columns, insert_sql,
+                   batch_size=MIGRATION_BATCH_SIZE, restart=False):
+    """Stream one JSON source into its table in COPY batches, checkpointing after each"""
+    staging = f"staging_{name}"
+    stats = {'source': name, 'records': 0, 'rows_read': 0, 'rows_inserted': 0, 'batches': 0, 'seconds': 0.0}
+    started = time.perf_counter()
+
+    with raw_conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {staging} ({', '.join(c + ' TEXT' for c in columns)}) "
+            "ON COMMIT DELETE ROWS"
+        )
+        last_key, completed = (None, False) if restart else _get_checkpoint(cursor, name)
+        raw_conn.commit()
+
+        # Resume only within the snapshot the checkpoint refers to; otherwise start a fresh one
+        snapshot = _snapshot_path(filename, name)
+        if completed or last_key is None or not os.path.exists(snapshot):
+            snapshot = freeze_source(filename, name)
+            last_key = None
+
+        def flush(batch, records_done, key, completed=False):
+            if batch:
+                _copy_rows(cursor, staging, columns, batch)
+                cursor.execute(insert_sql)
+                stats['rows_inserted'] += max(cursor.rowcount, 0)
+                stats['batches'] += 1
+            _save_checkpoint(cursor, name, records_done, key, len(batch), completed)
+            # Data and checkpoint commit together, so a crash resumes at the last batch
+            raw_conn.commit()
+
+        batch = []
+        position = 0
+        resuming = last_key is not None
+        for key, value in iter_snapshot(snapshot):
+            position += 1
+            if resuming:
+                # Everything up to and including the checkpointed key is already loaded
+                resuming = key != last_key
+                continue
+            stats['records'] += 1
+            last_key = key
+            for row in build_rows(key, value):
+                batch.append(row)
+            if len(batch) >= batch_size:
+                stats['rows_read'] += len(batch)
+                flush(batch, position, last_key)
+                batch = []
+        stats['rows_read'] += len(batch)
+        flush(batch, position, last_key, completed=True)
+    os.remove(snapshot)
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+def migrate_json_to_postgres(batch_size=MIGRATION_BATCH_SIZE, sources=None, restart=False):
+    """Migrate the legacy JSON stores into the Postgres tables"""
+    engine = get_database_connection()
+    if not engine or not create_database_tables():
+        return []
+
+    raw_conn = engine.raw_connection()
+    report = []
+    try:
+        for name, filename, build_rows, columns, insert_sql in MIGRATIONS:
+            if sources and name not in sources:
+                continue
+            stats = migrate_source(raw_conn, name, filename, build_rows, columns, insert_sql,
+                                   batch_size=batch_size, restart=restart)
+            report.append(stats)
+            logger.info("Migrated %s", format_stats(stats))
+    finally:
+        raw_conn.close()
+    return report
+
+def format_stats(stats):
+    rate = stats['rows_read'] / stats['seconds'] if stats['seconds'] else 0
+    return (f"{stats['source']:<20} {stats['records']:>8} records {stats['rows_read']:>10} rows read "
+            f"{stats['rows_inserted']:>10} inserted {stats['batches']:>5} batches "
+            f"{stats['seconds']:>8.2f}s {rate:>10.0f} rows/s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk-load the JSON stores into Postgres with COPY")
+    parser.add_argument('--batch-size', type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument('--only', nargs='+', choices=[m[0] for m in MIGRATIONS],
+                        help="migrate only these sources")
+    parser.add_argument('--restart', action='store_true',
+                        help="ignore saved checkpoints and rescan every source")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    report = migrate_json_to_postgres(args.batch_size, args.only, args.restart)
+    if report:
+        total_rows = sum(s['rows_read'] for s in report)
+        total_seconds = sum(s['seconds'] for s in report)
+        print(f"{'total':<20} {total_rows:>10} rows in {total_seconds:.2f}s "
+              f"({total_rows / total_seconds if total_seconds else 0:.0f} rows/s)")
@@ -0,0 +1,414 @@
+import os
+import time
+import queue
+import logging
+import smtplib
+import argparse
+import threading
+import socketserver
+from itertools import groupby
+from email.message import EmailMessage
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from utils.database_setup import get_database_connection
+
+# SMTP configuration - defaults point at the local sink started with `--sink`
+SMTP_HOST = os.environ.get('SMTP_HOST', 'localhost')
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '8025'))
+SMTP_USER = os.environ.get('SMTP_USER')
+SMTP_PASSWORD = os.environ.get('SMTP_PASSWORD')
+SMTP_USE_TLS = os.environ.get('SMTP_USE_TLS', 'false').lower() == 'true'
+NOTIFICATION_SENDER = os.environ.get('NOTIFICATION_SENDER', 'FinAssist <reminders@finassist.local>')
+
+# Users per dispatch batch; each batch carries all of its users' due reminders
+DISPATCH_BATCH_SIZE = 500
+SMTP_POOL_SIZE = 4
+MAX_SEND_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 0.5
+MAX_DELIVERY_ATTEMPTS = 5
+
+# Errors that will not go away by retrying the same message
+PERMANENT_SMTP_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused)
+
+logger = logging.getLogger(__name__)
+
+class SMTPConnectionPool:
+    """Fixed-size pool of reusable SMTP connections"""
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, size=SMTP_POOL_SIZE,
+                 username=SMTP_USER, password=SMTP_PASSWORD, use_tls=SMTP_USE_TLS, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        """Open and authenticate a new SMTP connection"""
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            conn.starttls()
+        if self.username:
+            conn.login(self.username, self.password)
+        return conn
+
+    def acquire(self):
+        """Take an idle connection, or open one if the pool is not full"""
+        self._slots.acquire()
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return self._connect()
+            except Exception:
+                self._slots.release()
+                raise
+        # Idle connections may have been dropped by the server
+        try:
+            if conn.noop()[0] == 250:
+                return conn
+        except smtplib.SMTPException:
+            pass
+        except OSError:
+            pass
+        self._close(conn)
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn, discard=False):
+        """Return a connection to the pool, or close it if it is broken"""
+        if discard:
+            self._close(conn)
+        else:
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                self._close(conn)
+        self._slots.release()
+
+    def send(self, message, retries=MAX_SEND_RETRIES, backoff=RETRY_BACKOFF_SECONDS):
+        """Send a message with exponential backoff, returning (sent, attempts, error)"""
+        error = None
+        for attempt in range(1, retries + 1):
+            try:
+                conn = self.acquire()
+            except (smtplib.SMTPException, OSError) as e:
+                error = e
+            else:
+                try:
+                    conn.send_message(message)
+                    self.release(conn)
+                    return True, attempt, None
+                except PERMANENT_SMTP_ERRORS as e:
+                    # Reset the envelope so the connection can be reused
+                    try:
+                        conn.rset()
+                        self.release(conn)
+                    except (smtplib.SMTPException, OSError):
+                        self.release(conn, discard=True)
+                    return False, attempt, e
+                except (smtplib.SMTPException, OSError) as e:
+                    self.release(conn, discard=True)
+                    error = e
+            if attempt < retries:
+                time.sleep(backoff * (2 ** (attempt - 1)))
+        return False, retries, error
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.close()
+
+def fetch_due_reminders(conn, batch_size=DISPATCH_BATCH_SIZE, after_user_id=0):
+    """Fetch every due, undelivered reminder of the next `batch_size` opted-in users"""
+    result = conn.execute(
+        text("""
+            WITH due AS (
+                SELECT r.id, r.user_id, u.username, u.email, r.title, r.reminder_type,
+                       r.description, r.reminder_date, r.priority
+                FROM reminders r
+                JOIN users u ON u.id = r.user_id
+                LEFT JOIN user_preferences p ON p.user_id = r.user_id
+                WHERE r.status = 'Active'
+                AND r.reminder_date <= CURRENT_DATE
+                AND u.is_active = TRUE
+                AND COALESCE(p.reminder_notifications, TRUE)
+                AND COALESCE(p.email_notifications, TRUE)
+                AND r.user_id > :after_user_id
+                AND NOT EXISTS (
+                    SELECT 1 FROM reminder_deliveries d
+                    WHERE d.reminder_id = r.id
+                    AND d.reminder_date = r.reminder_date
+                    AND (d.status = 'Sent' OR d.attempts >= :max_attempts)
+                )
+            ),
+            batch_users AS (
+                SELECT DISTINCT user_id FROM due
+                ORDER BY user_id
+                LIMIT :batch_size
+            )
+            SELECT due.id, due.user_id, due.username, due.email, due.title, due.reminder_type,
+                   due.description, due.reminder_date, due.priority
+            FROM due
+            JOIN batch_users ON batch_users.user_id = due.user_id
+            ORDER BY due.user_id, due.id
+        """),
+        {
+            "after_user_id": after_user_id,
+            "max_attempts": MAX_DELIVERY_ATTEMPTS,
+            "batch_size": batch_size
+        }
+    )
+
+    reminders = []
+    for row in result.fetchall():
+        reminders.append({
+            'id': row[0],
+            'user_id': row[1],
+            'username': row[2],
+            'email': row[3],
+            'title': row[4],
+            'type': row[5],
+            'description': row[6],
+            'date': row[7],
+            'priority': row[8]
+        })
+    return reminders
+
+def build_digest(username, email, reminders, sender=NOTIFICATION_SENDER):
+    """Build one digest email covering all of a user's due reminders"""
+    message = EmailMessage()
+    count = len(reminders)
+    message['Subject'] = f"You have {count} financial reminder{'s' if count != 1 else ''} due"
+    message['From'] = sender
+    message['To'] = email
+
+    lines = [f"Hi {username},", "", "The following reminders are due:", ""]
+    for reminder in reminders:
+        lines.append(f"- {reminder['title']} ({reminder['type'] or 'Reminder'}, "
+                     f"{reminder['priority'] or 'Medium'} priority) - {reminder['date']}")
+        if reminder['description']:
+            lines.append(f"  {reminder['description']}")
+    lines += ["", "You can manage your reminders in FinAssist.",
+              "To stop these emails, turn off reminder notifications in your preferences."]
+    message.set_content("\n".join(lines))
+    return message
+
+def record_deliveries(conn, deliveries):
+    """Record the outcome of each reminder delivery attempt"""
+    if not deliveries:
+        return
+    conn.execute(
+        text("""
+            INSERT INTO reminder_deliveries (
+                reminder_id, user_id, reminder_date, status, attempts, last_error, sent_date
+            ) VALUES (
+                :reminder_id, :user_id, :reminder_date, :status, :attempts, :last_error,
+                CASE WHEN :status = 'Sent' THEN CURRENT_TIMESTAMP END
+            )
+            ON CONFLICT (reminder_id, reminder_date) DO UPDATE SET
+                status = EXCLUDED.status,
+                attempts = reminder_deliveries.attempts + EXCLUDED.attempts,
+                last_error = EXCLUDED.last_error,
+                sent_date = EXCLUDED.sent_date,
+                updated_date = CURRENT_TIMESTAMP
+        """),
+        deliveries
+    )
+
+def dispatch_due_reminders(pool=None, batch_size=DISPATCH_BATCH_SIZE):
+    """Send one digest per user for all due reminders, `batch_size` users at a time"""
+    engine = get_database_connection()
+    if not engine:
+        return {}
+
+    own_pool = pool is None
+    if own_pool:
+        pool = SMTPConnectionPool()
+
+    stats = {'reminders': 0, 'digests': 0, 'sent': 0, 'failed': 0, 'seconds': 0.0}
+    started = time.perf_counter()
+    after_user_id = 0
+
+    try:
+        with ThreadPoolExecutor(max_workers=pool.size) as executor:
+            while True:
+                # Batches split between users, never inside one, so each user gets a single digest
+                with engine.connect() as conn:
+                    reminders = fetch_due_reminders(conn, batch_size, after_user_id)
+                if not reminders:
+                    break
+                after_user_id = reminders[-1]['user_id']
+
+                groups = [list(group) for _, group in groupby(reminders, key=lambda r: r['user_id'])]
+                messages = [build_digest(group[0]['username'], group[0]['email'], group) for group in groups]
+                outcomes = executor.map(pool.send, messages)
+
+                deliveries = []
+                for group, (sent, attempts, error) in zip(groups, outcomes):
+                    stats['digests'] += 1
+                    stats['sent' if sent else 'failed'] += 1
+                    if error:
+                        logger.warning("Reminder digest to %s failed: %s", group[0]['username'], error)
+                    for reminder in group:
+                        deliveries.append({
+                            'reminder_id': reminder['id'],
+                            'user_id': reminder['user_id'],
+                            'reminder_date': reminder['date'],
+                            'status': 'Sent' if sent else 'Failed',
+                            'attempts': attempts,
+                            'last_error': str(error) if error else None
+                        })
+                stats['reminders'] += len(deliveries)
+
+                with engine.connect() as conn:
+                    record_deliveries(conn, deliveries)
+                    conn.commit()
+
+    except SQLAlchemyError as e:
+        logger.error("Error dispatching reminders: %s", e)
+    finally:
+        if own_pool:
+            pool.close()
+
+    stats['seconds'] = round(time.perf_counter() - started, 3)
+    return stats
+
+def run_dispatcher(interval=60, stop_event=None, batch_size=DISPATCH_BATCH_SIZE):
+    """Dispatch due reminders every `interval` seconds until stopped"""
+    stop_event = stop_event or threading.Event()
+    pool = SMTPConnectionPool()
+    try:
+        while not stop_event.is_set():
+            stats = dispatch_due_reminders(pool, batch_size)
+            if stats.get('digests'):
+                logger.info("Reminder dispatch: %s", stats)
+            stop_event.wait(interval)
+    finally:
+        pool.close()
+
+def start_background_dispatcher(interval=60, batch_size=DISPATCH_BATCH_SIZE):
+    """Start the dispatcher in a daemon thread and return its stop event"""
+    stop_event = threading.Event()
+    thread = threading.Thread(
+        target=run_dispatcher,
+        args=(interval, stop_event, batch_size),
+        name="reminder-dispatcher",
+        daemon=True
+    )
+    thread.start()
+    return stop_event
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP server conversation that accepts every message"""
+
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        self.reply("220 finassist-sink ESMTP ready")
+        envelope = {'from': None, 'to': []}
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode('utf-8', 'replace').strip()
+            verb = command[:4].upper()
+
+            if verb == 'EHLO':
+                self.reply("250-finassist-sink")
+                self.reply("250-8BITMIME")
+                self.reply("250 SMTPUTF8")
+            elif verb == 'HELO':
+                self.reply("250 finassist-sink")
+            elif verb == 'MAIL':
+                envelope = {'from': command.partition(':')[2].strip(), 'to': []}
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                envelope['to'].append(command.partition(':')[2].strip())
+                self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                self.server.deliver(envelope['from'], envelope['to'], b"".join(lines))
+                envelope = {'from': None, 'to': []}
+                self.reply("250 OK queued")
+            elif verb in ('RSET', 'NOOP'):
+                envelope = {'from': None, 'to': []} if verb == 'RSET' else envelope
+                self.reply("250 OK")
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+class LocalSMTPSink(socketserver.ThreadingTCPServer):
+    """Local SMTP stand-in that keeps messages in memory for testing"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host='localhost', port=SMTP_PORT):
+        super().__init__((host, port), _SinkHandler)
+        self.messages = []
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def deliver(self, sender, recipients, data):
+        with self._lock:
+            self.messages.append({'from': sender, 'to': recipients, 'data': data})
+
+    def start(self):
+        """Serve in a daemon thread and return the bound port"""
+        threading.Thread(target=self.serve_forever, name="smtp-sink", daemon=True).start()
+        return self.server_address[1]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send due reminder digests by email")
+    parser.add_argument('--sink', action='store_true', help="run the local SMTP sink instead of dispatching")
+    parser.add_argument('--once', action='store_true', help="dispatch a single pass and exit")
+    parser.add_argument('--interval', type=int, default=60, help="seconds between dispatch passes")
+    parser.add_argument('--batch-size', type=int, default=DISPATCH_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.sink:
+        sink = LocalSMTPSink(port=SMTP_PORT)
+        logger.info("SMTP sink listening on localhost:%s", SMTP_PORT)
+        try:
+            sink.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("Received %s messages over %s connections", len(sink.messages), sink.connections)
+    elif args.once:
+        print(dispatch_due_reminders(batch_size=args.batch_size))
+    else:
+        run_dispatcher(args.interval, batch_size=args.batch_size)
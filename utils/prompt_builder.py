@@ -0,0 +1,330 @@
+import os
+import math
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from utils.database_setup import get_database_connection
+from utils.auth import get_user_id
+
+# Total prompt size we aim for, and how much of it recent turns may take
+PROMPT_TOKEN_BUDGET = int(os.environ.get('PROMPT_TOKEN_BUDGET', '4000'))
+HISTORY_TOKEN_BUDGET = int(os.environ.get('HISTORY_TOKEN_BUDGET', '1500'))
+SUMMARY_TOKEN_BUDGET = 300
+REFERENCE_TOKEN_BUDGET = int(os.environ.get('REFERENCE_TOKEN_BUDGET', '600'))
+
+# Unsummarized turns fetched per prompt; anything older is folded into the summary
+MAX_RECENT_MESSAGES = 40
+
+# Fold older turns into the summary once this many are waiting outside the window
+SUMMARY_TRIGGER_MESSAGES = 6
+
+# How long a conversation's compacted context is reused before it is reloaded
+CONTEXT_CACHE_SECONDS = float(os.environ.get('CONTEXT_CACHE_SECONDS', '300'))
+CONTEXT_CACHE_MAX_SESSIONS = 1000
+
+logger = logging.getLogger(__name__)
+
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+def count_tokens(text_value):
+    """Estimate the token count of a piece of text (about four characters per token)"""
+    return math.ceil(len(text_value or "") / 4)
+
+def truncate_to_tokens(text_value, max_tokens):
+    """Cut text down to roughly max_tokens"""
+    max_chars = max_tokens * 4
+    if len(text_value) <= max_chars:
+        return text_value
+    return text_value[:max_chars].rsplit(" ", 1)[0] + " ..."
+
+def get_conversation_summary(user_id, session_id=None):
+    """Get the rolling summary and the last message id it covers"""
+    engine = get_database_connection()
+    if not engine:
+        return "", 0
+
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(
+                text("""
+                    SELECT summary, summarized_through_id
+                    FROM ai_chat_summaries
+                    WHERE user_id = :user_id AND session_key = :session_key
+                """),
+                {"user_id": user_id, "session_key": session_id or ""}
+            )
+            row = result.fetchone()
+            return (row[0] or "", row[1] or 0) if row else ("", 0)
+
+    except SQLAlchemyError as e:
+        logger.warning("Error loading conversation summary: %s", e)
+        return "", 0
+
+def get_unsummarized_messages(user_id, session_id=None, after_id=0, limit=MAX_RECENT_MESSAGES):
+    """Most recent messages newer than the summary, oldest first"""
+    engine = get_database_connection()
+    if not engine:
+        return []
+
+    session_clause = "session_id = :session_id" if session_id else "session_id IS NULL"
+    try:
+        with engine.connect() as conn:
+            result = conn.execute(
+                text(f"""
+                    SELECT id, message_role, message_content
+                    FROM ai_chat_history
+                    WHERE user_id = :user_id
+                    AND {session_clause}
+                    AND id > :after_id
+                    ORDER BY timestamp DESC, id DESC
+                    LIMIT :limit
+                """),
+                {"user_id": user_id, "session_id": session_id, "after_id": after_id, "limit": limit}
+            )
+            rows = result.fetchall()
+            return [{'id': r[0], 'role': r[1], 'content': r[2]} for r in reversed(rows)]
+
+    except SQLAlchemyError as e:
+        logger.warning("Error loading recent messages: %s", e)
+        return []
+
+class SessionContextCache:
+    """Per-conversation summary and unsummarized turns, kept up to date as messages are saved.
+
+    Each (user, session) entry is loaded from the database once and then
+    appended to, so switching between chat sessions does not reload or
+    repack full histories. Entries expire after CONTEXT_CACHE_SECONDS to pick
+    up writes from other processes.
+    """
+
+    def __init__(self, ttl=CONTEXT_CACHE_SECONDS, max_sessions=CONTEXT_CACHE_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, session_id=None):
+        """(summary, summarized_through_id, messages) for a conversation, loading it if needed"""
+        key = (user_id, session_id or "")
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry['loaded'] < self.ttl:
+                self._entries.move_to_end(key)
+                return entry['summary'], entry['through_id'], list(entry['messages'])
+
+        summary, through_id = get_conversation_summary(user_id, session_id)
+        messages = get_unsummarized_messages(user_id, session_id, through_id)
+        with self._lock:
+            self._entries[key] = {
+                'summary': summary,
+                'through_id': through_id,
+                'messages': messages,
+                'loaded': time.monotonic()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+        return summary, through_id, list(messages)
+
+    def append(self, user_id, session_id, message):
+        """Add a just-saved message (with its id) to a cached conversation"""
+        with self._lock:
+            entry = self._entries.get((user_id, session_id or ""))
+            if entry is not None:
+                entry['messages'].append(message)
+                del entry['messages'][:-MAX_RECENT_MESSAGES]
+
+    def set_summary(self, user_id, session_id, summary, through_id):
+        """Record a new rolling summary and drop the turns it now covers"""
+        with self._lock:
+            entry = self._entries.get((user_id, session_id or ""))
+            if entry is not None and through_id > entry['through_id']:
+                entry['summary'] = summary
+                entry['through_id'] = through_id
+                entry['messages'] = [m for m in entry['messages'] if m['id'] > through_id]
+
+    def invalidate(self, user_id, session_id=None):
+        with self._lock:
+            self._entries.pop((user_id, session_id or ""), None)
+
+_context_cache = SessionContextCache()
+
+def get_context_cache():
+    """Get the process-wide conversation context cache"""
+    return _context_cache
+
+def pack_recent_turns(messages, budget):
+    """Split messages into (packed, overflow): the newest that fit the budget, and the rest"""
+    packed = []
+    used = 0
+    for index in range(len(messages) - 1, -1, -1):
+        cost = count_tokens(messages[index]['content']) + 2
+        if used + cost > budget:
+            return messages[:index + 1], packed
+        packed.insert(0, messages[index])
+        used += cost
+    return [], packed
+
+def format_turns(messages):
+    lines = []
+    for msg in messages:
+        speaker = "User" if msg['role'] == "user" else "Assistant"
+        lines.append(f"{speaker}: {msg['content']}")
+    return "\n".join(lines)
+
+def has_conversation_history(username, user_query, session_id=None):
+    """Whether an answer would depend on earlier turns: a summary, or messages before this question"""
+    user_id = get_user_id(username)
+    if not user_id:
+        return False
+
+    summary, _, messages = _context_cache.get(user_id, session_id)
+    if messages and messages[-1]['role'] == "user" and messages[-1]['content'] == user_query:
+        messages = messages[:-1]
+    return bool(summary or messages)
+
+def build_chat_prompt(username, system_message, user_query, session_id=None, summarize=None, reference=None):
+    """Build a prompt that stays within the token budget however long the conversation is.
+
+    Recent turns are packed newest-first into HISTORY_TOKEN_BUDGET; older turns
+    are represented by the persisted rolling summary. When enough turns have
+    fallen out of the window, ``summarize(previous_summary, messages)`` is run
+    in the background to fold them into the summary for the next prompt.
+    Retrieved ``reference`` passages are capped at REFERENCE_TOKEN_BUDGET.
+    """
+    prompt = system_message
+    if reference:
+        prompt += f"\n\nReference material (quote it when relevant):\n{truncate_to_tokens(reference, REFERENCE_TOKEN_BUDGET)}"
+    user_id = get_user_id(username)
+
+    if user_id:
+        summary, summarized_through_id, messages = _context_cache.get(user_id, session_id)
+
+        # The current question has already been saved; it goes in separately below
+        if messages and messages[-1]['role'] == "user" and messages[-1]['content'] == user_query:
+            messages = messages[:-1]
+
+        query_tokens = count_tokens(prompt) + count_tokens(user_query)
+        history_budget = max(0, min(HISTORY_TOKEN_BUDGET, PROMPT_TOKEN_BUDGET - query_tokens - SUMMARY_TOKEN_BUDGET))
+        overflow, recent = pack_recent_turns(messages, history_budget)
+
+        if summary:
+            prompt += f"\n\nSummary of the earlier conversation:\n{truncate_to_tokens(summary, SUMMARY_TOKEN_BUDGET)}"
+        if recent:
+            prompt += f"\n\nRecent conversation:\n{format_turns(recent)}"
+
+        if summarize and overflow and (len(overflow) >= SUMMARY_TRIGGER_MESSAGES or len(messages) >= MAX_RECENT_MESSAGES):
+            schedule_summary_update(user_id, session_id, overflow[-1]['id'], summarize)
+
+    return f"{prompt}\n\nUser Question: {user_query}"
+
+def _summary_chunk(messages, budget=HISTORY_TOKEN_BUDGET):
+    """The oldest messages that fit the token budget (at least one, cut down if it alone is too long)"""
+    chunk = []
+    used = 0
+    for message in messages:
+        tokens = count_tokens(message['content'])
+        if chunk and used + tokens > budget:
+            break
+        if tokens > budget:
+            message = {**message, 'content': truncate_to_tokens(message['content'], budget)}
+            tokens = budget
+        chunk.append(message)
+        used += tokens
+    return chunk
+
+def update_conversation_summary(user_id, session_id, through_id, summarize):
+    """Fold messages up to through_id into the stored summary.
+
+    Messages are folded in chunks of at most MAX_RECENT_MESSAGES and
+    HISTORY_TOKEN_BUDGET tokens, so a long conversation that has never been
+    summarized is caught up over several bounded model calls instead of one.
+    """
+    summary, summarized_through_id = get_conversation_summary(user_id, session_id)
+
+    engine = get_database_connection()
+    if not engine:
+        return summary
+
+    session_clause = "session_id = :session_id" if session_id else "session_id IS NULL"
+    while summarized_through_id < through_id:
+        try:
+            with engine.connect() as conn:
+                result = conn.execute(
+                    text(f"""
+                        SELECT id, message_role, message_content
+                        FROM ai_chat_history
+                        WHERE user_id = :user_id
+                        AND {session_clause}
+                        AND id > :after_id AND id <= :through_id
+                        ORDER BY id ASC
+                        LIMIT :limit
+                    """),
+                    {"user_id": user_id, "session_id": session_id, "after_id": summarized_through_id,
+                     "through_id": through_id, "limit": MAX_RECENT_MESSAGES}
+                )
+                messages = _summary_chunk([{'id': r[0], 'role': r[1], 'content': r[2]} for r in result.fetchall()])
+        except SQLAlchemyError as e:
+            logger.warning("Error loading messages to summarize: %s", e)
+            return summary
+
+        if not messages:
+            return summary
+
+        # The model call runs with no pooled connection checked out
+        new_summary = summarize(summary, messages)
+        if not new_summary:
+            return summary
+
+        try:
+            with engine.connect() as conn:
+                stored = conn.execute(
+                    text("""
+                        INSERT INTO ai_chat_summaries (user_id, session_key, summary, summarized_through_id)
+                        VALUES (:user_id, :session_key, :summary, :through_id)
+                        ON CONFLICT (user_id, session_key) DO UPDATE SET
+                            summary = EXCLUDED.summary,
+                            summarized_through_id = EXCLUDED.summarized_through_id,
+                            updated_date = CURRENT_TIMESTAMP
+                        WHERE ai_chat_summaries.summarized_through_id < EXCLUDED.summarized_through_id
+                    """),
+                    {"user_id": user_id, "session_key": session_id or "",
+                     "summary": new_summary, "through_id": messages[-1]['id']}
+                ).rowcount
+                conn.commit()
+        except SQLAlchemyError as e:
+            logger.warning("Error updating conversation summary: %s", e)
+            return summary
+
+        if not stored:
+            # Another process summarized further in the meantime; its summary stands
+            return get_conversation_summary(user_id, session_id)[0]
+
+        summary, summarized_through_id = new_summary, messages[-1]['id']
+        _context_cache.set_summary(user_id, session_id, summary, summarized_through_id)
+    return summary
+
+def _update_in_background(key, user_id, session_id, through_id, summarize):
+    try:
+        update_conversation_summary(user_id, session_id, through_id, summarize)
+    except Exception as e:
+        logger.warning("Conversation summary update failed: %s", e)
+    finally:
+        with _summarizing_lock:
+            _summarizing.discard(key)
+
+def schedule_summary_update(user_id, session_id, through_id, summarize):
+    """Queue a summary update unless one is already running for the conversation"""
+    key = (user_id, session_id or "")
+    with _summarizing_lock:
+        if key in _summarizing:
+            return False
+        _summarizing.add(key)
+    _summary_executor.submit(_update_in_background, key, user_id, session_id, through_id, summarize)
+    return True
@@ -0,0 +1,233 @@
+import os
+import copy
+import time
+import threading
+from datetime import datetime, date, timedelta
+from utils import database, user_preferences, reminders
+
+# Which store backs preferences and reminders: 'sql' (Postgres) or 'json' (utils/database.py)
+DATA_BACKEND = os.environ.get('DATA_BACKEND', 'sql' if os.environ.get('DATABASE_URL') else 'json')
+
+# Seconds a cached read stays valid; writes through the repository invalidate immediately
+REPOSITORY_CACHE_TTL = int(os.environ.get('REPOSITORY_CACHE_TTL', '60'))
+
+NOTIFICATION_FIELDS = {
+    'email_notifications': True,
+    'portfolio_alerts': True,
+    'market_news': True,
+    'reminder_notifications': True,
+    'ai_insights': True,
+    'weekly_reports': False
+}
+
+def normalize_preferences(preferences):
+    """Expose notification flags both flat and under 'notifications'"""
+    preferences = dict(preferences or {})
+    if not preferences:
+        return preferences
+    notifications = dict(preferences.get('notifications') or {})
+    for field, default in NOTIFICATION_FIELDS.items():
+        value = notifications.get(field, preferences.get(field, default))
+        notifications[field] = value
+        preferences[field] = value
+    preferences['notifications'] = notifications
+    return preferences
+
+def normalize_reminder(reminder):
+    """Expose the recurring flag under both names used by the stores"""
+    reminder = dict(reminder)
+    recurring = reminder.get('is_recurring', reminder.get('recurring', False))
+    reminder['is_recurring'] = recurring
+    reminder['recurring'] = recurring
+    reminder.setdefault('status', 'Active')
+    return reminder
+
+class JsonBackend:
+    """Preferences and reminders in the JSON files of utils/database.py"""
+
+    name = 'json'
+
+    def get_preferences(self, username):
+        return database.get_user_preferences(username)
+
+    def save_preferences(self, username, preferences):
+        return database.save_user_preferences(username, preferences)
+
+    def get_reminders(self, username):
+        return [r for r in database.get_user_reminders(username) if r.get('status', 'Active') == 'Active']
+
+    def add_reminder(self, username, reminder_data):
+        return database.save_reminder(username, reminder_data)
+
+    def delete_reminder(self, username, reminder_id):
+        return database.delete_reminder(username, reminder_id)
+
+    def complete_reminder(self, username, reminder_id):
+        return database.update_reminder(username, reminder_id, {
+            'status': 'Completed',
+            'completed_date': datetime.now().isoformat()
+        })
+
+class SqlBackend:
+    """Preferences and reminders in the Postgres tables"""
+
+    name = 'sql'
+
+    def get_preferences(self, username):
+        return user_preferences.get_user_preferences(username)
+
+    def save_preferences(self, username, preferences):
+        return user_preferences.save_user_preferences(username, preferences)
+
+    def get_reminders(self, username):
+        return reminders.get_user_reminders(username)
+
+    def add_reminder(self, username, reminder_data):
+        return reminders.add_reminder(username, reminder_data)
+
+    def delete_reminder(self, username, reminder_id):
+        return reminders.delete_reminder(username, reminder_id)
+
+    def complete_reminder(self, username, reminder_id):
+        return reminders.complete_reminder(username, reminder_id)
+
+BACKENDS = {
+    'json': JsonBackend,
+    'sql': SqlBackend
+}
+
+class Repository:
+    """Single entry point for preferences and reminders with a shared read cache.
+
+    Every page reads and writes through here, so a write always invalidates the
+    cached copy other sessions in this process would read next. Call counts and
+    backend time per operation are kept in ``stats`` for instrumentation.
+    """
+
+    def __init__(self, backend, ttl=REPOSITORY_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._cache = {}
+        # Bumped by every invalidation, so a read that started before a write cannot cache its stale result
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.stats = {}
+
+    def _record(self, operation, seconds=0.0, hit=False):
+        with self._lock:
+            entry = self.stats.setdefault(operation, {'calls': 0, 'hits': 0, 'backend_seconds': 0.0})
+            entry['calls'] += 1
+            entry['hits'] += 1 if hit else 0
+            entry['backend_seconds'] += seconds
+
+    def _cached(self, kind, username, loader):
+        key = (kind, username)
+        with self._lock:
+            cached = self._cache.get(key)
+            generation = self._generations.setdefault(key, 0)
+        if cached and cached[0] > time.monotonic():
+            self._record(kind, hit=True)
+            return copy.deepcopy(cached[1])
+
+        started = time.perf_counter()
+        value = loader(username)
+        self._record(kind, time.perf_counter() - started)
+        # Backends return {} or [] when a read fails as well as when there is no data, so empty
+        # results are not kept; the next read retries instead of serving the failure for the TTL
+        if value:
+            with self._lock:
+                if self._generations.get(key) == generation:
+                    self._cache[key] = (time.monotonic() + self.ttl, value)
+        return copy.deepcopy(value)
+
+    def _write(self, operation, kind, username, writer, *args):
+        started = time.perf_counter()
+        try:
+            return writer(username, *args)
+        finally:
+            self._record(operation, time.perf_counter() - started)
+            self.invalidate(username, kind)
+
+    def invalidate(self, username, kind=None):
+        """Drop cached reads for a user (all kinds if kind is None)"""
+        with self._lock:
+            for key in list(self._generations):
+                if key[1] == username and (kind is None or key[0] == kind):
+                    self._generations[key] += 1
+                    self._cache.pop(key, None)
+
+    def get_user_preferences(self, username):
+        return self._cached('preferences', username,
+                            lambda u: normalize_preferences(self.backend.get_preferences(u)))
+
+    def save_user_preferences(self, username, preferences):
+        return self._write('save_preferences', 'preferences', username,
+                           self.backend.save_preferences, normalize_preferences(preferences))
+
+    def get_user_reminders(self, username):
+        return self._cached('reminders', username,
+                            lambda u: [normalize_reminder(r) for r in self.backend.get_reminders(u)])
+
+    def add_reminder(self, username, reminder_data):
+        return self._write('add_reminder', 'reminders', username,
+                           self.backend.add_reminder, normalize_reminder(reminder_data))
+
+    def delete_reminder(self, username, reminder_id):
+        return self._write('delete_reminder', 'reminders', username,
+                           self.backend.delete_reminder, reminder_id)
+
+    def complete_reminder(self, username, reminder_id):
+        return self._write('complete_reminder', 'reminders', username,
+                           self.backend.complete_reminder, reminder_id)
+
+    def get_upcoming_reminders(self, username, days_ahead=7):
+        today = date.today()
+        horizon = today + timedelta(days=days_ahead)
+        upcoming = []
+        for reminder in self.get_user_reminders(username):
+            try:
+                reminder_date = date.fromisoformat(str(reminder.get('date'))[:10])
+            except ValueError:
+                continue
+            if today <= reminder_date <= horizon:
+                upcoming.append(reminder)
+        return sorted(upcoming, key=lambda r: r['date'])
+
+_repository = None
+_repository_lock = threading.Lock()
+
+def get_repository():
+    """Get the process-wide repository for the configured backend"""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = Repository(BACKENDS[DATA_BACKEND]())
+        return _repository
+
+def get_user_preferences(username):
+    """Get user preferences"""
+    return get_repository().get_user_preferences(username)
+
+def save_user_preferences(username, preferences):
+    """Save user preferences"""
+    return get_repository().save_user_preferences(username, preferences)
+
+def get_user_reminders(username):
+    """Get the user's active reminders"""
+    return get_repository().get_user_reminders(username)
+
+def add_reminder(username, reminder_data):
+    """Add a new reminder"""
+    return get_repository().add_reminder(username, reminder_data)
+
+def delete_reminder(username, reminder_id):
+    """Delete a reminder"""
+    return get_repository().delete_reminder(username, reminder_id)
+
+def complete_reminder(username, reminder_id):
+    """Mark a reminder as completed"""
+    return get_repository().complete_reminder(username, reminder_id)
+
+def get_upcoming_reminders(username, days_ahead=7):
+    """Get active reminders due within the next days_ahead days"""
+    return get_repository().get_upcoming_reminders(username, days_ahead)
@@ -0,0 +1,339 @@
+import os
+import re
+import time
+import zlib
+import argparse
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from utils.database_setup import get_database_connection
+from utils.ai_cache import AI_CACHE_TTL_SECONDS
+
+# Cosine similarity above which a past answer is reused; calibrated on CALIBRATION_PAIRS
+# (python -m utils.semantic_cache), halfway between the lowest paraphrase and highest distinct
+# pair, and checked against the held-out pairs in tests/test_semantic_cache.py
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.72'))
+
+EMBEDDING_DIMENSIONS = 1024
+MAX_ENTRIES_PER_CONTEXT = 256
+MAX_CONTEXTS = 5000
+
+# Words that carry no meaning for matching financial questions
+STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'am', 'be', 'i', 'me', 'my', 'mine', 'we', 'our', 'you', 'your',
+    'do', 'does', 'did', 'should', 'would', 'could', 'can', 'will', 'to', 'of', 'in', 'on', 'for',
+    'it', 'this', 'that', 'what', 'how', 'please', 'tell', 'about', 'any', 'some', 'there', 'now',
+    'need', 'better', 'explain', 'which', 'ways', 'way', 'big', 'much', 'current'
+}
+
+# Words that flip a question's meaning; questions must agree on them to share an answer
+NEGATIONS = {'not', 'no', 'never', 'cannot', 'without', 'avoid', 'stop'}
+
+# Words that say which way to act, mapped to the direction they ask for; "buy gold" and
+# "sell gold" read alike but need opposite answers, so questions must agree on these too
+ACTIONS = {
+    'buy': 'buy', 'purchase': 'buy', 'acquire': 'buy',
+    'sell': 'sell', 'dump': 'sell', 'liquidate': 'sell', 'trim': 'sell',
+    'increase': 'increase', 'raise': 'increase', 'boost': 'increase', 'add': 'increase',
+    'reduce': 'reduce', 'decrease': 'reduce', 'lower': 'reduce', 'cut': 'reduce', 'minimize': 'reduce',
+    'more': 'more', 'less': 'less', 'fewer': 'less',
+    'into': 'into', 'out': 'out'
+}
+
+# Upper-case words that are common abbreviations rather than ticker symbols
+ACRONYMS = {'AI', 'APR', 'APY', 'CD', 'EMI', 'ESG', 'ETF', 'FD', 'GDP', 'HSA', 'IPO', 'IRA', 'NPS', 'PPF',
+            'REIT', 'ROI', 'SIP', 'USD'}
+
+# Words most questions contain; they count for less than the words that tell questions apart
+GENERIC_WORDS = {'portfolio', 'stock', 'invest', 'market', 'fund'}
+GENERIC_WEIGHT = 0.35
+
+# Common ways of saying the same thing in a financial question
+SYNONYMS = {
+    'rebalance': 'balance', 'rebalancing': 'balance', 'balanced': 'balance', 'allocation': 'balance',
+    'lower': 'reduce', 'decrease': 'reduce', 'minimize': 'reduce', 'cut': 'reduce',
+    'doing': 'perform', 'performing': 'perform', 'performance': 'perform', 'returns': 'perform',
+    'technology': 'tech', 'shares': 'stock', 'stocks': 'stock', 'equities': 'stock', 'equity': 'stock',
+    'risky': 'risk', 'risks': 'risk', 'holdings': 'portfolio', 'investments': 'portfolio',
+    'investment': 'invest', 'investing': 'invest', 'strategies': 'strategy', 'appropriate': 'right',
+    'taxes': 'tax', 'sips': 'sip', 'dividends': 'dividend'
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\d+)*")
+_TICKER_RE = re.compile(r"\$?\b([A-Z]{1,5})\b")
+_CONTRACTIONS = [(re.compile(r"\bcan['’]t\b"), "cannot"), (re.compile(r"\bwon['’]t\b"), "will not"),
+                 (re.compile(r"n['’]t\b"), " not")]
+
+def _words(question):
+    question = (question or "").lower()
+    for pattern, replacement in _CONTRACTIONS:
+        question = pattern.sub(replacement, question)
+    return _TOKEN_RE.findall(question)
+
+def _normalize_word(word):
+    word = SYNONYMS.get(word, word)
+    for suffix in ('ing', 'ed', 'es', 's'):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return SYNONYMS.get(word[:-len(suffix)], word[:-len(suffix)])
+    return word
+
+def question_guard(question):
+    """Numbers, negations, action directions and tickers in a question; answers are only
+    shared when these match exactly.
+
+    Similar wording cannot tell "retire at 30" from "retire at 50", "invest"
+    from "not invest", "buy gold" from "sell gold" or "AAPL" from "AAPL or MSFT",
+    so these are compared exactly instead of by similarity.
+    """
+    words = _words(question)
+    numbers = sorted(n.replace(",", "") for n in _NUMBER_RE.findall(question or ""))
+    negations = sorted(w for w in words if w in NEGATIONS)
+    actions = sorted({ACTIONS[w] for w in words if w in ACTIONS})
+    tickers = sorted({t for t in _TICKER_RE.findall(question or "") if t != 'I' and t not in ACRONYMS})
+    return "/".join("|".join(part) for part in (numbers, negations, actions, tickers))
+
+def _features(question):
+    """Word unigrams, word bigrams and in-word character n-grams"""
+    words = [_normalize_word(w) for w in _words(question) if w not in STOPWORDS]
+    for word in words:
+        scale = GENERIC_WEIGHT if word in GENERIC_WORDS else 1.0
+        yield f"w:{word}", scale
+        padded = f"<{word}>"
+        for n in (3, 4, 5):
+            for i in range(len(padded) - n + 1):
+                yield f"c:{padded[i:i + n]}", 0.5 * scale
+    for first, second in zip(words, words[1:]):
+        yield f"b:{first} {second}", 0.75
+
+def embed_question(question, dimensions=EMBEDDING_DIMENSIONS):
+    """Embed a question with a signed hashing vectorizer (offline, no model files)"""
+    vector = np.zeros(dimensions, dtype=np.float32)
+    for feature, weight in _features(question):
+        h = zlib.crc32(feature.encode())
+        vector[h % dimensions] += weight if (h >> 31) & 1 else -weight
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+class _ContextIndex:
+    """Question vectors and answers that share one context fingerprint"""
+
+    def __init__(self, dimensions):
+        self.vectors = np.zeros((8, dimensions), dtype=np.float32)
+        self.answers = []
+        self.guards = []
+        self.expires = []
+
+    def _keep(self, keep):
+        kept = [i for i in range(len(self.answers)) if keep[i]]
+        self.vectors[:len(kept)] = self.vectors[kept]
+        self.answers = [self.answers[i] for i in kept]
+        self.guards = [self.guards[i] for i in kept]
+        self.expires = [self.expires[i] for i in kept]
+
+    def add(self, vector, guard, answer, expires_at):
+        now = time.monotonic()
+        if any(expires <= now for expires in self.expires):
+            self._keep([expires > now for expires in self.expires])
+        if len(self.answers) >= MAX_ENTRIES_PER_CONTEXT:
+            # Drop the oldest entry
+            self._keep([False] + [True] * (len(self.answers) - 1))
+        elif len(self.answers) == len(self.vectors):
+            self.vectors = np.vstack([self.vectors, np.zeros_like(self.vectors)])
+        self.vectors[len(self.answers)] = vector
+        self.answers.append(answer)
+        self.guards.append(guard)
+        self.expires.append(expires_at)
+
+    def search(self, vector, guard):
+        now = time.monotonic()
+        candidates = [i for i in range(len(self.answers)) if self.guards[i] == guard and self.expires[i] > now]
+        if not candidates:
+            return None, 0.0
+        scores = self.vectors[candidates] @ vector
+        best = int(np.argmax(scores))
+        return self.answers[candidates[best]], float(scores[best])
+
+class SemanticCache:
+    """In-memory nearest-neighbour cache of answers, partitioned by context fingerprint"""
+
+    def __init__(self, function_name, threshold=SEMANTIC_CACHE_THRESHOLD,
+                 dimensions=EMBEDDING_DIMENSIONS, max_contexts=MAX_CONTEXTS, ttl_seconds=AI_CACHE_TTL_SECONDS):
+        self.function_name = function_name
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.dimensions = dimensions
+        self.max_contexts = max_contexts
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _context(self, fingerprint):
+        """Get the index for a fingerprint, warming it from the response cache table"""
+        with self._lock:
+            index = self._contexts.get(fingerprint)
+            if index is not None:
+                self._contexts.move_to_end(fingerprint)
+                return index
+
+        index = _ContextIndex(self.dimensions)
+        now = time.monotonic()
+        for question, answer, remaining_seconds in self._load_recent(fingerprint):
+            index.add(embed_question(question, self.dimensions), question_guard(question), answer,
+                      now + float(remaining_seconds))
+
+        with self._lock:
+            index = self._contexts.setdefault(fingerprint, index)
+            self._contexts.move_to_end(fingerprint)
+            while len(self._contexts) > self.max_contexts:
+                self._contexts.popitem(last=False)
+        return index
+
+    def _load_recent(self, fingerprint):
+        engine = get_database_connection()
+        if not engine:
+            return []
+
+        try:
+            with engine.connect() as conn:
+                result = conn.execute(
+                    text("""
+                        SELECT normalized_query, response,
+                               EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP)
+                        FROM ai_response_cache
+                        WHERE function_name = :function_name
+                        AND context_fingerprint = :fingerprint
+                        AND expires_at > CURRENT_TIMESTAMP
+                        ORDER BY last_accessed DESC
+                        LIMIT :limit
+                    """),
+                    {
+                        "function_name": self.function_name,
+                        "fingerprint": fingerprint,
+                        "limit": MAX_ENTRIES_PER_CONTEXT
+                    }
+                )
+                return list(reversed(result.fetchall()))
+
+        except SQLAlchemyError:
+            return []
+
+    def lookup(self, question, fingerprint, threshold=None):
+        """Return (answer, similarity) of the closest past question, or (None, similarity)"""
+        threshold = self.threshold if threshold is None else threshold
+        index = self._context(fingerprint)
+        vector = embed_question(question, self.dimensions)
+        with self._lock:
+            answer, similarity = index.search(vector, question_guard(question))
+            if answer is not None and similarity >= threshold:
+                self.hits += 1
+                return answer, similarity
+            self.misses += 1
+            return None, similarity
+
+    def add(self, question, fingerprint, answer):
+        """Remember an answer for future near-duplicate questions, for as long as the exact cache keeps it"""
+        index = self._context(fingerprint)
+        vector = embed_question(question, self.dimensions)
+        with self._lock:
+            index.add(vector, question_guard(question), answer, time.monotonic() + self.ttl_seconds)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'contexts': len(self._contexts)
+        }
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def get_semantic_cache(function_name):
+    """Get the process-wide semantic cache for an AI function"""
+    with _caches_lock:
+        if function_name not in _caches:
+            _caches[function_name] = SemanticCache(function_name)
+        return _caches[function_name]
+
+# Labeled question pairs the threshold is calibrated on: (question, question, same answer applies)
+CALIBRATION_PAIRS = [
+    # Paraphrases: the same answer applies
+    ('Should I rebalance?', 'Is my portfolio balanced?', True),
+    ('Should I rebalance my portfolio?', 'Do I need to rebalance my holdings?', True),
+    ('How is my portfolio performing?', 'How are my investments doing?', True),
+    ('What are the risks in my current holdings?', 'How risky is my portfolio?', True),
+    ('How can I reduce my portfolio risk?', 'How do I lower the risk of my portfolio?', True),
+    ('What are tax-efficient investment strategies?', 'What are tax efficient ways to invest?', True),
+    ('Suggest some dividend stocks', 'Can you suggest dividend stocks?', True),
+    ("What's the market outlook for tech stocks?", 'What is the outlook for technology stocks?', True),
+    ('What are the best SIPs this month?', 'Which SIPs are best this month?', True),
+    ('How much should I keep in an emergency fund?', 'How big should my emergency fund be?', True),
+    ('Should I pay off debt or invest?', 'Is it better to invest or pay off my debt?', True),
+    ('How do I diversify my portfolio?', 'How can I diversify my investments?', True),
+    ('Is my asset allocation right for my age?', 'Is my allocation appropriate for my age?', True),
+    ('What is dollar cost averaging?', 'Explain dollar-cost averaging', True),
+    ('How much should I save for retirement?', 'How much do I need to save for retirement?', True),
+    ('Am I too concentrated in tech?', 'Is my portfolio too concentrated in technology?', True),
+    # Different questions: must not share an answer
+    ('Should I invest in bonds?', 'Should I not invest in bonds?', False),
+    ('Should I buy more AAPL?', 'Should I not buy more AAPL?', False),
+    ('Can I retire at 30?', 'Can I retire at 50?', False),
+    ('Should I invest $500 a month?', 'Should I invest $5000 a month?', False),
+    ('Is a 5% return good?', 'Is a 10% return good?', False),
+    ('Should I sell TSLA?', 'Should I buy TSLA?', False),
+    ('Should I buy AAPL?', 'Should I buy MSFT?', False),
+    ('How is my portfolio performing?', 'How risky is my portfolio?', False),
+    ('Suggest some dividend stocks', 'Suggest some growth stocks', False),
+    ('What is a Roth IRA?', 'What is a traditional IRA?', False),
+    ('How do I reduce my taxes?', 'How do I reduce my debt?', False),
+    ('Should I rebalance my portfolio?', 'Should I diversify my portfolio?', False),
+    ('What are the best SIPs this month?', 'What are the best ETFs this month?', False),
+    ('How much should I keep in an emergency fund?', 'How much should I keep in bonds?', False),
+    ("What's the market outlook for tech stocks?", "What's the market outlook for energy stocks?", False),
+    ('Is my portfolio too risky?', 'Is my portfolio never too risky?', False),
+    ('What should I invest in?', 'What should I never invest in?', False),
+]
+
+def pair_similarity(first, second):
+    """Similarity of two questions as the cache sees it (None when their guards differ)"""
+    if question_guard(first) != question_guard(second):
+        return None
+    return float(embed_question(first) @ embed_question(second))
+
+def calibrate_threshold(pairs=CALIBRATION_PAIRS):
+    """Threshold that best separates paraphrases from distinct questions.
+
+    Returns (threshold, errors): the midpoint of the widest gap when the pairs
+    separate cleanly, otherwise the cut with fewest misclassified pairs.
+    """
+    scored = [(pair_similarity(a, b), same) for a, b, same in pairs]
+    scored = [(score, same) for score, same in scored if score is not None]
+    candidates = sorted({score for score, _ in scored} | {1.01})
+    best = None
+    for low, high in zip([0.0] + candidates, candidates):
+        cut = (low + high) / 2
+        errors = sum((score >= cut) != same for score, same in scored)
+        # Among equally good cuts prefer the one with most margin around it
+        margin = min((abs(score - cut) for score, _ in scored), default=0.0)
+        if best is None or (errors, -margin) < (best[1], -best[2]):
+            best = (cut, errors, margin)
+    return round(best[0], 3), best[1]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score the labeled question pairs and calibrate the similarity threshold")
+    parser.parse_args()
+
+    for first, second, same in CALIBRATION_PAIRS:
+        score = pair_similarity(first, second)
+        verdict = "guard" if score is None else ("hit" if score >= SEMANTIC_CACHE_THRESHOLD else "miss")
+        print(f"{'  -  ' if score is None else f'{score:.3f}'} {verdict:<5} {'same' if same else 'diff':<4} "
+              f"{first} | {second}")
+    threshold, errors = calibrate_threshold()
+    print(f"\ncalibrated threshold {threshold} ({errors} misclassified); configured {SEMANTIC_CACHE_THRESHOLD}")
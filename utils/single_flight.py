@@ -0,0 +1,113 @@
+import threading
+from concurrent.futures import Future, TimeoutError as FuturesTimeoutError
+
+class _SharedStream:
+    """Chunks produced by one streaming call, replayable by any number of readers"""
+
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self._condition = threading.Condition()
+
+    def append(self, item):
+        with self._condition:
+            self.items.append(item)
+            self._condition.notify_all()
+
+    def finish(self, error=None):
+        with self._condition:
+            self.done = True
+            self.error = error
+            self._condition.notify_all()
+
+    def read(self, timeout=None):
+        position = 0
+        while True:
+            with self._condition:
+                ready = self._condition.wait_for(lambda: len(self.items) > position or self.done, timeout)
+                if not ready:
+                    raise FuturesTimeoutError("timed out waiting for the shared stream")
+                new_items = self.items[position:]
+                done, error = self.done, self.error
+            for item in new_items:
+                yield item
+            position += len(new_items)
+            if done and position >= len(self.items):
+                if error is not None:
+                    raise error
+                return
+
+class SingleFlight:
+    """Collapse concurrent identical calls into one.
+
+    The first caller for a key runs the call; callers arriving while it is in
+    flight wait for it and get the same result or exception. Once it finishes
+    the key is released, so later callers start a fresh call. If a stream's
+    leading reader stops reading, followers get ``abandoned_error`` raised.
+    """
+
+    def __init__(self, abandoned_error=RuntimeError):
+        self.abandoned_error = abandoned_error
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'shared': 0}
+
+    def do(self, key, func, timeout=None):
+        """Run func() unless an identical call is in flight, then share its result"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+                self.stats['calls'] += 1
+            else:
+                self.stats['shared'] += 1
+
+        if not leader:
+            return future.result(timeout)
+
+        try:
+            result = func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def stream(self, key, func, timeout=None):
+        """Iterate func() unless an identical stream is in flight, then replay and follow it"""
+        with self._lock:
+            shared = self._streams.get(key)
+            leader = shared is None
+            if leader:
+                shared = _SharedStream()
+                self._streams[key] = shared
+                self.stats['calls'] += 1
+            else:
+                self.stats['shared'] += 1
+
+        if not leader:
+            yield from shared.read(timeout)
+            return
+
+        try:
+            for item in func():
+                shared.append(item)
+                yield item
+            shared.finish()
+        except GeneratorExit:
+            # The leading reader went away; waiting readers must not hang
+            shared.finish(self.abandoned_error("shared stream abandoned by its reader"))
+            raise
+        except BaseException as e:
+            shared.finish(e)
+            raise
+        finally:
+            with self._lock:
+                self._streams.pop(key, None)
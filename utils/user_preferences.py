@@ -42,12 +42,12 @@ def get_user_preferences(username):
                     'geographic_preferences': pref[6] or [],
                     'esg_important': pref[7] or False,
                     'notifications': {
-                        'email_notifications': pref[8] or True,
-                        'portfolio_alerts': pref[9] or True,
-                        'market_news': pref[10] or True,
-                        'reminder_notifications': pref[11] or True,
-                        'ai_insights': pref[12] or True,
-                        'weekly_reports': pref[13] or False
+                        'email_notifications': pref[8] if pref[8] is not None else True,
+                        'portfolio_alerts': pref[9] if pref[9] is not None else True,
+                        'market_news': pref[10] if pref[10] is not None else True,
+                        'reminder_notifications': pref[11] if pref[11] is not None else True,
+                        'ai_insights': pref[12] if pref[12] is not None else True,
+                        'weekly_reports': pref[13] if pref[13] is not None else False
                     },
                     'financial_goals': pref[14] or '',
                     'age': pref[15],